@@ -0,0 +1,100 @@
+"""
+Benchmark load and save times of the legacy JSON state file against the binary state format.
+
+Run from the repository root:
+
+    python -m benchmarks.state_format_bench [site counts...]
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+from bot.state_format import StateFile, write_state_file, update_state_file
+
+NUMBERS_PER_SITE = 20
+
+
+def make_state(site_count):
+    data = {}
+    for i in range(1, site_count + 1):
+        data[f"site_{i}"] = {
+            "last_number": 4915100000000 + i,
+            "latest_numbers": [f"+{4915100000000 + i * NUMBERS_PER_SITE + n}" for n in range(NUMBERS_PER_SITE)],
+            "button_updated": bool(i % 2)
+        }
+    data["_runtime"] = {"latest_notification": {"message_id": 1, "site_id": "site_1"}, "countdowns": {}, "repeat_interval": 900}
+    return data
+
+
+def timed(func, repeat=3):
+    """Best of several runs, in milliseconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench(site_count, directory):
+    data = make_state(site_count)
+    json_path = os.path.join(directory, f"state_{site_count}.json")
+    bin_path = os.path.join(directory, f"state_{site_count}.bin")
+    middle = f"site_{site_count // 2}"
+
+    def json_save():
+        with open(json_path, "w") as f:
+            json.dump(data, f)
+
+    def json_load():
+        with open(json_path) as f:
+            json.load(f)
+
+    def json_save_one():
+        # What save_website_data(site_id) did before: load everything, change one site, dump everything
+        with open(json_path) as f:
+            current = json.load(f)
+        current[middle] = data[middle]
+        with open(json_path, "w") as f:
+            json.dump(current, f)
+
+    def bin_save():
+        write_state_file(bin_path, data)
+
+    def bin_load():
+        with StateFile(bin_path) as state:
+            state.to_dict()
+
+    def bin_load_one():
+        with StateFile(bin_path) as state:
+            state.get(middle)
+
+    def bin_save_one():
+        update_state_file(bin_path, {middle: data[middle]})
+
+    results = {
+        "json save": timed(json_save),
+        "json load": timed(json_load),
+        "json save one site": timed(json_save_one),
+        "bin save": timed(bin_save),
+        "bin load all": timed(bin_load),
+        "bin load one site": timed(bin_load_one),
+        "bin save one site": timed(bin_save_one),
+    }
+    sizes = (os.path.getsize(json_path), os.path.getsize(bin_path))
+    return results, sizes
+
+
+def main(site_counts):
+    with tempfile.TemporaryDirectory() as directory:
+        for site_count in site_counts:
+            results, (json_size, bin_size) = bench(site_count, directory)
+            print(f"{site_count} sites (json {json_size / 1024:.0f} KiB, bin {bin_size / 1024:.0f} KiB)")
+            for name, ms in results.items():
+                print(f"  {name:<20} {ms:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -16,10 +16,10 @@ __all__ = [
     
     # Config constants
     'CHAT_ID', 'ENABLE_REPEAT_NOTIFICATION', 'DEFAULT_REPEAT_INTERVAL',
-    'TELEGRAM_BOT_TOKEN', 'load_website_configs',
+    'TELEGRAM_BOT_TOKEN', 'WEBHOOK_URL', 'WEBHOOK_HOST', 'METRICS_HOST', 'METRICS_PORT', 'TELEGRAM_API_URL', 'load_website_configs',
     
     # Storage
-    'storage', 'save_website_data', 'save_last_number', 'load_website_data',
+    'storage', 'save_website_data', 'save_last_number', 'save_runtime_state', 'load_website_data',
     
     # Utils
     'format_time', 'delete_message_after_delay', 'parse_website_content', 'fetch_url_content',
@@ -27,9 +27,20 @@ __all__ = [
     # Notifications
     'get_buttons', 'get_multiple_buttons', 'get_buttons_by_position',
     'add_countdown_to_latest_notification', 'update_message_with_countdown', 'send_notification',
+    'queue_notification', 'resume_countdowns', 'resume_outbox', 'resume_repeat_notifications',
     
     # Monitoring
-    'WebsiteMonitor', 'monitor_websites',
+    'WebsiteMonitor', 'monitor_websites', 'site_poller',
+    'status_board',
+    
+    # Sites
+    'site_registry',
+    
+    # Webhook
+    'start_webhook', 'create_webhook_app', 'ALLOWED_UPDATES',
+    
+    # Metrics
+    'count_api_calls', 'start_metrics_server',
     
     # Handlers
     'register_handlers', 'send_startup_message'
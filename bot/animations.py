@@ -0,0 +1,61 @@
+import asyncio
+from bot.outbound import edit_reply_markup, PRIORITY_COSMETIC
+
+
+class AnimationScheduler:
+    """
+    Runs cosmetic keyboard animations in the background, at most one per message.
+
+    Handlers commit their state change and answer the callback right away, then hand the frames to
+    play(). Starting another animation on the same message, or cancel(), stops the running one, so
+    repeated taps do not stack up edits.
+    """
+
+    def __init__(self):
+        self._tasks = {}  # (chat_id, message_id) -> task
+
+    def __len__(self):
+        return len(self._tasks)
+
+    @staticmethod
+    def _key(message):
+        return (message.chat.id, message.message_id)
+
+    def play(self, message, frames, finish=None):
+        """
+        Show each (reply_markup, seconds) frame in turn, then await finish() to apply the final state.
+
+        Returns the background task.
+        """
+        key = self._key(message)
+        self.cancel(message)
+        task = asyncio.create_task(self._run(message, frames, finish))
+        self._tasks[key] = task
+        task.add_done_callback(lambda done: self._tasks.pop(key, None) if self._tasks.get(key) is done else None)
+        return task
+
+    def cancel(self, message):
+        """Stop the animation running on a message, e.g. because a handler is replacing its keyboard"""
+        task = self._tasks.pop(self._key(message), None)
+        if task and not task.done():
+            task.cancel()
+
+    def is_animating(self, message):
+        return self._key(message) in self._tasks
+
+    async def _run(self, message, frames, finish):
+        try:
+            for reply_markup, seconds in frames:
+                try:
+                    await edit_reply_markup(message, reply_markup, PRIORITY_COSMETIC)
+                except Exception as e:
+                    # A lost frame is only cosmetic; the final state still gets applied
+                    print(f"Error during animation: {e}")
+                await asyncio.sleep(seconds)
+            if finish is not None:
+                await finish()
+        except Exception as e:
+            print(f"Error finishing animation: {e}")
+
+
+animation_scheduler = AnimationScheduler()
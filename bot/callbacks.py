@@ -0,0 +1,161 @@
+from bot.storage import storage
+from bot.sites import site_registry
+from bot.metrics import rename_current_handler
+
+# Bump when the payload layout changes; payloads of another version go through the legacy parser
+CALLBACK_VERSION = "v1"
+SEPARATOR = ":"
+
+# Action -> (wire code, field names). Codes are short because Telegram limits callback_data to 64 bytes.
+# Fields may only be appended; payloads without the newer trailing fields parse them as None.
+ACTIONS = {
+    "copy": ("cp", ("number", "site_id")),
+    "update": ("up", ("number", "site_id")),
+    "update_multi": ("um", ("site_id",)),
+    "settings": ("st", ("site_id",)),
+    "monitoring": ("mo", ("site_id", "page", "prefix")),
+    "toggle_site": ("ts", ("site_id", "page", "prefix", "origin")),
+    "toggle_repeat": ("tr", ("site_id",)),
+    "back": ("bk", ("site_id",)),
+    "split": ("sp", ("number", "site_id")),
+}
+ACTION_CODES = {code: action for action, (code, _) in ACTIONS.items()}
+
+# Fields holding a site, sent as its numeric short ID
+SITE_FIELDS = {"site_id", "origin"}
+
+# Prefixes of the callback data sent before the versioned format, most specific first
+LEGACY_PREFIXES = [
+    ("update_multi_", "update_multi"),
+    ("settings_monitoring_", "monitoring"),
+    ("back_to_main_", "back"),
+    ("toggle_site_", "toggle_site"),
+    ("toggle_repeat_", "toggle_repeat"),
+    ("settings_", "settings"),
+    ("update_", "update"),
+    ("split_", "split"),
+    ("number_", "split"),
+    ("copy_", "copy"),
+]
+
+
+def _encode(name, value):
+    if value is None:
+        return ""
+    if name in SITE_FIELDS:
+        # Sites travel as their numeric short ID
+        short_id = site_registry.short_id(value)
+        return str(short_id if short_id is not None else value)
+    return str(value)
+
+
+def _decode(name, value):
+    if not value:
+        return None
+    if name in SITE_FIELDS:
+        return site_registry.resolve(value)
+    return value
+
+
+def pack_callback(action, *values):
+    """Build the callback_data of a button: 'v1:<code>:<field>:...'"""
+    code, fields = ACTIONS[action]
+    if len(values) > len(fields):
+        raise ValueError(f"Callback {action} takes {len(fields)} fields, got {len(values)}")
+    # Empty trailing fields are left out; they parse as None
+    return SEPARATOR.join([CALLBACK_VERSION, code, *(_encode(name, value) for name, value in zip(fields, values))]).rstrip(SEPARATOR)
+
+
+def legacy_site_id(data):
+    """Find the site_id at the end of an old 'action_<number>_site_<n>' payload, or None"""
+    start = data.rfind("site_")
+    site_id = site_registry.resolve(data[start:]) if start >= 0 else None
+    if site_id is None and len(storage["websites"]) == 1:
+        # Payloads such as 'copy_number' name no site; with a single site it can only be that one
+        site_id = next(iter(storage["websites"]))
+    return site_id
+
+
+def keyboard_site_id(message):
+    """site_id named by a button of a message's keyboard, or None"""
+    markup = getattr(message, "reply_markup", None)
+    for row in (markup.inline_keyboard if markup else []):
+        for button in row:
+            parsed = parse_callback(button.callback_data)
+            if parsed and parsed[1].get("site_id"):
+                return parsed[1]["site_id"]
+    return None
+
+
+def parse_legacy_callback(data):
+    for prefix, action in LEGACY_PREFIXES:
+        if not data.startswith(prefix):
+            continue
+        fields = dict.fromkeys(ACTIONS[action][1])
+        fields["site_id"] = legacy_site_id(data)
+        if "number" in ACTIONS[action][1]:
+            rest = data[len(prefix):].split("_")
+            fields["number"] = rest[0] if rest[0].lstrip("+").isdigit() else None
+        return action, fields
+    return None
+
+
+def parse_callback(data):
+    """
+    Parse callback_data into (action, {field: value}), or None if it is not a known action.
+
+    Versioned payloads are decoded with one split and a table lookup; older payloads still on
+    messages sent before the upgrade fall back to prefix matching.
+    """
+    if not data:
+        return None
+    parts = data.split(SEPARATOR)
+    if parts[0] != CALLBACK_VERSION:
+        return parse_legacy_callback(data)
+    action = ACTION_CODES.get(parts[1]) if len(parts) > 1 else None
+    if action is None:
+        return None
+    names = ACTIONS[action][1]
+    values = parts[2:]
+    if len(values) > len(names):
+        return None
+    values += [""] * (len(names) - len(values))
+    return action, {name: _decode(name, value) for name, value in zip(names, values)}
+
+
+class CallbackRouter:
+    """
+    Single callback_query handler that dispatches through a table keyed by action.
+
+    Handlers are called as handler(callback_query, **fields) with the fields parsed from the payload.
+    """
+
+    def __init__(self):
+        self.handlers = {}
+
+    def register(self, action, handler):
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown callback action: {action}")
+        self.handlers[action] = handler
+
+    async def dispatch(self, callback_query):
+        parsed = parse_callback(callback_query.data)
+        if parsed is None:
+            # Placeholder buttons ("none") and unknown payloads
+            return
+        action, fields = parsed
+        handler = self.handlers.get(action)
+        if handler is None:
+            print(f"No handler for callback action: {action}")
+            return
+        rename_current_handler(handler.__name__)
+        if "site_id" in fields and not fields["site_id"]:
+            # Old copy and split buttons name no site; the update button of the same message does
+            fields["site_id"] = keyboard_site_id(callback_query.message)
+        if "site_id" in fields and not fields["site_id"]:
+            await callback_query.answer("Site ID missing or invalid. Please try again.")
+            return
+        await handler(callback_query, **fields)
+
+
+callback_router = CallbackRouter()
@@ -9,11 +9,57 @@ if os.path.exists(CONFIG_FILE):
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 CHAT_ID = os.getenv("CHAT_ID")
+# Chats and users allowed to run admin commands (/subscribe, /unsubscribe, /stats, /status pin), besides CHAT_ID
+ADMIN_IDS = {chat_id.strip() for chat_id in os.getenv("ADMIN_IDS", "").split(",") if chat_id.strip()}
 URL = os.getenv("URL")  # Can be a single URL or an array of URLs
 CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", 5))
 ENABLE_REPEAT_NOTIFICATION = os.getenv("ENABLE_REPEAT_NOTIFICATION",
                                        "False").lower() == "true"
 DEFAULT_REPEAT_INTERVAL = 900  # Default: 15 minutes
+COUNTDOWN_EDITS_PER_MINUTE = int(os.getenv("COUNTDOWN_EDITS_PER_MINUTE", 20))  # Shared budget for countdown edits
+FLAG_ASSET_DIR = os.getenv("FLAG_ASSET_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "flags"))  # Bundled <iso>.png flag images, read only
+FLAG_CACHE_DIR = os.getenv("FLAG_CACHE_DIR", "flag_cache")  # Flags downloaded from origin pages, next to the state file
+FLAG_MAX_BYTES = int(os.getenv("FLAG_MAX_BYTES", 256 * 1024))  # Larger flag downloads are discarded
+FLAG_FILE_ID_CACHE_SIZE = int(os.getenv("FLAG_FILE_ID_CACHE_SIZE", 500))  # Flag uploads remembered by Telegram file_id
+NOTIFICATION_COALESCE_WINDOW = float(os.getenv("NOTIFICATION_COALESCE_WINDOW", 2))  # Seconds to gather changes into one digest, 0 disables
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", 8))  # Chats a notification is delivered to at once
+OUTBOX_BASE_BACKOFF = float(os.getenv("OUTBOX_BASE_BACKOFF", 5))  # Seconds before the first retry of a failed notification
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", 300))  # Retry delay cap, doubling from the base
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))  # Failed attempts after which a notification is parked as a dead letter
+
+# Update delivery: long polling by default, or a webhook served from an embedded aiohttp app when WEBHOOK_URL is set
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Public HTTPS base URL Telegram posts updates to
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")  # Interface the web app listens on
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Expected X-Telegram-Bot-Api-Secret-Token; random per run if unset
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", 16))  # Updates processed at once
+CALLBACK_DEBOUNCE_WINDOW = float(os.getenv("CALLBACK_DEBOUNCE_WINDOW", 1.5))  # Seconds a repeated tap on the same button is dropped
+CHAT_HANDLER_CONCURRENCY = int(os.getenv("CHAT_HANDLER_CONCURRENCY", 2))  # Handlers running at once per chat
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))  # Serve /metrics on this port, 0 disables
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # Metrics label series by chat id, so they are served locally only by default
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # Bot API server, e.g. a local server or a test fake; default api.telegram.org
+MONITORING_PAGE_SIZE = int(os.getenv("MONITORING_PAGE_SIZE", 20))  # Sites per page of the monitoring settings menu
+REFRESH_TIMEOUT = float(os.getenv("REFRESH_TIMEOUT", 10))  # Seconds the Update button waits for a fresh fetch before using the last known numbers
+STATUS_DASHBOARD_INTERVAL = int(os.getenv("STATUS_DASHBOARD_INTERVAL", 60))  # Seconds between refreshes of pinned /status dashboards
+
+LATEST_NUMBERS_DEPTH = int(os.getenv("LATEST_NUMBERS_DEPTH", 20))  # Numbers kept per multiple type website
+
+# Outbound Telegram rate limits (Telegram allows about 30 messages/second overall and 20/minute in a group)
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", 25))  # Calls per second across all chats
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", 20))  # Calls per minute per group or channel
+OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", 5))  # Calls a group may burst above its rate
+OUTBOUND_PRIVATE_CHAT_RATE = float(os.getenv("OUTBOUND_PRIVATE_CHAT_RATE", 60))  # Calls per minute per private chat
+OUTBOUND_PRIVATE_CHAT_BURST = int(os.getenv("OUTBOUND_PRIVATE_CHAT_BURST", 10))  # Calls a private chat may burst above its rate
+OUTBOUND_MAX_IN_FLIGHT = int(os.getenv("OUTBOUND_MAX_IN_FLIGHT", 8))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", 3))  # Retries after a RetryAfter
+
+# Seen-number index used to suppress re-notifications of numbers the origin recycles
+SEEN_NUMBERS_RETENTION = int(os.getenv("SEEN_NUMBERS_RETENTION", 7 * 24 * 3600))  # Default: 7 days
+SEEN_NUMBERS_BUCKET = int(os.getenv("SEEN_NUMBERS_BUCKET", 3600))  # Default: 1 hour buckets
+SEEN_NUMBERS_MAX = int(os.getenv("SEEN_NUMBERS_MAX", 10000))  # Max numbers remembered per index
+SEEN_NUMBERS_GLOBAL = os.getenv("SEEN_NUMBERS_GLOBAL",
+                                "False").lower() == "true"
 
 
 # Function to parse array-formatted URL string
@@ -0,0 +1,188 @@
+import math
+import time
+import asyncio
+from bot.config import COUNTDOWN_EDITS_PER_MINUTE
+from bot.state_actor import state_actor
+from bot.outbound import edit_message_caption, PRIORITY_COSMETIC
+from bot.timers import TimerHeap
+
+# (remaining seconds above which it applies, step in seconds): minutes when far out, seconds near zero
+COUNTDOWN_GRANULARITY = [
+    (3600, 300),
+    (600, 60),
+    (120, 30),
+    (30, 10),
+    (0, 1)
+]
+
+
+def countdown_step(time_left):
+    """Get the display granularity for a remaining time"""
+    for threshold, step in COUNTDOWN_GRANULARITY:
+        if time_left > threshold:
+            return step
+    return 1
+
+
+def displayed_time_left(time_left):
+    """Round the remaining time up to the current granularity, so the caption only changes once per step"""
+    step = countdown_step(time_left)
+    return -(-time_left // step) * step
+
+
+class CountdownTicker:
+    """
+    One scheduler for every countdown, one countdown per (site_id, chat_id).
+
+    Countdowns sit on a timer heap keyed by the time their displayed value next changes, so a single
+    task wakes only when some caption actually needs an edit. Edits are skipped when the rendered
+    caption is unchanged and are spread over a shared budget of COUNTDOWN_EDITS_PER_MINUTE.
+    """
+
+    def __init__(self, edits_per_minute=COUNTDOWN_EDITS_PER_MINUTE, burst=3):
+        self._countdowns = {}  # (site_id, chat_id) -> countdown entry
+        self._timers = TimerHeap("countdown", self._fire)
+        self._watch_task = None
+        self._rate = edits_per_minute / 60
+        self._burst = burst
+        self._tokens = burst
+        self._refilled_at = time.monotonic()
+
+    def _keys(self, site_id, chat_id=None):
+        if chat_id is not None:
+            key = (site_id, str(chat_id))
+            return [key] if key in self._countdowns else []
+        return [key for key in self._countdowns if key[0] == site_id]
+
+    def is_active(self, site_id, chat_id=None):
+        """Whether a site has a countdown in a chat, or in any chat when chat_id is None"""
+        return bool(self._keys(site_id, chat_id))
+
+    def active_sites(self):
+        return list(dict.fromkeys(site_id for site_id, chat_id in self._countdowns))
+
+    def add(self, bot, site_id, chat_id, message_id, started_at, interval, render_caption, build_keyboard, on_finish=None):
+        """
+        Start (or replace) the countdown of a site in a chat.
+
+        render_caption(seconds_left) returns the caption to show and build_keyboard() the reply markup
+        sent with it; the keyboard is built once and rebuilt only after invalidate_keyboard().
+        """
+        key = (site_id, str(chat_id))
+        self._countdowns[key] = {
+            "bot": bot,
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "ends_at": started_at + interval,
+            "render_caption": render_caption,
+            "build_keyboard": build_keyboard,
+            "keyboard": None,
+            "last_caption": None,
+            "on_finish": on_finish
+        }
+        self._schedule(key, time.time())
+
+    def cancel(self, site_id, chat_id=None):
+        """Stop a site's countdown in a chat, or in every chat; the message keeps its last caption"""
+        keys = self._keys(site_id, chat_id)
+        for key in keys:
+            del self._countdowns[key]
+            self._timers.cancel(key)
+        return bool(keys)
+
+    def cancel_all(self):
+        self._countdowns.clear()
+        self._timers.clear()
+
+    def redraw(self, site_id, chat_id):
+        """Edit a countdown's message right away, e.g. after an animation replaced its caption or keyboard"""
+        key = (site_id, str(chat_id))
+        countdown = self._countdowns.get(key)
+        if countdown is None:
+            return False
+        countdown["keyboard"] = None
+        countdown["last_caption"] = None
+        self._schedule(key, time.time())
+        return True
+
+    def invalidate_keyboard(self, site_id):
+        """Rebuild the site's keyboards on their next edit, e.g. after the site's state changed"""
+        for key in self._keys(site_id):
+            self._countdowns[key]["keyboard"] = None
+
+    def _schedule(self, key, due):
+        self._timers.schedule(key, due)
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch_state_changes())
+
+    async def _watch_state_changes(self):
+        """Rebuild a countdown's keyboard after its website changed on the state actor"""
+        events = state_actor.subscribe()
+        try:
+            while True:
+                event = await events.get()
+                self.invalidate_keyboard(event["site_id"])
+        finally:
+            state_actor.unsubscribe(events)
+
+    def _take_edit_token(self):
+        """Take one edit from the budget; returns 0, or how many seconds to wait for the next token"""
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._refilled_at) * self._rate)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self._rate
+
+    async def _fire(self, key):
+        countdown = self._countdowns.get(key)
+        if countdown is None:
+            return
+        try:
+            await self._tick(key, countdown)
+        except Exception as e:
+            print(f"Error updating countdown for {key[0]} in {key[1]}: {e}")
+            if self._countdowns.get(key) is countdown:
+                del self._countdowns[key]
+
+    async def _tick(self, key, countdown):
+        now = time.time()
+        time_left = max(0, math.ceil(countdown["ends_at"] - now))
+        shown = displayed_time_left(time_left)
+        caption = countdown["render_caption"](shown)
+
+        if caption != countdown["last_caption"]:
+            wait = self._take_edit_token()
+            if wait > 0:
+                self._schedule(key, now + wait)
+                return
+
+            if countdown["keyboard"] is None:
+                countdown["keyboard"] = countdown["build_keyboard"]()
+            # Identical edits are dropped by the render cache; "message is not modified" is handled there too
+            await edit_message_caption(
+                countdown["bot"],
+                countdown["chat_id"],
+                countdown["message_id"],
+                caption,
+                reply_markup=countdown["keyboard"],
+                priority=PRIORITY_COSMETIC,
+                parse_mode="Markdown"
+            )
+            countdown["last_caption"] = caption
+
+        if self._countdowns.get(key) is not countdown:
+            # Replaced or cancelled while the edit was in flight
+            return
+        if time_left <= 0:
+            del self._countdowns[key]
+            if countdown["on_finish"]:
+                await countdown["on_finish"]()
+            return
+
+        # Next edit when the displayed value changes
+        self._schedule(key, countdown["ends_at"] - (shown - countdown_step(time_left)))
+
+
+countdown_ticker = CountdownTicker()
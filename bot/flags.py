@@ -0,0 +1,170 @@
+import os
+import asyncio
+from collections import OrderedDict
+from urllib.parse import urlparse
+import aiohttp
+from aiogram.types import FSInputFile
+from bot.storage import get_state_section
+from bot.state_actor import save_state_section
+from bot.config import FLAG_ASSET_DIR, FLAG_CACHE_DIR, FLAG_MAX_BYTES, FLAG_FILE_ID_CACHE_SIZE
+from bot.outbound import send_outbound
+from bot.dial_codes import country_for_number
+
+FLAG_FILE_IDS_SECTION = "flag_file_ids"
+
+# Image formats Telegram accepts as a photo
+FLAG_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+# iso country code -> path of the flag image, read from FLAG_ASSET_DIR and FLAG_CACHE_DIR on first use
+_flag_assets = None
+
+# iso country code -> flag URL scraped from an origin page, used until the image is cached
+_learned_flag_urls = {}
+_downloads = {}  # iso country code -> task saving its flag
+
+# flag_url -> Telegram file_id of the first upload, least recently used first
+flag_file_ids = OrderedDict()
+
+
+def _list_flags(directory):
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return {}
+    return {
+        os.path.splitext(name)[0].lower(): os.path.join(directory, name)
+        for name in names if name.lower().endswith(FLAG_IMAGE_EXTENSIONS)
+    }
+
+
+def flag_assets():
+    """iso country code -> flag image path; bundled flags win over downloaded ones"""
+    global _flag_assets
+    if _flag_assets is None:
+        _flag_assets = {**_list_flags(FLAG_CACHE_DIR), **_list_flags(FLAG_ASSET_DIR)}
+    return _flag_assets
+
+
+def flag_emoji(number):
+    """Flag of a number's country as regional indicator symbols (e.g. 🇩🇪), or "" if the country is unknown"""
+    country = country_for_number(number) if number else None
+    if not country:
+        return ""
+    return "".join(chr(0x1F1E6 + ord(letter) - ord("a")) for letter in country)
+
+
+def local_flag_for_number(number):
+    """
+    Flag of the country a number belongs to: the path of its asset, else the flag URL learned from an
+    earlier page of that country, else None
+    """
+    if not number:
+        return None
+    country = country_for_number(number)
+    if not country:
+        return None
+    return flag_assets().get(country) or _learned_flag_urls.get(country)
+
+
+def learn_flag(number, flag_url):
+    """
+    Remember the flag scraped for a number's country so pages of that country are not scanned again,
+    and save the image to FLAG_CACHE_DIR in the background so later runs find it there. Only pass
+    images the page labels as the country flag; anything else would become the country's flag for good.
+    """
+    country = country_for_number(number) if number else None
+    if not country or not flag_url or country in flag_assets():
+        return
+    _learned_flag_urls[country] = flag_url
+    extension = os.path.splitext(urlparse(flag_url).path)[1].lower()
+    if extension not in FLAG_IMAGE_EXTENSIONS or country in _downloads:
+        return
+    try:
+        task = asyncio.get_running_loop().create_task(_save_flag_asset(country, flag_url, extension))
+    except RuntimeError:
+        # Parsed outside the event loop; the learned URL is still used
+        return
+    _downloads[country] = task
+    task.add_done_callback(lambda done: _downloads.pop(country, None))
+
+
+async def _save_flag_asset(country, flag_url, extension):
+    path = os.path.join(FLAG_CACHE_DIR, f"{country}{extension}")
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(flag_url, timeout=15) as response:
+                response.raise_for_status()
+                if not response.content_type.startswith("image/"):
+                    raise ValueError(f"not an image: {response.content_type}")
+                if (response.content_length or 0) > FLAG_MAX_BYTES:
+                    raise ValueError(f"{response.content_length} bytes, more than {FLAG_MAX_BYTES}")
+                content = bytearray()
+                async for chunk in response.content.iter_chunked(16384):
+                    content += chunk
+                    if len(content) > FLAG_MAX_BYTES:
+                        raise ValueError(f"more than {FLAG_MAX_BYTES} bytes")
+        os.makedirs(FLAG_CACHE_DIR, exist_ok=True)
+        # Written under a temporary name so a half-written file is never picked up
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(content)
+        os.replace(f"{path}.tmp", path)
+    except Exception as e:
+        # The learned URL keeps being used
+        print(f"Error saving flag asset for {country}: {e}")
+        return
+    flag_assets()[country] = path
+    _learned_flag_urls.pop(country, None)
+
+
+def is_local_flag(flag_url):
+    return bool(flag_url) and not flag_url.startswith(("http://", "https://")) and os.path.isfile(flag_url)
+
+
+def restore_flag_file_ids():
+    """Load the persisted file_ids; call after load_website_data"""
+    flag_file_ids.clear()
+    flag_file_ids.update(get_state_section(FLAG_FILE_IDS_SECTION, {}) or {})
+
+
+def save_flag_file_ids():
+    return save_state_section(FLAG_FILE_IDS_SECTION, lambda: dict(flag_file_ids))
+
+
+async def remember_flag_file_id(flag_url, sent_message):
+    """Remember the file_id Telegram assigned to an uploaded flag"""
+    photos = getattr(sent_message, "photo", None)
+    if not flag_url or not photos:
+        return
+    file_id = photos[-1].file_id
+    if flag_file_ids.get(flag_url) == file_id:
+        flag_file_ids.move_to_end(flag_url)
+        return
+    flag_file_ids[flag_url] = file_id
+    while len(flag_file_ids) > FLAG_FILE_ID_CACHE_SIZE:
+        flag_file_ids.popitem(last=False)
+    save_flag_file_ids()
+
+
+async def send_flag_photo(bot, chat_id, flag_url, priority, **kwargs):
+    """
+    Send a flag photo, reusing the file_id of an earlier upload so Telegram does not download the
+    image from the origin again. Falls back to the URL if Telegram no longer accepts the file_id.
+    flag_url may also be the path of a bundled flag, which is uploaded from disk.
+    """
+    file_id = flag_file_ids.get(flag_url)
+    if file_id:
+        try:
+            sent_message = await send_outbound(priority, chat_id, lambda: bot.send_photo(chat_id, photo=file_id, **kwargs))
+        except Exception as e:
+            print(f"Cached flag file_id rejected, uploading {flag_url} again: {e}")
+            if flag_file_ids.get(flag_url) == file_id:
+                flag_file_ids.pop(flag_url)
+        else:
+            if flag_url in flag_file_ids:
+                flag_file_ids.move_to_end(flag_url)
+            return sent_message
+
+    photo = FSInputFile(flag_url) if is_local_flag(flag_url) else flag_url
+    sent_message = await send_outbound(priority, chat_id, lambda: bot.send_photo(chat_id, photo=photo, **kwargs))
+    await remember_flag_file_id(flag_url, sent_message)
+    return sent_message
@@ -3,562 +3,394 @@ from aiogram import Dispatcher
 from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import Command
 from aiogram.filters.command import CommandObject
-from bot.config import CHAT_ID, ENABLE_REPEAT_NOTIFICATION, DEFAULT_REPEAT_INTERVAL
-from bot.notifications import get_buttons, update_message_with_countdown, create_unified_keyboard, add_countdown_to_latest_notification
-from bot.storage import storage, save_website_data, save_last_number
-from bot.utils import format_time, delete_message_after_delay, get_base_url, extract_website_name, remove_country_code
+from bot.config import CHAT_ID, ADMIN_IDS, DEFAULT_REPEAT_INTERVAL
+from bot.notifications import get_buttons, create_unified_keyboard, add_countdown_to_latest_notification, cancel_countdown, restart_countdowns
+from bot.countdown import countdown_ticker
+from bot.storage import storage, runtime_state, RUNTIME_SECTION
+from bot.state_actor import state_actor, apply_state, SITE_TOGGLED
+from bot.subscriptions import subscriptions, save_subscriptions
+from bot.repeat import repeat_scheduler
+from bot.outbound import send_outbound, edit_reply_markup, edit_message_caption, PRIORITY_INTERACTIVE, PRIORITY_COSMETIC
+from bot.animations import animation_scheduler
+from bot.middlewares import register_middlewares
+from bot.metrics import metrics_middleware, note_handler_error, render_stats
+from bot.callbacks import callback_router, pack_callback, parse_callback
+from bot.sites import site_registry
+from bot.monitoring_menu import monitoring_menu
+from bot.monitoring import site_poller
+from bot.status import status_board
+from bot.utils import format_time, delete_message_after_delay, remove_country_code
 
 def register_handlers(dp: Dispatcher):
     """Register all handlers with the dispatcher"""
-    # Button callbacks
-    dp.callback_query.register(copy_number,
-                               lambda c: c.data.startswith("copy_"))
-    dp.callback_query.register(
-        update_number, lambda c: c.data.startswith("update_") and not c.data.
-        startswith("update_multi_"))
-    dp.callback_query.register(update_multi_numbers,
-                               lambda c: c.data.startswith("update_multi_"))
-    dp.callback_query.register(
-        handle_settings, lambda c: c.data.startswith("settings_") and not c.
-        data.startswith("settings_monitoring_"))
-    dp.callback_query.register(
-        handle_monitoring_settings,
-        lambda c: c.data.startswith("settings_monitoring_"))
-    dp.callback_query.register(toggle_site_monitoring,
-                               lambda c: c.data.startswith("toggle_site_"))
-    dp.callback_query.register(toggle_repeat_notification,
-                               lambda c: c.data.startswith("toggle_repeat_"))
-    dp.callback_query.register(back_to_main,
-                               lambda c: c.data.startswith("back_to_main_"))
-    dp.callback_query.register(
-        split_number,
-        lambda c: c.data.startswith("split_") or c.data.startswith("number_"))
+    register_middlewares(dp)
+    # Time handlers once they run, not while they wait for a slot
+    dp.callback_query.middleware(metrics_middleware)
+    dp.message.middleware(metrics_middleware)
+
+    # Button callbacks: one handler parses the payload and dispatches on its action
+    callback_router.register("copy", copy_number)
+    callback_router.register("update", update_number)
+    callback_router.register("update_multi", update_multi_numbers)
+    callback_router.register("settings", handle_settings)
+    callback_router.register("monitoring", handle_monitoring_settings)
+    callback_router.register("toggle_site", toggle_site_monitoring)
+    callback_router.register("toggle_repeat", toggle_repeat_notification)
+    callback_router.register("back", back_to_main)
+    callback_router.register("split", split_number)
+    dp.callback_query.register(callback_router.dispatch)
 
     # Commands
     dp.message.register(send_ping_reply, Command("ping"))
     dp.message.register(set_repeat_interval, Command("set_repeat"))
     dp.message.register(stop_repeat_notification, Command("stop_repeat"))
+    # Admin commands; strangers who find the bot must not receive alerts or read its internals
+    dp.message.register(subscribe_chat, Command("subscribe"), is_admin)
+    dp.message.register(unsubscribe_chat, Command("unsubscribe"), is_admin)
+    dp.message.register(send_stats, Command("stats"), is_admin)
+    dp.message.register(send_status, Command("status"))
 
 
-async def copy_number(callback_query: CallbackQuery):
+async def copy_number(callback_query: CallbackQuery, number=None, site_id=None):
     current_buttons = callback_query.message.reply_markup.inline_keyboard
     update_button = current_buttons[0][1]
     is_updated = update_button.text == "✅ Updated Number"
-    number = update_button.callback_data.split("_")[1]
+    if number is None:
+        # Legacy copy buttons carry no number; take it from the update button next to it
+        parsed = parse_callback(update_button.callback_data)
+        number = parsed[1].get("number") if parsed else None
+
+    await answer_callback(callback_query, "Number copied!")
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[[
         InlineKeyboardButton(text="✅ Copied", callback_data="none")
     ]])
 
+    async def restore_buttons():
+        await edit_reply_markup(callback_query.message, get_buttons(number, updated=is_updated, site_id=site_id), PRIORITY_COSMETIC)
+
+    animation_scheduler.play(callback_query.message, [(keyboard, 4)], restore_buttons)
+
+
+async def answer_callback(callback_query: CallbackQuery, text=None):
+    """Acknowledge a button tap so the client stops its spinner; a late or failed answer is not fatal"""
     try:
-        await callback_query.message.edit_reply_markup(reply_markup=keyboard)
-        await asyncio.sleep(4)
-        await callback_query.message.edit_reply_markup(
-            reply_markup=get_buttons(number, updated=is_updated))
+        await callback_query.answer(text)
     except Exception as e:
-        if "message is not modified" in str(e):
-            print("Ignoring 'message not modified' error in copy_number")
-            await callback_query.answer("Number copied!")
-        else:
-            print(f"Error in copy_number: {e}")
-            await callback_query.answer("Error copying number")
+        print(f"Error answering callback: {e}")
 
 
-async def update_number(callback_query: CallbackQuery):
+async def update_number(callback_query: CallbackQuery, number, site_id):
     """Update number for a website"""
     try:
-        # Extract number and site_id from callback data
-        parts = callback_query.data.split('_')
-        if len(parts) >= 3:
-            number = parts[1]
-            site_id = extract_valid_site_id(callback_query)
-        elif len(parts) > 1:
-            number = parts[1]
-            site_id = extract_valid_site_id(callback_query)
-        else:
-            await callback_query.answer("Site ID missing or invalid. Please try again.")
+        if not number:
+            await answer_callback(callback_query, "Number missing or invalid. Please try again.")
             return
-        if not site_id:
-            await callback_query.answer("Site ID missing or invalid. Please try again.")
-            return
-        
-        print(f"[DEBUG] update_number - site_id: {site_id}, number: {number}")
-        
+
         # Try to find the website in storage
         website = storage["websites"].get(site_id)
-        print(f"[DEBUG] update_number - website found: {website is not None}")
-        
-        # Cancel countdown if running, update last_number, restart repeat notification
-        if CHAT_ID and site_id in storage["active_countdown_tasks"]:
-            print(f"[DEBUG] update_number - cancelling active countdown for site_id: {site_id}")
-            storage["active_countdown_tasks"][site_id].cancel()
-            del storage["active_countdown_tasks"][site_id]
-        
-        # Update last_number in website_data.json
-        await save_last_number(int(number), site_id)
-        print(f"[DEBUG] update_number - last_number updated and saved for site_id: {site_id}")
-
-        # Update button_updated state
-        if website:
-            website.button_updated = True
-            await save_website_data(site_id)
-            print(f"[DEBUG] update_number - saved website data with button_updated=True")
 
-        # Start new countdown for fresh notification if repeat is enabled
-        if ENABLE_REPEAT_NOTIFICATION and storage["repeat_interval"] and website:
-            print(f"[DEBUG] update_number - scheduling new countdown for site_id: {site_id}")
-            await add_countdown_to_latest_notification(callback_query.bot, storage["repeat_interval"], site_id)
+        # Update last_number and button_updated state through the state actor, which saves them
+        await apply_state(_mark_number_updated, site_id, int(number), site_id=site_id)
+        await answer_callback(callback_query, "Number updated successfully!")
 
-        # UI/UX: Update inline keyboard to show updated state
-        try:
-            has_countdown = False
-            message_text = callback_query.message.caption
-            if message_text and "⏱ Next notification in:" in message_text:
-                has_countdown = True
-                new_message = message_text.split("\n\n⏱")[0]
+        # Cancel countdown if running and restart it for the fresh number if repeat is enabled
+        if CHAT_ID and countdown_ticker.is_active(site_id):
+            await cancel_countdown(site_id)
+        if storage["repeat_enabled"] and storage["repeat_interval"] and website:
+            await add_countdown_to_latest_notification(callback_query.bot, storage["repeat_interval"], site_id)
+            # The next reminder in this chat is due one interval after the update
+            await repeat_scheduler.schedule(site_id, callback_query.message.chat.id, storage["repeat_interval"])
 
-            original_keyboard = callback_query.message.reply_markup
+        # UI/UX: Animate the keyboard to the updated state in the background
+        has_countdown = False
+        message_text = callback_query.message.caption
+        if message_text and "⏱ Next notification in:" in message_text:
+            has_countdown = True
+            new_message = message_text.split("\n\n⏱")[0]
 
-            # Show updating animation
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[[
-                InlineKeyboardButton(text="✅ Updating to:", callback_data="none")
-            ]])
-            await callback_query.message.edit_reply_markup(reply_markup=keyboard)
-            await asyncio.sleep(2)
+        original_keyboard = callback_query.message.reply_markup
 
-            updated_keyboard = InlineKeyboardMarkup(inline_keyboard=[[
-                InlineKeyboardButton(text=f"{number}", callback_data="none")
-            ]])
-            await callback_query.message.edit_reply_markup(
-                reply_markup=updated_keyboard)
-            await asyncio.sleep(2)
+        final_keyboard = get_buttons(number, updated=True, site_id=site_id)
+        if final_keyboard is None:
+            final_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+                [
+                    InlineKeyboardButton(text="📋 Copy Number",
+                                         callback_data=pack_callback("copy", number, site_id)),
+                    InlineKeyboardButton(
+                        text="✅ Updated Number",
+                        callback_data=pack_callback("update", number, site_id))
+                ],
+                [
+                    InlineKeyboardButton(text="🔪 Split",
+                                         callback_data=pack_callback("split", number, site_id)),
+                    InlineKeyboardButton(text="⚙️ Settings",
+                                         callback_data=pack_callback("settings", site_id))
+                ],
+                [
+                    InlineKeyboardButton(
+                        text="🌐 Visit Webpage",
+                        url=f"{site_registry.url(site_id)}/number/{number}" if site_registry.url(site_id) else "")
+                ]
+            ])
 
-            final_keyboard = get_buttons(number, updated=True, site_id=site_id)
-            if final_keyboard is None:
-                final_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                    [
-                        InlineKeyboardButton(text="📋 Copy Number",
-                                             callback_data="copy_number"),
-                        InlineKeyboardButton(
-                            text="✅ Updated Number",
-                            callback_data=f"update_{number}_{site_id}")
-                    ],
-                    [
-                        InlineKeyboardButton(text="🔪 Split",
-                                             callback_data=f"split_{number}_{site_id}"),
-                        InlineKeyboardButton(text="⚙️ Settings",
-                                             callback_data=f"settings_{site_id}")
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            text="🌐 Visit Webpage",
-                            url=f"{get_base_url()}/number/{number}" if get_base_url() else "")
-                    ]
-                ])
-
-            if has_countdown:
-                try:
-                    await callback_query.bot.edit_message_caption(
-                        chat_id=callback_query.message.chat.id,
-                        message_id=callback_query.message.message_id,
-                        caption=new_message,
-                        parse_mode="Markdown",
-                        reply_markup=final_keyboard)
-                except Exception as e:
-                    if "message is not modified" not in str(e):
-                        print(f"Error updating message caption: {e}")
-                        # Try to restore original keyboard
-                        try:
-                            await callback_query.message.edit_reply_markup(
-                                reply_markup=original_keyboard)
-                        except:
-                            pass
-            else:
-                try:
-                    await callback_query.message.edit_reply_markup(
-                        reply_markup=final_keyboard)
-                except Exception as e:
-                    if "message is not modified" not in str(e):
-                        print(f"Error updating reply markup: {e}")
-                        # Try to restore original keyboard
-                        try:
-                            await callback_query.message.edit_reply_markup(
-                                reply_markup=original_keyboard)
-                        except:
-                            pass
+        async def show_final_keyboard():
+            try:
+                message = callback_query.message
+                if (storage["latest_notification"]["message_id"] == message.message_id
+                        and countdown_ticker.redraw(site_id, message.chat.id)):
+                    # The restarted countdown shows the final keyboard under its current caption
+                    return
+                if has_countdown:
+                    await edit_message_caption(
+                        callback_query.bot,
+                        callback_query.message.chat.id,
+                        callback_query.message.message_id,
+                        new_message,
+                        reply_markup=final_keyboard,
+                        parse_mode="Markdown")
+                else:
+                    await edit_reply_markup(callback_query.message, final_keyboard)
+            except Exception as e:
+                if "message is not modified" not in str(e):
+                    print(f"Error updating message: {e}")
+                    # Try to restore original keyboard
+                    try:
+                        await edit_reply_markup(callback_query.message, original_keyboard)
+                    except:
+                        pass
 
-            await callback_query.answer("Number updated successfully!")
+        animation_scheduler.play(callback_query.message, [
+            (InlineKeyboardMarkup(inline_keyboard=[[
+                InlineKeyboardButton(text="✅ Updating to:", callback_data="none")
+            ]]), 2),
+            (InlineKeyboardMarkup(inline_keyboard=[[
+                InlineKeyboardButton(text=f"{number}", callback_data="none")
+            ]]), 2)
+        ], show_final_keyboard)
 
-        except Exception as e:
-            print(f"Error in update_number: {e}")
-            await callback_query.answer("Error updating number")
-            # Try to restore the buttons in case of error
-            try:
-                website = storage["websites"].get(site_id)
-                if website and website.last_number:
-                    await callback_query.message.edit_reply_markup(
-                        reply_markup=get_buttons(website.last_number,
-                                                 site_id=site_id))
-            except:
-                pass
+        # Look at the origin now rather than at the next sweep; a number newer than this one is sent as usual
+        if website:
+            site_poller.refresh_soon(website)
 
-    except:
-        pass
+    except Exception as e:
+        print(f"Error in update_number: {e}")
+        note_handler_error(e)
+        await answer_callback(callback_query, "Error updating number")
 
 
-async def update_multi_numbers(callback_query: CallbackQuery):
+async def update_multi_numbers(callback_query: CallbackQuery, site_id):
     """Update multiple numbers for a website"""
     try:
-        # Extract site_id more reliably by removing the 'update_multi_' prefix
-        callback_data = callback_query.data
-        if callback_data.startswith("update_multi_"):
-            site_id = extract_valid_site_id(callback_query)
-        else:
-            site_id = extract_valid_site_id(callback_query)
-        if not site_id:
-            await callback_query.answer("Site ID missing or invalid. Please try again.")
-            return
-            
-        print(f"Extracted site_id: {site_id}")  # Debug log
-        
+
         # Try to find the website in storage
         website = storage["websites"].get(site_id)
-        print(f"[DEBUG] update_multi_numbers - website found: {website is not None}")
-        
+
         # Store the updated state in the website object
         if website:
-            print(f"[DEBUG] update_multi_numbers - before setting button_updated: {getattr(website, 'button_updated', False)}")
-            website.button_updated = True
-            print(f"[DEBUG] update_multi_numbers - after setting button_updated: {website.button_updated}")
-            # Save the updated website data to persist the button_updated state
-            await save_website_data(site_id)
-            print(f"[DEBUG] update_multi_numbers - saved website data with button_updated=True")
-        
-        # Store the original keyboard to restore if needed
-        original_keyboard = callback_query.message.reply_markup
-        
-        # Check if this is an initial run notification by examining the original keyboard
-        is_initial_run = False
-        
-        # First, check if the current layout is an initial run layout (single button in first row)
-        if callback_query.message and callback_query.message.reply_markup:
-            # Check if the first row has only one button (initial run layout)
-            if (len(callback_query.message.reply_markup.inline_keyboard) > 0 and 
-                len(callback_query.message.reply_markup.inline_keyboard[0]) == 1):
-                is_initial_run = True
-                print(f"[DEBUG] update_multi_numbers - detected initial run layout from current keyboard")
-        
-        # If not determined from keyboard, use other detection methods
-        if not is_initial_run:
-            # For site_2, we need special detection logic
-            if site_id == "site_2":
-                # Check if this is the first time we're showing numbers for site_2
-                if (hasattr(website, 'last_number') and website.last_number and 
-                    (not hasattr(website, 'latest_numbers') or len(website.latest_numbers) <= 1)):
-                    is_initial_run = True
-                    print(f"Determined initial run for site_2 based on last_number only or single latest_number")
-                # If we have both last_number and latest_numbers, check if they match
-                elif (hasattr(website, 'last_number') and website.last_number and 
-                      hasattr(website, 'latest_numbers') and website.latest_numbers):
-                    # If the first number in latest_numbers matches last_number, it's likely an initial run
-                    if str(website.last_number) in str(website.latest_numbers[0]):
-                        is_initial_run = True
-                        print(f"Determined initial run for site_2 based on matching last_number and latest_numbers[0]")
-                    else:
-                        is_initial_run = False
-                        print(f"Determined non-initial run for site_2 based on non-matching last_number and latest_numbers")
-            # For other sites or if above checks don't determine, use fallback methods
-            else:
-                # Check if website_data.json exists - if not, it's an initial run
-                website_data_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'website_data.json')
-                if not os.path.exists(website_data_path):
-                    is_initial_run = True
-                    print(f"Determined initial run based on missing website_data.json file: {website_data_path}")
-                # If file exists, check if we have a flag indicating initial run
-                elif hasattr(website, 'first_run'):
-                    is_initial_run = website.first_run
-                    print(f"Using first_run flag: {is_initial_run}")
-                # If no clear indicators, fall back to checking latest_numbers
-                elif (not hasattr(website, 'latest_numbers') or 
-                      not website.latest_numbers or 
-                      len(website.latest_numbers) == 0):
-                    is_initial_run = True
-                    print("Determined initial run based on missing latest_numbers")
-        
-        print(f"[DEBUG] update_multi_numbers - is_initial_run: {is_initial_run}")
+            # Persist the button_updated state through the state actor
+            await apply_state(setattr, website, "button_updated", True, site_id=site_id)
 
-        # Show updating animation similar to single type
-        try:
-            has_countdown = False
-            message_text = callback_query.message.caption
-            if message_text and "⏱ Next notification in:" in message_text:
-                has_countdown = True
-                new_message = message_text.split("\n\n⏱")[0]
-
-            # Show updating animation
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[[
-                InlineKeyboardButton(text="✅ Updating to:", callback_data="none")
-            ]])
-            await callback_query.message.edit_reply_markup(reply_markup=keyboard)
-            await asyncio.sleep(2)
-            
-            # If we have numbers to display in the animation, show the first one
-            display_number = ""
-            if website and hasattr(website, 'latest_numbers') and website.latest_numbers:
-                display_number = website.latest_numbers[0]
-            elif website and hasattr(website, 'last_number') and website.last_number:
-                display_number = f"+{website.last_number}"
-                
-            if display_number:
-                updated_keyboard = InlineKeyboardMarkup(inline_keyboard=[[
-                    InlineKeyboardButton(text=f"{display_number}", callback_data="none")
-                ]])
-                await callback_query.message.edit_reply_markup(reply_markup=updated_keyboard)
-                await asyncio.sleep(2)
-        except Exception as e:
-            print(f"Error during animation: {e}")
-            # Continue with the update even if animation fails
+            if storage["repeat_enabled"] and storage["repeat_interval"]:
+                await repeat_scheduler.schedule(site_id, callback_query.message.chat.id, storage["repeat_interval"])
 
-        # Create a unified data structure for the keyboard
-        keyboard_data = {
-            "site_id": site_id,
-            "updated": True,  # Always set to True since we're updating
-            "type": getattr(website, 'type', 'multiple'),
-            "is_initial_run": is_initial_run,  # Pass the detected initial run state
-            "url": getattr(website, 'url', get_base_url() or "")
-        }
-        
-        # Add type-specific data
-        if keyboard_data["type"] == "single":
-            keyboard_data["number"] = getattr(website, 'last_number', "")
-        else:  # multiple type
-            if is_initial_run:
-                # For initial run, use last_number to maintain single button layout
-                if hasattr(website, 'last_number') and website.last_number:
-                    keyboard_data["numbers"] = [f"+{website.last_number}"]
-                elif hasattr(website, 'latest_numbers') and website.latest_numbers:
-                    # If we don't have last_number, use the first number from latest_numbers
-                    keyboard_data["numbers"] = [website.latest_numbers[0]]
-                else:
-                    keyboard_data["numbers"] = []
-            else:
-                # For non-initial run, use the full latest_numbers array
-                keyboard_data["numbers"] = getattr(website, 'latest_numbers', [])
-                if not keyboard_data["numbers"] and hasattr(website, 'last_number'):
-                    keyboard_data["numbers"] = [f"+{website.last_number}"]
-        
-        print(f"[DEBUG] update_multi_numbers - keyboard_data: {keyboard_data}")
-        
-        # Create the unified keyboard
-        final_keyboard = create_unified_keyboard(keyboard_data, website)
-        
-        # If keyboard creation failed, log the error and return
-        if final_keyboard is None:
-            print(f"ERROR: Failed to create keyboard with unified function for site_id: {site_id}")
-            print(f"Keyboard data: {keyboard_data}")
-            return
-        
-        try:
-            await callback_query.message.edit_reply_markup(
-                reply_markup=final_keyboard)
-        except Exception as e:
-            if "message is not modified" not in str(e):
-                print(f"ERROR updating reply markup: {e}")
+        # Fetch the site in the background so the final keyboard shows its current numbers, not
+        # those of the last sweep; the handler does not wait for the origin
+        refresh = site_poller.refresh_soon(website) if website else None
 
         # Show success message or error message depending on whether website was found
-        if site_id not in storage["websites"]:
-            await callback_query.answer("Website configuration not found, but animation completed")
+        if website is None:
+            await answer_callback(callback_query, "Website configuration not found")
         else:
-            await callback_query.answer("Numbers updated successfully!")
+            await answer_callback(callback_query, "Numbers updated successfully!")
+
+        # Animate the keyboard to the updated state in the background, showing the first number if any
+        frames = [(InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="✅ Updating to:", callback_data="none")
+        ]]), 2)]
+        display_number = ""
+        if website and hasattr(website, 'latest_numbers') and website.latest_numbers:
+            display_number = website.latest_numbers[0]
+        elif website and hasattr(website, 'last_number') and website.last_number:
+            display_number = f"+{website.last_number}"
+        if display_number:
+            frames.append((InlineKeyboardMarkup(inline_keyboard=[[
+                InlineKeyboardButton(text=f"{display_number}", callback_data="none")
+            ]]), 2))
+
+        async def show_final_keyboard():
+            if refresh is not None:
+                await refresh
+            final_keyboard = build_multi_update_keyboard(callback_query, website, site_id)
+            if final_keyboard is None:
+                return
+            try:
+                await edit_reply_markup(callback_query.message, final_keyboard)
+            except Exception as e:
+                if "message is not modified" not in str(e):
+                    print(f"ERROR updating reply markup: {e}")
+
+        animation_scheduler.play(callback_query.message, frames, show_final_keyboard)
     except Exception as e:
         print(f"ERROR in update_multi_numbers: {e}")
-        await callback_query.answer("Error updating numbers")
+        note_handler_error(e)
+        await answer_callback(callback_query, "Error updating numbers")
+
+
+def build_multi_update_keyboard(callback_query: CallbackQuery, website, site_id):
+    """Keyboard a multiple numbers notification shows once its numbers are marked updated, or None"""
+    # Check if this is an initial run notification by examining the original keyboard
+    is_initial_run = False
+
+    # First, check if the current layout is an initial run layout (single button in first row)
+    if callback_query.message and callback_query.message.reply_markup:
+        # Check if the first row has only one button (initial run layout)
+        if (len(callback_query.message.reply_markup.inline_keyboard) > 0 and 
+            len(callback_query.message.reply_markup.inline_keyboard[0]) == 1):
+            is_initial_run = True
+
+    # If not determined from keyboard, use other detection methods
+    if not is_initial_run:
+        # For site_2, we need special detection logic
+        if site_id == "site_2":
+            # Check if this is the first time we're showing numbers for site_2
+            if (hasattr(website, 'last_number') and website.last_number and 
+                (not hasattr(website, 'latest_numbers') or len(website.latest_numbers) <= 1)):
+                is_initial_run = True
+            # If we have both last_number and latest_numbers, check if they match
+            elif (hasattr(website, 'last_number') and website.last_number and 
+                  hasattr(website, 'latest_numbers') and website.latest_numbers):
+                # If the first number in latest_numbers matches last_number, it's likely an initial run
+                if str(website.last_number) in str(website.latest_numbers[0]):
+                    is_initial_run = True
+                else:
+                    is_initial_run = False
+        # For other sites or if above checks don't determine, use fallback methods
+        else:
+            # Check if the state file exists - if not, it's an initial run
+            website_data_path = storage["file"]
+            if not os.path.exists(website_data_path):
+                is_initial_run = True
+            # If file exists, check if we have a flag indicating initial run
+            elif hasattr(website, 'first_run'):
+                is_initial_run = website.first_run
+            # If no clear indicators, fall back to checking latest_numbers
+            elif (not hasattr(website, 'latest_numbers') or 
+                  not website.latest_numbers or 
+                  len(website.latest_numbers) == 0):
+                is_initial_run = True
 
+    # Create a unified data structure for the keyboard
+    keyboard_data = {
+        "site_id": site_id,
+        "updated": True,  # Always set to True since we're updating
+        "type": getattr(website, 'type', 'multiple'),
+        "is_initial_run": is_initial_run,  # Pass the detected initial run state
+        "url": site_registry.url(site_id)
+    }
+
+    # Add type-specific data
+    if keyboard_data["type"] == "single":
+        keyboard_data["number"] = getattr(website, 'last_number', "")
+    else:  # multiple type
+        if is_initial_run:
+            # For initial run, use last_number to maintain single button layout
+            if hasattr(website, 'last_number') and website.last_number:
+                keyboard_data["numbers"] = [f"+{website.last_number}"]
+            elif hasattr(website, 'latest_numbers') and website.latest_numbers:
+                # If we don't have last_number, use the first number from latest_numbers
+                keyboard_data["numbers"] = [website.latest_numbers[0]]
+            else:
+                keyboard_data["numbers"] = []
+        else:
+            # For non-initial run, use the full latest_numbers array
+            keyboard_data["numbers"] = getattr(website, 'latest_numbers', [])
+            if not keyboard_data["numbers"] and hasattr(website, 'last_number'):
+                keyboard_data["numbers"] = [f"+{website.last_number}"]
+
+    # Create the unified keyboard
+    final_keyboard = create_unified_keyboard(keyboard_data, website)
 
-async def handle_settings(callback_query: CallbackQuery):
+    # If keyboard creation failed, log the error
+    if final_keyboard is None:
+        print(f"ERROR: Failed to create keyboard with unified function for site_id: {site_id}")
+        print(f"Keyboard data: {keyboard_data}")
+    return final_keyboard
+
+
+async def handle_settings(callback_query: CallbackQuery, site_id):
     try:
-        site_id = extract_valid_site_id(callback_query)
-        if not site_id:
-            await callback_query.answer("Site ID missing or invalid. Please try again.")
-            return
-        print(f"Settings - extracted site_id: {site_id}")
-        
+        # This menu replaces the keyboard, so a running button animation must not overwrite it
+        animation_scheduler.cancel(callback_query.message)
+
         # Get website configuration
         website = storage["websites"].get(site_id)
-        print(f"[DEBUG] handle_settings - website found: {website is not None}")
-        
+
         # Determine if repeat notification is enabled
-        repeat_status = "Disable" if ENABLE_REPEAT_NOTIFICATION else "Enable"
-        
+        repeat_status = "Disable" if storage["repeat_enabled"] else "Enable"
+
         # Create settings keyboard
         settings_keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [
                 InlineKeyboardButton(
                     text=f"{repeat_status} Repeat Notification",
-                    callback_data=f"toggle_repeat_{site_id}")
+                    callback_data=pack_callback("toggle_repeat", site_id))
             ],
             [
                 InlineKeyboardButton(
                     text="Stop Monitoring",
-                    callback_data=f"settings_monitoring_{site_id}")
+                    callback_data=pack_callback("monitoring", site_id))
             ],
             [
                 InlineKeyboardButton(text="« Back",
-                                     callback_data=f"back_to_main_{site_id}")
+                                     callback_data=pack_callback("back", site_id))
             ]
         ])
 
         # Update the message with new keyboard - always replace all buttons
-        await callback_query.message.edit_reply_markup(
-            reply_markup=settings_keyboard)
+        await edit_reply_markup(callback_query.message, settings_keyboard)
 
     except Exception as e:
         print(f"Error in handle_settings: {e}")
+        note_handler_error(e)
 
 
-async def handle_monitoring_settings(callback_query: CallbackQuery):
-    site_id = extract_valid_site_id(callback_query)
-    if not site_id:
-        await callback_query.answer("Site ID missing or invalid. Please try again.")
-        return
-
+async def handle_monitoring_settings(callback_query: CallbackQuery, site_id, page=None, prefix=None):
+    """Show a page of the monitoring settings, optionally narrowed to names starting with prefix"""
     try:
-        # Create buttons for each website, displaying 2 per row
-        buttons = []
-        current_row = []
-
-        # Add a button for each website with status indicator for the toggled site
-        for s_id, website in storage["websites"].items():
-            # Extract website name from URL
-            website_name = extract_website_name(website.url, website.type)
-
-            # Show "Disabled" text for disabled sites
-            if not website.enabled:
-                display_name = f"{website_name} : Disabled"
-            else:
-                display_name = website_name
-
-            # Extract just the numeric part of the site_id for cleaner callback data
-            s_num = s_id.split("_")[1] if "_" in s_id else "1"
-            
-            current_row.append(
-                InlineKeyboardButton(
-                    text=display_name,
-                    callback_data=f"toggle_site_{s_num}"))
-
-            # When we have 2 buttons in the row, add it to buttons and start a new row
-            if len(current_row) == 2:
-                buttons.append(current_row)
-                current_row = []
-
-        # Add any remaining buttons if we have an odd number
-        if current_row:
-            buttons.append(current_row)
-
-        # Add back button
-        buttons.append([
-            InlineKeyboardButton(text="« Back to Settings",
-                                 callback_data=f"settings_{site_id}")
-        ])
-
-        # Create monitoring settings keyboard
-        monitoring_keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-
-        # Update the message with new keyboard
-        await callback_query.message.edit_reply_markup(
-            reply_markup=monitoring_keyboard)
+        animation_scheduler.cancel(callback_query.message)
+        keyboard = monitoring_menu.render(site_id, int(page or 0), prefix or "")
+        await edit_reply_markup(callback_query.message, keyboard)
 
     except Exception as e:
         print(f"Error in monitoring settings: {e}")
+        note_handler_error(e)
 
 
-async def toggle_site_monitoring(callback_query: CallbackQuery):
+async def toggle_site_monitoring(callback_query: CallbackQuery, site_id, page=None, prefix=None, origin=None):
     """Toggle monitoring for a specific site"""
     try:
-        target_site_id = extract_valid_site_id(callback_query)
-        if not target_site_id:
-            await callback_query.answer("Site ID missing or invalid. Please try again.")
-            return
-            
-        print(f"Toggle site monitoring - target_site_id: {target_site_id}")
-        
+        animation_scheduler.cancel(callback_query.message)
+        target_site_id = site_id
+
         # Toggle the site's enabled status
         if target_site_id in storage["websites"]:
             website = storage["websites"][target_site_id]
-            website.enabled = not website.enabled
-
-            # Treat as first run when re-enabling monitoring
-            if website.enabled:
-                # Reset last_number and latest_numbers to force initial notification
-                if hasattr(website, "type") and website.type == "multiple":
-                    if website.latest_numbers and len(website.latest_numbers) > 0:
-                        # Set last_number to the first (0th) position of latest_numbers
-                        num = website.latest_numbers[0]
-                        if isinstance(num, str) and num.startswith("+"):
-                            num = num[1:]
-                        try:
-                            website.last_number = int(num)
-                        except (ValueError, TypeError):
-                            website.last_number = None
-                    else:
-                        website.last_number = None
-                else:
-                    website.last_number = None
-                # Optionally, add a flag to indicate first run if needed elsewhere
-                website.first_run = True
+            # Toggle through the state actor, which also saves the website
+            await apply_state(_toggle_site, website, site_id=target_site_id, event=SITE_TOGGLED)
+            if not website.enabled:
+                await repeat_scheduler.cancel_site(target_site_id)
+                await cancel_countdown(target_site_id)
 
             # Log the monitoring status change
             status = "started" if website.enabled else "stopped"
-            website_name = extract_website_name(website.url, website.type)
+            website_name = site_registry.name(target_site_id)
             print(f"Monitoring {status} for {website_name} Website")
 
             # We're in the monitoring settings menu, update it with the new status
-            # Create buttons for each website, displaying 2 per row
-            buttons = []
-            current_row = []
-
-            # Add a button for each website with status indicator for the toggled site
-            for s_id, site in storage["websites"].items():
-                # Extract website name from URL
-                site_name = extract_website_name(site.url, site.type)
-
-                # Show "Disabled" text for disabled sites
-                if not site.enabled:
-                    display_name = f"{site_name} : Disabled"
-                else:
-                    display_name = site_name
-
-                # Extract just the numeric part of the site_id for cleaner callback data
-                s_num = s_id.split("_")[1] if "_" in s_id else "1"
-                
-                current_row.append(
-                    InlineKeyboardButton(
-                        text=display_name,
-                        callback_data=f"toggle_site_{s_num}"))
-
-                # When we have 2 buttons in the row, add it to buttons and start a new row
-                if len(current_row) == 2:
-                    buttons.append(current_row)
-                    current_row = []
-
-            # Add any remaining buttons if we have an odd number
-            if current_row:
-                buttons.append(current_row)
-
-            # Add back button
-            buttons.append([
-                InlineKeyboardButton(
-                    text="« Back to Settings",
-                    callback_data=f"settings_{target_site_id}")
-            ])
-
-            # Update the keyboard
-            monitoring_keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await callback_query.message.edit_reply_markup(
-                reply_markup=monitoring_keyboard)
-
-            # Save the updated website data
-            await save_website_data(target_site_id)
+            # Buttons sent before the menu was paginated carry no origin; their back button led to the toggled site
+            keyboard = monitoring_menu.render(origin or target_site_id, int(page or 0), prefix or "")
+            await edit_reply_markup(callback_query.message, keyboard)
 
             status = "enabled" if website.enabled else "disabled"
             await callback_query.answer(
@@ -568,32 +400,83 @@ async def toggle_site_monitoring(callback_query: CallbackQuery):
                 f"Error: Website {target_site_id} not found")
     except Exception as e:
         print(f"Error in toggle_site_monitoring: {e}")
+        note_handler_error(e)
         await callback_query.answer("Error toggling site monitoring")
 
 
-async def toggle_repeat_notification(callback_query: CallbackQuery):
-    site_id = extract_valid_site_id(callback_query)
-    if not site_id:
-        await callback_query.answer("Site ID missing or invalid. Please try again.")
-        return
+def _toggle_site(website):
+    """State actor command: toggle monitoring for a website"""
+    website.enabled = not website.enabled
 
-    try:
-        global ENABLE_REPEAT_NOTIFICATION
-        # Log previous state before toggling
-        previous_state = ENABLE_REPEAT_NOTIFICATION
+    # Treat as first run when re-enabling monitoring
+    if website.enabled:
+        # Reset last_number and latest_numbers to force initial notification
+        if hasattr(website, "type") and website.type == "multiple":
+            if website.latest_numbers and len(website.latest_numbers) > 0:
+                # Set last_number to the first (0th) position of latest_numbers
+                num = website.latest_numbers[0]
+                if isinstance(num, str) and num.startswith("+"):
+                    num = num[1:]
+                try:
+                    website.last_number = int(num)
+                except (ValueError, TypeError):
+                    website.last_number = None
+            else:
+                website.last_number = None
+        else:
+            website.last_number = None
+        # Optionally, add a flag to indicate first run if needed elsewhere
+        website.first_run = True
 
-        # Toggle the state
-        ENABLE_REPEAT_NOTIFICATION = not ENABLE_REPEAT_NOTIFICATION
+
+def _mark_number_updated(site_id, number):
+    """State actor command: record the number the user updated to"""
+    website = storage["websites"].get(site_id)
+    if website:
+        website.last_number = number
+        website.button_updated = True
+
+
+def _toggle_repeat():
+    """Switch repeat notifications on or off, on the state actor; returns the new state"""
+    storage["repeat_enabled"] = not storage["repeat_enabled"]
+    if storage["repeat_enabled"] and storage["repeat_interval"] is None:
+        storage["repeat_interval"] = DEFAULT_REPEAT_INTERVAL
         print(
-            f"Repeat notification state: {'Enabled' if ENABLE_REPEAT_NOTIFICATION else 'Disabled'}"
+            f"Repeat interval set to default: {DEFAULT_REPEAT_INTERVAL} seconds ({format_time(DEFAULT_REPEAT_INTERVAL)})"
         )
+    if not storage["repeat_enabled"]:
+        # Forget the countdowns so they are not resumed after a restart
+        storage["countdowns"].clear()
+    state_actor.mark_section_dirty(RUNTIME_SECTION, runtime_state)
+    return storage["repeat_enabled"]
 
-        # Update repeat interval if needed
-        if ENABLE_REPEAT_NOTIFICATION and storage["repeat_interval"] is None:
-            storage["repeat_interval"] = DEFAULT_REPEAT_INTERVAL
-            print(
-                f"Repeat interval set to default: {DEFAULT_REPEAT_INTERVAL} seconds ({format_time(DEFAULT_REPEAT_INTERVAL)})"
-            )
+
+def _enable_repeat(interval):
+    """Enable repeat notifications with a new interval, on the state actor"""
+    storage["repeat_interval"] = interval
+    storage["repeat_enabled"] = True
+    state_actor.mark_section_dirty(RUNTIME_SECTION, runtime_state)
+
+
+def _stop_repeat():
+    """Disable repeat notifications and forget the countdowns, on the state actor"""
+    storage["repeat_enabled"] = False
+    storage["countdowns"].clear()
+    state_actor.mark_section_dirty(RUNTIME_SECTION, runtime_state)
+
+
+async def toggle_repeat_notification(callback_query: CallbackQuery, site_id):
+    try:
+        animation_scheduler.cancel(callback_query.message)
+        # Toggle the state; the state actor saves it
+        enabled = await apply_state(_toggle_repeat)
+        print(
+            f"Repeat notification state: {'Enabled' if enabled else 'Disabled'}"
+        )
+        if not enabled:
+            await repeat_scheduler.cancel_all()
+            countdown_ticker.cancel_all()
 
         # Log the current interval
         if not DEFAULT_REPEAT_INTERVAL:
@@ -602,7 +485,7 @@ async def toggle_repeat_notification(callback_query: CallbackQuery):
             )
 
         # Update the settings keyboard with new status
-        repeat_status = "Disable" if ENABLE_REPEAT_NOTIFICATION else "Enable"
+        repeat_status = "Disable" if enabled else "Enable"
 
         # Check if the site is enabled to determine the button text
         site_enabled = True
@@ -616,51 +499,40 @@ async def toggle_repeat_notification(callback_query: CallbackQuery):
             [
                 InlineKeyboardButton(
                     text=f"{repeat_status} Repeat Notification",
-                    callback_data=f"toggle_repeat_{site_id}")
+                    callback_data=pack_callback("toggle_repeat", site_id))
             ],
             [
                 InlineKeyboardButton(
                     text="Stop Monitoring",
-                    callback_data=f"settings_monitoring_{site_id}")
+                    callback_data=pack_callback("monitoring", site_id))
             ],
             [
                 InlineKeyboardButton(text="« Back",
-                                     callback_data=f"back_to_main_{site_id}")
+                                     callback_data=pack_callback("back", site_id))
             ]
         ])
 
         # Update the message with new keyboard
-        await callback_query.message.edit_reply_markup(
-            reply_markup=settings_keyboard)
+        await edit_reply_markup(callback_query.message, settings_keyboard)
 
-        status = "enabled" if ENABLE_REPEAT_NOTIFICATION else "disabled"
+        status = "enabled" if enabled else "disabled"
         await callback_query.answer(f"Repeat notification {status}")
 
     except Exception as e:
-        pass
+        note_handler_error(e)
 
 
-async def back_to_main(callback_query: CallbackQuery):
+async def back_to_main(callback_query: CallbackQuery, site_id):
     """Go back to the main message from settings"""
     try:
-        site_id = extract_valid_site_id(callback_query)
-        if not site_id:
-            await callback_query.answer("Site ID missing or invalid. Please try again.")
-            return
-            
-        print(f"Back - extracted site_id: {site_id}")
-        
+        animation_scheduler.cancel(callback_query.message)
+
         # Get website configuration
         website = storage["websites"].get(site_id)
-        print(f"Website found: {website is not None}")
-        print(f"[DEBUG] back_to_main - website object: {website}")
-        if website:
-            print(f"[DEBUG] back_to_main - initial button_updated state: {getattr(website, 'button_updated', False)}")
-            print(f"[DEBUG] back_to_main - website type: {getattr(website, 'type', 'single')}")
 
         # Determine if this is an initial run
         is_initial_run = False
-        
+
         # First, check if this is the first time we're showing this website's data
         # For all multiple type websites, check if this is the first notification
         if website.type == "multiple":
@@ -673,43 +545,36 @@ async def back_to_main(callback_query: CallbackQuery):
                     first_num = first_num[1:]
                 if str(website.last_number) == str(first_num):
                     is_initial_run = True
-                    print(f"[DEBUG] back_to_main - Determined initial run for {site_id} based on matching last_number and latest_numbers[0]")
-        
+
         # For site_2, we need special detection logic
         if site_id == "site_2":
             # Check if this is the first time we're showing numbers for site_2
             if (hasattr(website, 'last_number') and website.last_number and 
                 (not hasattr(website, 'latest_numbers') or len(website.latest_numbers) <= 1)):
                 is_initial_run = True
-                print(f"Determined initial run for site_2 based on last_number only or single latest_number")
             # If we have both last_number and latest_numbers, check if they match
             elif (hasattr(website, 'last_number') and website.last_number and 
                   hasattr(website, 'latest_numbers') and website.latest_numbers):
                 # If the first number in latest_numbers matches last_number, it's likely an initial run
                 if str(website.last_number) in str(website.latest_numbers[0]):
                     is_initial_run = True
-                    print(f"Determined initial run for site_2 based on matching last_number and latest_numbers[0]")
                 else:
                     is_initial_run = False
-                    print(f"Determined non-initial run for site_2 based on non-matching last_number and latest_numbers")
         # For other sites or if above checks don't determine, use fallback methods
         else:
-            # Check if website_data.json exists - if not, it's an initial run
-            website_data_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'website_data.json')
+            # Check if the state file exists - if not, it's an initial run
+            website_data_path = storage["file"]
             if not os.path.exists(website_data_path):
                 is_initial_run = True
-                print(f"Determined initial run based on missing website_data.json file: {website_data_path}")
             # If file exists, check if we have a flag indicating initial run
             elif hasattr(website, 'first_run'):
                 is_initial_run = website.first_run
-                print(f"Using first_run flag: {is_initial_run}")
             # If no clear indicators, fall back to checking latest_numbers
             elif (not hasattr(website, 'latest_numbers') or 
                   not website.latest_numbers or 
                   len(website.latest_numbers) == 0):
                 is_initial_run = True
-                print("Determined initial run based on missing latest_numbers")
-                
+
         # For all multiple type websites, treat the first time we see them as initial run
         # This ensures consistent behavior across all multiple type websites
         if website.type == "multiple" and site_id != "site_2":  # We already have special logic for site_2
@@ -718,36 +583,24 @@ async def back_to_main(callback_query: CallbackQuery):
             if not hasattr(website, 'first_notification'):
                 is_initial_run = True
                 # Set the flag to indicate this is no longer the first notification
-                website.first_notification = True
-                await save_website_data(site_id)
-                print(f"[DEBUG] back_to_main - Treating {site_id} as initial run (first notification)")
-        
+                await apply_state(setattr, website, "first_notification", True, site_id=site_id)
+
         # Check if the button was in "updated" state by looking at the website object
         was_updated = False
         if hasattr(website, 'button_updated') and website.button_updated:
             was_updated = True
-            print(f"[DEBUG] back_to_main - Detected button_updated=True from website object")
         else:
-            print(f"[DEBUG] back_to_main - button_updated not found or False in website object")
             # Fallback to checking the current keyboard
             if callback_query.message and callback_query.message.reply_markup:
-                print(f"[DEBUG] back_to_main - checking keyboard for updated state")
                 for row in callback_query.message.reply_markup.inline_keyboard:
                     for button in row:
-                        if button.callback_data and (
-                            button.callback_data.startswith(f"update_multi_{site_id}") or
-                            button.callback_data.startswith(f"update_number_{site_id}") or
-                            (button.callback_data.startswith("update_") and button.callback_data.endswith(f"_{site_id}"))
-                        ):
-                            print(f"[DEBUG] back_to_main - found update button with text: {button.text}")
+                        parsed = parse_callback(button.callback_data)
+                        if parsed and parsed[0] in ("update", "update_multi") and parsed[1].get("site_id") == site_id:
                             if "✅" in button.text:
                                 was_updated = True
-                                print(f"[DEBUG] back_to_main - Detected button_updated=True from keyboard")
                                 # Also set it in the website object for future use
-                                website.button_updated = True
                                 # Save the updated state to persistent storage
-                                await save_website_data(site_id)
-                                print(f"[DEBUG] back_to_main - saved website data with button_updated=True")
+                                await apply_state(setattr, website, "button_updated", True, site_id=site_id)
                                 break
 
         # Create a unified data structure for the keyboard
@@ -756,9 +609,9 @@ async def back_to_main(callback_query: CallbackQuery):
             "updated": was_updated,
             "type": getattr(website, 'type', 'single'),
             "is_initial_run": is_initial_run,
-            "url": getattr(website, 'url', get_base_url() or "")
+            "url": site_registry.url(site_id)
         }
-        
+
         # Add type-specific data
         if keyboard_data["type"] == "single":
             keyboard_data["number"] = getattr(website, 'last_number', "")
@@ -777,52 +630,41 @@ async def back_to_main(callback_query: CallbackQuery):
                 keyboard_data["numbers"] = getattr(website, 'latest_numbers', [])
                 if not keyboard_data["numbers"] and hasattr(website, 'last_number'):
                     keyboard_data["numbers"] = [f"+{website.last_number}"]
-        
-        print(f"[DEBUG] back_to_main - keyboard_data: {keyboard_data}")
-        
+
         # Create the unified keyboard
         final_keyboard = create_unified_keyboard(keyboard_data, website)
-        print(f"[DEBUG] back_to_main - created keyboard with updated={was_updated}")
-        
+
         # If keyboard creation failed, log the error and return
         if final_keyboard is None:
             print(f"ERROR: Failed to create keyboard with unified function for site_id: {site_id}")
             print(f"Keyboard data: {keyboard_data}")
             return
-        
+
         # Update the message with the appropriate keyboard
-        await callback_query.message.edit_reply_markup(reply_markup=final_keyboard)
+        await edit_reply_markup(callback_query.message, final_keyboard)
 
     except Exception as e:
         print(f"ERROR in back_to_main: {e}")
+        note_handler_error(e)
         # Don't create a fallback keyboard, just log the error
 
 
-async def split_number(callback_query: CallbackQuery):
+async def split_number(callback_query: CallbackQuery, number, site_id):
     try:
-        parts = callback_query.data.split("_")
-        if len(parts) > 2:
-            number_str = parts[1]
-            site_id = extract_valid_site_id(callback_query)
-        elif len(parts) > 1:
-            number_str = parts[1]
-            site_id = extract_valid_site_id(callback_query)
-        else:
-            await callback_query.answer("Site ID missing or invalid. Please try again.")
-            return
-        if not site_id:
-            await callback_query.answer("Site ID missing or invalid. Please try again.")
+        if not number:
+            await callback_query.answer("Number missing or invalid. Please try again.")
             return
-        
+
         # Remove country code from the number
-        number_without_country_code = remove_country_code(number_str)
+        number_without_country_code = remove_country_code(number)
         split_message = f"`{number_without_country_code}`"
 
         # Send the split number message
-        temp_message = await callback_query.bot.send_message(
-            chat_id=callback_query.message.chat.id,
+        chat_id = callback_query.message.chat.id
+        temp_message = await send_outbound(PRIORITY_INTERACTIVE, chat_id, lambda: callback_query.bot.send_message(
+            chat_id=chat_id,
             text=split_message,
-            parse_mode="Markdown")
+            parse_mode="Markdown"))
 
         # Create a task to delete the message after 30 seconds
         asyncio.create_task(
@@ -830,13 +672,15 @@ async def split_number(callback_query: CallbackQuery):
 
     except Exception as e:
         print(f"Error in split_number: {e}")
+        note_handler_error(e)
         await callback_query.answer("Error splitting number")
 
 
 async def send_ping_reply(message: Message):
-    await message.bot.send_message(chat_id=message.from_user.id,
-                                   text="I am now online 🌐")
-    await message.delete()
+    await send_outbound(PRIORITY_INTERACTIVE, message.from_user.id,
+                        lambda: message.bot.send_message(chat_id=message.from_user.id,
+                                                         text="I am now online 🌐"))
+    await send_outbound(PRIORITY_COSMETIC, message.chat.id, message.delete)
 
 
 async def set_repeat_interval(message: Message, command: CommandObject):
@@ -849,18 +693,15 @@ async def set_repeat_interval(message: Message, command: CommandObject):
 
             if args in ["default", "true"]:
                 new_interval = DEFAULT_REPEAT_INTERVAL
-                global ENABLE_REPEAT_NOTIFICATION
-                ENABLE_REPEAT_NOTIFICATION = True
 
             # Check for the "x" prefix for minutes
             elif args.startswith("x") and args[1:].isdigit():
                 minutes = int(args[1:])
                 if minutes <= 0:
-                    error_msg = await message.reply(
-                        "⚠️ Please provide a positive number of minutes")
-                    await asyncio.sleep(5)
-                    await error_msg.delete()
-                    await message.delete()
+                    error_msg = await send_outbound(PRIORITY_INTERACTIVE, message.chat.id, lambda: message.reply(
+                        "⚠️ Please provide a positive number of minutes"))
+                    asyncio.create_task(delete_message_after_delay(message.bot, error_msg, 5))
+                    asyncio.create_task(delete_message_after_delay(message.bot, message, 5))
                     return
 
                 new_interval = minutes * 60  # Convert minutes to seconds
@@ -868,131 +709,157 @@ async def set_repeat_interval(message: Message, command: CommandObject):
             elif args.isdigit():
                 seconds = int(args)
                 if seconds <= 0:
-                    error_msg = await message.reply(
-                        "⚠️ Please provide a positive number of seconds")
-                    await asyncio.sleep(5)
-                    await error_msg.delete()
-                    await message.delete()
+                    error_msg = await send_outbound(PRIORITY_INTERACTIVE, message.chat.id, lambda: message.reply(
+                        "⚠️ Please provide a positive number of seconds"))
+                    asyncio.create_task(delete_message_after_delay(message.bot, error_msg, 5))
+                    asyncio.create_task(delete_message_after_delay(message.bot, message, 5))
                     return
 
                 new_interval = seconds
 
             else:
-                error_msg = await message.reply(
+                error_msg = await send_outbound(PRIORITY_INTERACTIVE, message.chat.id, lambda: message.reply(
                     "⚠️ Please provide a valid number, 'default', 'true', or use 'x' prefix for minutes (e.g., 'x10' for 10 minutes). Example: `/set_repeat 300`, `/set_repeat x5`, or `/set_repeat default`"
-                )
-                await asyncio.sleep(5)
-                await error_msg.delete()
-                await message.delete()
+                ))
+                asyncio.create_task(delete_message_after_delay(message.bot, error_msg, 5))
+                asyncio.create_task(delete_message_after_delay(message.bot, message, 5))
                 return
 
             # Save the new interval and enable repeat notifications
-            storage["repeat_interval"] = new_interval
-            ENABLE_REPEAT_NOTIFICATION = True
+            await apply_state(_enable_repeat, new_interval)
             print(f"Repeat notification state: Enabled")
             print(f"Repeat interval set to: {new_interval} seconds ({format_time(new_interval)})")
 
-            # Check if there's an active countdown
-            if CHAT_ID in storage["active_countdown_tasks"]:
-                # Cancel the existing task
-                storage["active_countdown_tasks"][CHAT_ID].cancel()
-                storage["active_countdown_tasks"].pop(CHAT_ID, None)
-
-                # Update the current message with the new countdown if there's an active notification
-                if storage["latest_notification"]["message_id"]:
-                    message_id = storage["latest_notification"]["message_id"]
-                    number = storage["latest_notification"]["number"]
-                    flag_url = storage["latest_notification"]["flag_url"]
-                    site_id = storage["latest_notification"].get(
-                        "site_id", "site_1")
-
-                    # Update the message with the new countdown
-                    current_message = (
-                        f"🎁 *New Number Added* 🎁\n\n"
-                        f"`+{number}` check it out! 💖\n\n"
-                        f"⏱ Next notification in: *{format_time(new_interval)}*"
-                    )
+            # Restart the reminders and running countdowns with the new interval
+            await repeat_scheduler.reschedule_all(new_interval)
+            if countdown_ticker.active_sites():
+                try:
+                    await restart_countdowns(message.bot, new_interval)
+                except Exception as e:
+                    print(
+                        f"Error updating message with new countdown: {e}")
 
-                    try:
-                        await message.bot.edit_message_caption(
-                            chat_id=CHAT_ID,
-                            message_id=message_id,
-                            caption=current_message,
-                            parse_mode="Markdown",
-                            reply_markup=get_buttons(number, site_id=site_id))
-
-                        # Create a new countdown task with the updated interval
-                        countdown_task = asyncio.create_task(
-                            update_message_with_countdown(
-                                message.bot, message_id, number, flag_url,
-                                site_id))
-                        storage["active_countdown_tasks"][
-                            CHAT_ID] = countdown_task
-                    except Exception as e:
-                        print(
-                            f"Error updating message with new countdown: {e}")
-
-            await message.delete()
+            await send_outbound(PRIORITY_COSMETIC, message.chat.id, message.delete)
 
         else:
-            error_msg = await message.reply(
+            error_msg = await send_outbound(PRIORITY_INTERACTIVE, message.chat.id, lambda: message.reply(
                 "⚠️ Please provide a number of seconds, minutes with 'x' prefix (e.g., 'x10'), or 'default'. Example: `/set_repeat 300`, `/set_repeat x5`, or `/set_repeat default`"
-            )
-            await asyncio.sleep(5)
-            await error_msg.delete()
-            await message.delete()
+            ))
+            asyncio.create_task(delete_message_after_delay(message.bot, error_msg, 5))
+            asyncio.create_task(delete_message_after_delay(message.bot, message, 5))
     except Exception as e:
         print(f"Error in set_repeat_interval: {e}")
-        error_msg = await message.reply(
-            "⚠️ An error occurred. Please try again.")
-        await asyncio.sleep(5)
-        await error_msg.delete()
-        await message.delete()
+        note_handler_error(e)
+        error_msg = await send_outbound(PRIORITY_INTERACTIVE, message.chat.id, lambda: message.reply(
+            "⚠️ An error occurred. Please try again."))
+        asyncio.create_task(delete_message_after_delay(message.bot, error_msg, 5))
+        await send_outbound(PRIORITY_COSMETIC, message.chat.id, message.delete)
 
 
 async def stop_repeat_notification(message: Message):
-    global ENABLE_REPEAT_NOTIFICATION
-    ENABLE_REPEAT_NOTIFICATION = False
-
-    if CHAT_ID in storage["active_countdown_tasks"]:
-        storage["active_countdown_tasks"][CHAT_ID].cancel()
-        storage["active_countdown_tasks"].pop(CHAT_ID, None)
+    # Stop all reminders and countdowns and forget them so they are not resumed after a restart
+    await apply_state(_stop_repeat)
+    await repeat_scheduler.cancel_all()
+    countdown_ticker.cancel_all()
 
     try:
-        if storage["latest_notification"]["message_id"]:
+        if storage["latest_notification"]["message_id"] and not storage["latest_notification"].get("digest"):
             number = storage["latest_notification"]["number"]
             basic_message = f"🎁 *New Number Added* 🎁\n\n`+{number}` check it out! 💖"
 
-            await message.bot.edit_message_caption(
-                chat_id=CHAT_ID,
-                message_id=storage["latest_notification"]["message_id"],
-                caption=basic_message,
-                parse_mode="Markdown",
-                reply_markup=get_buttons(number))
+            await edit_message_caption(
+                message.bot,
+                CHAT_ID,
+                storage["latest_notification"]["message_id"],
+                basic_message,
+                reply_markup=get_buttons(number),
+                parse_mode="Markdown")
     except Exception as e:
         print(f"Error removing countdown from notification: {e}")
 
-    await message.delete()
+    await send_outbound(PRIORITY_COSMETIC, message.chat.id, message.delete)
+
+
+def is_admin(message: Message):
+    """True if the message comes from CHAT_ID or ADMIN_IDS, as the chat or as the sending user"""
+    allowed = ADMIN_IDS | ({str(CHAT_ID)} if CHAT_ID else set())
+    user_id = str(message.from_user.id) if message.from_user else None
+    return str(message.chat.id) in allowed or user_id in allowed
+
+
+def parse_site_ids(args):
+    """Parse '/subscribe site_1 2 USA' style arguments into known site_ids; None if one is unknown"""
+    site_ids = []
+    for arg in (args or "").replace(",", " ").split():
+        site_id = site_registry.resolve(arg)
+        if site_id is None:
+            return None
+        site_ids.append(site_id)
+    return site_ids
+
+
+def describe_subscription(chat_id):
+    if chat_id not in subscriptions:
+        return "This chat receives no notifications."
+    sites = subscriptions.sites_of(chat_id)
+    if sites is None:
+        return "This chat receives notifications of all sites."
+    names = ", ".join(f"{site_id} ({site_registry.name(site_id)})"
+                      for site_id in sorted(sites) if site_id in storage["websites"])
+    return f"This chat receives notifications of: {names}"
+
+
+async def subscribe_chat(message: Message, command: CommandObject):
+    """Subscribe the chat to all sites, or to the sites given as arguments"""
+    site_ids = parse_site_ids(command.args)
+    if site_ids is None:
+        reply = f"⚠️ Unknown site. Available sites: {', '.join(storage['websites'])}"
+    else:
+        subscriptions.subscribe(message.chat.id, site_ids)
+        save_subscriptions()
+        reply = f"✅ {describe_subscription(message.chat.id)}"
+    await send_outbound(PRIORITY_INTERACTIVE, message.chat.id, lambda: message.reply(reply))
+
+
+async def unsubscribe_chat(message: Message, command: CommandObject):
+    """Unsubscribe the chat from all sites, or from the sites given as arguments"""
+    site_ids = parse_site_ids(command.args)
+    if site_ids is None:
+        reply = f"⚠️ Unknown site. Available sites: {', '.join(storage['websites'])}"
+    else:
+        subscriptions.unsubscribe(message.chat.id, site_ids)
+        save_subscriptions()
+        reply = f"🔕 {describe_subscription(message.chat.id)}"
+    await send_outbound(PRIORITY_INTERACTIVE, message.chat.id, lambda: message.reply(reply))
+
+
+async def send_stats(message: Message):
+    """Reply with handler latency, error and API call counts and the delivery pipeline counters"""
+    await send_outbound(PRIORITY_INTERACTIVE, message.chat.id,
+                        lambda: message.reply(render_stats(), parse_mode="Markdown"))
+
+
+async def send_status(message: Message, command: CommandObject):
+    """Reply with the status of every site; "/status pin" keeps a pinned copy up to date, "/status unpin" stops it"""
+    args = (command.args or "").lower().strip()
+    if args in ("pin", "unpin") and not is_admin(message):
+        await send_outbound(PRIORITY_INTERACTIVE, message.chat.id, lambda: message.reply("⚠️ Only admins can pin the status dashboard."))
+        return
+    if args == "pin":
+        await status_board.pin(message.bot, message.chat.id)
+        return
+    if args == "unpin":
+        reply = "📌 Status dashboard unpinned." if await status_board.unpin(message.chat.id) else "No status dashboard is pinned in this chat."
+        await send_outbound(PRIORITY_INTERACTIVE, message.chat.id, lambda: message.reply(reply))
+        return
+    text = status_board.render()
+    await send_outbound(PRIORITY_INTERACTIVE, message.chat.id, lambda: message.reply(text, parse_mode="HTML"))
 
 
 async def send_startup_message(bot):
     if CHAT_ID:
         try:
-            await bot.send_message(CHAT_ID, text="At Your Service 🍒🍄")
+            await send_outbound(PRIORITY_INTERACTIVE, CHAT_ID, lambda: bot.send_message(CHAT_ID, text="At Your Service 🍒🍄"))
         except Exception as e:
             print(f"⚠️ Failed to send startup message: {e}")
 
-
-# --- Universal Site ID Extraction Helper ---
-def extract_valid_site_id(callback_query):
-    parts = callback_query.data.split("_")
-    print(f"Parts: {parts}")
-    # Try to extract a valid site_id from callback data
-    for i in range(len(parts)-1, 0, -1):
-        candidate = "_".join(parts[i:])
-        if candidate in storage["websites"]:
-            return candidate
-    # Fallback: first available site_id in storage
-    if storage["websites"]:
-        return next(iter(storage["websites"]))
-    return None
\ No newline at end of file
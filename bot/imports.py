@@ -19,22 +19,35 @@ from aiogram.client.default import DefaultBotProperties
 from bot.config import CHAT_ID, ENABLE_REPEAT_NOTIFICATION, DEFAULT_REPEAT_INTERVAL
 
 # Storage functions used across modules
-from bot.storage import storage, save_website_data, save_last_number
+from bot.storage import storage
+from bot.state_actor import save_website_data, save_last_number, save_runtime_state
 
 # UI and utility functions used across modules
 from bot.utils import format_time, delete_message_after_delay, parse_website_content, fetch_url_content
 
 # Notification functions used across modules
-from bot.notifications import get_buttons, get_multiple_buttons, add_countdown_to_latest_notification, update_message_with_countdown, send_notification
+from bot.notifications import get_buttons, get_multiple_buttons, add_countdown_to_latest_notification, update_message_with_countdown, send_notification, queue_notification, resume_countdowns, resume_outbox, resume_repeat_notifications
 
 # Additional monitoring imports
-from bot.monitoring import WebsiteMonitor, monitor_websites
+from bot.monitoring import WebsiteMonitor, monitor_websites, site_poller
+
+# Status dashboard
+from bot.status import status_board
+
+# Site registry
+from bot.sites import site_registry
+
+# Webhook delivery
+from bot.webhook import start_webhook, create_webhook_app, ALLOWED_UPDATES
+
+# Instrumentation
+from bot.metrics import count_api_calls, start_metrics_server
 
 # Handler functions
 from bot.handlers import register_handlers, send_startup_message
 
 # Additional config constants
-from bot.config import TELEGRAM_BOT_TOKEN, load_website_configs
+from bot.config import TELEGRAM_BOT_TOKEN, WEBHOOK_URL, WEBHOOK_HOST, METRICS_HOST, METRICS_PORT, TELEGRAM_API_URL, load_website_configs
 
 # Additional storage functions
 from bot.storage import load_website_data
@@ -0,0 +1,216 @@
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+from aiogram import BaseMiddleware
+from aiohttp import web
+from bot.outbound import outbound_queue, render_cache
+from bot.outbox import outbox
+from bot.subscriptions import subscriptions
+from bot.middlewares import debounce_middleware
+
+# Upper bounds of the latency histogram buckets, in seconds; the last bucket is unbounded
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Handler the running code works for; Bot API calls made from it (or from tasks it starts) are charged to it
+current_handler = ContextVar("current_handler", default=None)
+
+
+class HandlerRun:
+    """One handler invocation; the callback router renames it to the handler it dispatches to"""
+
+    __slots__ = ("name", "error")
+
+    def __init__(self, name):
+        self.name = name
+        self.error = None
+
+
+class HandlerStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.api_calls = Counter()
+
+    def observe(self, seconds, failed):
+        self.count += 1
+        self.errors += failed
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile, or None without samples"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS + (self.max,), self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class HandlerMetrics:
+    """Latency histogram, error count and Bot API calls per handler"""
+
+    def __init__(self):
+        self.handlers = {}
+
+    def stats(self, name):
+        stats = self.handlers.get(name)
+        if stats is None:
+            stats = self.handlers[name] = HandlerStats()
+        return stats
+
+    def observe(self, name, seconds, failed=False):
+        self.stats(name).observe(seconds, failed)
+
+    def record_api_call(self, method):
+        run = current_handler.get()
+        self.stats(run.name if run else "background").api_calls[method] += 1
+
+    def snapshot(self):
+        return {
+            name: {
+                "count": stats.count,
+                "errors": stats.errors,
+                "avg_ms": stats.total / stats.count * 1000 if stats.count else 0.0,
+                "p95_ms": (stats.quantile(0.95) or 0) * 1000,
+                "max_ms": stats.max * 1000,
+                "api_calls": dict(stats.api_calls)
+            }
+            for name, stats in self.handlers.items()
+        }
+
+    def render_prometheus(self):
+        lines = []
+        for name, stats in sorted(self.handlers.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), stats.buckets):
+                cumulative += count
+                lines.append(f'bot_handler_seconds_bucket{{handler="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'bot_handler_seconds_sum{{handler="{name}"}} {stats.total:.6f}')
+            lines.append(f'bot_handler_seconds_count{{handler="{name}"}} {stats.count}')
+            lines.append(f'bot_handler_errors_total{{handler="{name}"}} {stats.errors}')
+            for method, count in sorted(stats.api_calls.items()):
+                lines.append(f'bot_api_calls_total{{handler="{name}",method="{method}"}} {count}')
+        return lines
+
+
+handler_metrics = HandlerMetrics()
+
+
+def rename_current_handler(name):
+    """Charge the running invocation to name, e.g. the handler a dispatcher forwarded it to"""
+    run = current_handler.get()
+    if run is not None:
+        run.name = name
+
+
+def note_handler_error(error):
+    """Count an exception a handler caught and reported itself as a failed invocation"""
+    run = current_handler.get()
+    if run is not None:
+        run.error = error
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Inner middleware timing each handler and recording whether it failed"""
+
+    async def __call__(self, handler, event, data):
+        callback = getattr(data.get("handler"), "callback", None)
+        run = HandlerRun(getattr(callback, "__name__", type(event).__name__))
+        token = current_handler.set(run)
+        started = time.perf_counter()
+        try:
+            result = await handler(event, data)
+        except Exception as e:
+            run.error = e
+            raise
+        finally:
+            handler_metrics.observe(run.name, time.perf_counter() - started, run.error is not None)
+            current_handler.reset(token)
+        return result
+
+
+async def count_api_calls(make_request, bot, method):
+    """Bot session middleware counting every API request against the handler it is made for"""
+    handler_metrics.record_api_call(type(method).__name__)
+    return await make_request(bot, method)
+
+
+metrics_middleware = MetricsMiddleware()
+
+
+def collect_metrics():
+    """Everything /stats and the metrics endpoint report, as plain data"""
+    # Imported here: notifications imports the callback router, which imports this module
+    from bot.notifications import keyboard_cache
+    return {
+        "handlers": handler_metrics.snapshot(),
+        "outbound": outbound_queue.metrics(),
+        "edits_skipped": render_cache.skipped,
+        "keyboard_cache": {"hits": keyboard_cache.hits, "misses": keyboard_cache.misses},
+        "debounced_taps": debounce_middleware.dropped,
+        "dead_letters": len(outbox.dead_letters),
+        "delivery_latency": subscriptions.latency_metrics()
+    }
+
+
+def render_stats():
+    """Human-readable summary for the /stats command"""
+    data = collect_metrics()
+    lines = ["📊 *Bot stats*", "", "*Handlers* (calls, p95, max, errors, API calls)"]
+    for name, stats in sorted(data["handlers"].items(), key=lambda item: -item[1]["count"]):
+        api_calls = sum(stats["api_calls"].values())
+        lines.append(f"`{name}`: {stats['count']}, {stats['p95_ms']:.0f}ms, {stats['max_ms']:.0f}ms, "
+                     f"{stats['errors']} err, {api_calls} api")
+    outbound = data["outbound"]
+    lines += [
+        "",
+        f"*Outbound*: queued {sum(outbound['depth'].values())}, in flight {outbound['in_flight']}, "
+        f"RetryAfter {outbound['retry_after']}",
+        f"*Edits skipped*: {data['edits_skipped']}",
+        f"*Keyboard cache*: {data['keyboard_cache']['hits']} hits, {data['keyboard_cache']['misses']} misses",
+        f"*Debounced taps*: {data['debounced_taps']}",
+        f"*Undeliverable notifications*: {data['dead_letters']}"
+    ]
+    for chat_id, latency in data["delivery_latency"].items():
+        lines.append(f"*Delivery to {chat_id}*: avg {latency['avg_ms']:.0f}ms, max {latency['max_ms']:.0f}ms")
+    return "\n".join(lines)
+
+
+def render_prometheus():
+    data = collect_metrics()
+    lines = handler_metrics.render_prometheus()
+    for priority, depth in data["outbound"]["depth"].items():
+        lines.append(f'bot_outbound_queue_depth{{priority="{priority}"}} {depth}')
+    lines.append(f"bot_outbound_retry_after_total {data['outbound']['retry_after']}")
+    lines.append(f"bot_edits_skipped_total {data['edits_skipped']}")
+    lines.append(f"bot_keyboard_cache_hits_total {data['keyboard_cache']['hits']}")
+    lines.append(f"bot_keyboard_cache_misses_total {data['keyboard_cache']['misses']}")
+    lines.append(f"bot_debounced_taps_total {data['debounced_taps']}")
+    lines.append(f"bot_outbox_dead_letters {data['dead_letters']}")
+    for chat_id, latency in data["delivery_latency"].items():
+        lines.append(f'bot_delivery_latency_avg_ms{{chat="{chat_id}"}} {latency["avg_ms"]:.1f}')
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_endpoint(request):
+    return web.Response(text=render_prometheus(), content_type="text/plain")
+
+
+async def start_metrics_server(host, port):
+    """Serve /metrics on its own listener, apart from the public webhook app"""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_endpoint)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Serving metrics on {host}:{port}/metrics")
+    return runner
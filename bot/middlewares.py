@@ -0,0 +1,91 @@
+import time
+import asyncio
+from collections import OrderedDict
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+from bot.config import CALLBACK_DEBOUNCE_WINDOW, CHAT_HANDLER_CONCURRENCY
+
+
+def event_chat_id(event):
+    """Chat an update belongs to, or None"""
+    message = event.message if isinstance(event, CallbackQuery) else event
+    chat = getattr(message, "chat", None)
+    return chat.id if chat else None
+
+
+class DebounceMiddleware(BaseMiddleware):
+    """
+    Drop repeated taps on the same button.
+
+    A callback with the same (user, message, callback data) as one accepted less than window seconds
+    ago, or one whose handler is still running, is answered silently and not handled again.
+    """
+
+    def __init__(self, window=CALLBACK_DEBOUNCE_WINDOW):
+        self.window = window
+        self._accepted = OrderedDict()  # key -> time accepted, oldest first
+        self._running = set()
+        self.dropped = 0
+
+    @staticmethod
+    def _key(callback_query):
+        message = callback_query.message
+        target = (message.chat.id, message.message_id) if message else callback_query.inline_message_id
+        return (callback_query.from_user.id, target, callback_query.data)
+
+    async def __call__(self, handler, event, data):
+        key = self._key(event)
+        now = time.monotonic()
+        # Forget taps older than the window
+        while self._accepted and next(iter(self._accepted.values())) <= now - self.window:
+            self._accepted.popitem(last=False)
+
+        if key in self._running or key in self._accepted:
+            self.dropped += 1
+            try:
+                await event.answer()
+            except Exception:
+                pass
+            return None
+
+        self._accepted[key] = now
+        self._running.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._running.discard(key)
+
+
+class ChatConcurrencyMiddleware(BaseMiddleware):
+    """Let at most limit handlers run at once per chat; further updates of that chat wait their turn"""
+
+    def __init__(self, limit=CHAT_HANDLER_CONCURRENCY):
+        self.limit = limit
+        self._slots = {}  # chat_id -> [semaphore, users]
+
+    async def __call__(self, handler, event, data):
+        chat_id = event_chat_id(event)
+        if chat_id is None:
+            return await handler(event, data)
+
+        slot = self._slots.setdefault(chat_id, [asyncio.Semaphore(self.limit), 0])
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                return await handler(event, data)
+        finally:
+            slot[1] -= 1
+            if not slot[1]:
+                # Idle chats do not keep a semaphore around
+                del self._slots[chat_id]
+
+
+debounce_middleware = DebounceMiddleware()
+chat_concurrency_middleware = ChatConcurrencyMiddleware()
+
+
+def register_middlewares(dp):
+    """Install the middlewares; debouncing runs first so dropped taps never wait for a slot"""
+    dp.callback_query.outer_middleware(debounce_middleware)
+    dp.callback_query.outer_middleware(chat_concurrency_middleware)
+    dp.message.outer_middleware(chat_concurrency_middleware)
@@ -1,8 +1,80 @@
+import time
 import asyncio
+from collections import deque
+from itertools import islice
 from typing import Dict, Any, List, Optional, Union, Tuple
-from bot.storage import storage, save_website_data, load_website_data
+from bot.storage import storage, load_website_data
 from bot.utils import parse_website_content, fetch_url_content
-from bot.config import CHECK_INTERVAL
+from bot.config import CHECK_INTERVAL, LATEST_NUMBERS_DEPTH, REFRESH_TIMEOUT, DEFAULT_REPEAT_INTERVAL
+from bot.notifications import resume_countdowns, resume_outbox, resume_repeat_notifications
+from bot.seen import restore_seen_numbers, record_seen_numbers
+from bot.flags import restore_flag_file_ids
+from bot.state_actor import state_actor, apply_state, SITE_POLLED
+from bot.outbox import outbox, OUTBOX_SECTION
+from bot.subscriptions import restore_subscriptions
+from bot.status import status_board
+
+class RecentNumbers:
+    """
+    Fixed-capacity ring buffer of a website's most recent numbers, newest first.
+
+    Memory and persisted size stay bounded by depth however long the origin's list is.
+    """
+
+    def __init__(self, depth: int = LATEST_NUMBERS_DEPTH, numbers: Optional[List[str]] = None):
+        self._ring = deque(maxlen=max(1, depth))
+        if numbers:
+            self.sync(numbers)
+
+    def push(self, number: str):
+        """Add a number as the newest one, dropping the oldest once full (O(1))"""
+        self._ring.appendleft(number)
+
+    def sync(self, numbers: List[str]):
+        """Make the buffer mirror the first depth numbers of a listing (newest first)"""
+        numbers = list(islice(numbers, self._ring.maxlen))
+        if self._ring:
+            # Common case: the origin only added numbers at the top, so push just those
+            try:
+                head_position = numbers.index(self._ring[0])
+            except ValueError:
+                head_position = -1
+            kept = len(numbers) - head_position
+            if (head_position >= 0 and kept <= len(self._ring)
+                    and numbers[head_position:] == list(islice(self._ring, kept))):
+                for number in reversed(numbers[:head_position]):
+                    self.push(number)
+                while len(self._ring) > len(numbers):
+                    self._ring.pop()
+                return
+        self._ring.clear()
+        self._ring.extend(numbers)
+
+    def to_list(self) -> List[str]:
+        return list(self._ring)
+
+    def __len__(self):
+        return len(self._ring)
+
+    def __iter__(self):
+        return iter(self._ring)
+
+    def __getitem__(self, index):
+        return self._ring[index]
+
+    def __eq__(self, other):
+        if isinstance(other, RecentNumbers):
+            other = other._ring
+        try:
+            return len(self._ring) == len(other) and all(a == b for a, b in zip(self._ring, other))
+        except TypeError:
+            return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"RecentNumbers({self.to_list()!r})"
+
 
 class WebsiteMonitor:
     def __init__(self, site_id: str, config: Dict[str, Any]):
@@ -11,10 +83,19 @@ class WebsiteMonitor:
         self.type = config.get("type")
         self.enabled = config["enabled"]
         self.position = config.get("position", 1)  # Position determines UI layout
-        self.latest_numbers = []
+        self._latest_numbers = RecentNumbers()
         self.last_number = None
         self.flag_url = None
 
+    @property
+    def latest_numbers(self) -> RecentNumbers:
+        """Most recent numbers of a multiple type website, bounded by LATEST_NUMBERS_DEPTH"""
+        return self._latest_numbers
+
+    @latest_numbers.setter
+    def latest_numbers(self, numbers: Optional[List[str]]):
+        self._latest_numbers.sync(numbers or [])
+
     async def fetch_content(self) -> Optional[str]:
         """Fetch content from the website"""
         return await fetch_url_content(self.url)
@@ -28,10 +109,27 @@ class WebsiteMonitor:
         return await parse_website_content(self.url, self.type)
 
     async def process_update(self, new_data: Union[int, List[str]], flag_url: Optional[str]) -> bool:
-        """Process updates and return True if notification should be sent"""
+        """
+        Process updates and return True if notification should be sent.
+
+        Mutates the monitor, so it must run on the state actor (see commit_update), which also saves it.
+        """
+        should_notify = await self._apply_update(new_data, flag_url)
+        if should_notify:
+            # Origins rotate old numbers back to the top; don't announce numbers we already announced
+            numbers = self.latest_numbers if self.type == "multiple" else [self.last_number]
+            should_notify = await record_seen_numbers(self.site_id, numbers)
+        return should_notify
+
+    async def _apply_update(self, new_data: Union[int, List[str]], flag_url: Optional[str]) -> bool:
+        """Apply new website data to the monitor state and return True if it changed in a notifiable way"""
         if not new_data:
             return False
 
+        if self.flag_url is None and flag_url:
+            # State saved without a flag (older state files); repeat reminders need it
+            self.flag_url = flag_url
+
         # Dynamic type detection
         if self.type is None:
             if isinstance(new_data, list) and len(new_data) > 1:
@@ -58,25 +156,24 @@ class WebsiteMonitor:
                 # First run - save number and notify
                 self.last_number = new_number
                 self.flag_url = flag_url
-                await save_website_data(self.site_id)
                 return True  # Send notification on first run
             elif new_number != self.last_number:
                 # Number has changed - update and notify
                 self.last_number = new_number
                 self.flag_url = flag_url
-                await save_website_data(self.site_id)
                 return True
             return False
         else:
-            # For multiple numbers website
+            # For multiple numbers website; only the most recent numbers are kept
+            if isinstance(new_data, list):
+                new_data = new_data[:LATEST_NUMBERS_DEPTH]
             if not self.latest_numbers:
                 # First run - 1. Get all numbers from website
                 if new_data:
                     # 2. Pick the first (0th index) element to be the candidate for notification, but DO NOT update last_number yet
                     first_num = new_data[0]
-                    self.latest_numbers = new_data.copy()
+                    self.latest_numbers = new_data
                     self.flag_url = flag_url
-                    await save_website_data(self.site_id)
                     # 3. Return True to send initial notification with candidate number (not updating last_number)
                     return True
                 return False
@@ -92,25 +189,21 @@ class WebsiteMonitor:
                         # The last_number is no longer at position 0: notify user, but DO NOT update last_number yet
                         self.latest_numbers = new_data
                         self.flag_url = flag_url
-                        await save_website_data(self.site_id)
                         return True
                     elif last_number_position == 0:
                         # last_number is still at position 0: update latest_numbers, no notification
                         self.latest_numbers = new_data
                         self.flag_url = flag_url
-                        await save_website_data(self.site_id)
                         return False
                     else:
                         # last_number not found in new_data: treat as first run/notify, but DO NOT update last_number yet
                         self.latest_numbers = new_data
                         self.flag_url = flag_url
-                        await save_website_data(self.site_id)
                         return True
                 else:
                     # No last_number: treat as first run/notify, but DO NOT update last_number yet
                     self.latest_numbers = new_data
                     self.flag_url = flag_url
-                    await save_website_data(self.site_id)
                     return True
 
         return False
@@ -126,16 +219,137 @@ class WebsiteMonitor:
             }
         else:
             return {
-                "numbers": self.latest_numbers,
+                "numbers": self.latest_numbers.to_list(),
                 "flag_url": self.flag_url,
                 "site_id": self.site_id,
                 "url": self.url
             }
 
+async def commit_update(website: WebsiteMonitor, new_data: Union[int, List[str]], flag_url: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Apply fetched data through the state actor; returns the notification data if one should be sent"""
+    async def apply_update():
+        before = (website.type, website.last_number, website.latest_numbers.to_list(), website.flag_url)
+        should_notify = await website.process_update(new_data, flag_url)
+        if (website.type, website.last_number, website.latest_numbers.to_list(), website.flag_url) != before:
+            # Only write the state file when the poll actually changed something
+            state_actor.mark_dirty(website.site_id)
+        if should_notify:
+            # Snapshot while we still own the state so a concurrent handler can't change it underneath
+            notification_data = website.get_notification_data()
+            # Queued now and saved in the same write as the site, so the alert can't be lost
+            if outbox.queue(notification_data):
+                state_actor.mark_section_dirty(OUTBOX_SECTION, outbox.to_section)
+            return notification_data
+        return None
+
+    return await apply_state(apply_update, event=SITE_POLLED)
+
+class SitePoller:
+    """
+    Fetches a website and applies what it finds, one fetch per site at a time.
+
+    The monitor loop and the Update button both go through poll(): a request for a site whose fetch
+    is already running waits for that fetch instead of starting another, so a refresh never doubles
+    the load on the origin and sees the same result the sweep does.
+    """
+
+    def __init__(self):
+        self._in_flight = {}  # site_id -> task fetching and applying that site
+        self._background = set()  # Refreshes started by refresh_soon
+        self.send_notification = None  # Set by monitor_websites
+        self.coalesced = 0
+
+    def is_polling(self, site_id):
+        return site_id in self._in_flight
+
+    def start(self, website: WebsiteMonitor) -> asyncio.Task:
+        """Fetch the site now, or join the fetch already running; returns the shared task"""
+        task = self._in_flight.get(website.site_id)
+        if task is not None:
+            self.coalesced += 1
+            return task
+        task = asyncio.create_task(self._poll(website))
+        self._in_flight[website.site_id] = task
+        task.add_done_callback(lambda done: self._in_flight.pop(website.site_id, None))
+        return task
+
+    async def poll(self, website: WebsiteMonitor, scheduled: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Fetch and apply the site; returns the notification data if one was sent. Only scheduled polls,
+        those of the monitor loop, count towards the site's status.
+        """
+        # Shielded so a cancelled waiter does not cancel the fetch the others are waiting for
+        result = await asyncio.shield(self.start(website))
+        if scheduled:
+            status_board.record_poll(website.site_id, result["started"], result["latency"], result["error"])
+        if isinstance(result["error"], Exception):
+            raise result["error"]
+        return result["notification"]
+
+    async def refresh(self, website: WebsiteMonitor, timeout: float = REFRESH_TIMEOUT) -> bool:
+        """
+        Bring the site up to date for a user waiting on it. Returns False if the fetch failed or took
+        longer than timeout; it then carries on in the background and the last known state stays.
+        """
+        try:
+            await asyncio.wait_for(self.poll(website), timeout)
+            return True
+        except asyncio.TimeoutError:
+            print(f"Refresh of {website.site_id} still running after {timeout}s")
+        except Exception as e:
+            print(f"Error refreshing {website.site_id}: {e}")
+        return False
+
+    def refresh_soon(self, website: WebsiteMonitor, timeout: float = REFRESH_TIMEOUT) -> asyncio.Task:
+        """
+        Refresh the site in the background, e.g. from a handler that must not hold its slot while the
+        origin answers. Returns a task resolving to what refresh() returns.
+        """
+        task = asyncio.create_task(self.refresh(website, timeout))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def _poll(self, website):
+        """Returns the notification data sent, when the fetch started, how long it took and what failed"""
+        started = time.time()
+        try:
+            new_data, flag_url = await website.check_for_updates()
+        except Exception as e:
+            return {"notification": None, "started": started, "latency": time.time() - started, "error": e}
+        latency = time.time() - started
+        notification_data = await commit_update(website, new_data, flag_url)
+        if notification_data and self.send_notification:
+            await self.send_notification(notification_data)
+        return {"notification": notification_data, "started": started, "latency": latency,
+                "error": None if new_data else "no data"}
+
+
+site_poller = SitePoller()
+
 async def monitor_websites(bot, send_notification_func):
     """Monitor all configured websites for updates"""
     # Load saved data for all websites
     await load_website_data()
+    # The repeat setting of the previous run wins over ENABLE_REPEAT_NOTIFICATION
+    if storage["repeat_enabled"] and storage["repeat_interval"] is None:
+        storage["repeat_interval"] = DEFAULT_REPEAT_INTERVAL
+    print(f"Repeat notification status: {'Enabled' if storage['repeat_enabled'] else 'Disabled'}")
+    restore_seen_numbers()
+    restore_flag_file_ids()
+    restore_subscriptions()
+
+    # Reattach to the messages and countdowns from the previous run
+    await resume_countdowns(bot)
+    # Retry notifications that were not delivered before the restart
+    await resume_outbox(bot)
+    # Repeat reminders continue where they left off
+    await resume_repeat_notifications(bot)
+    # Pinned /status dashboards continue too
+    status_board.start(bot)
+
+    # Fresh data fetched for the Update button is announced the same way as a poll's
+    site_poller.send_notification = send_notification_func
 
     consecutive_failures = {site_id: 0 for site_id in storage["websites"]}
     max_consecutive_failures = 5
@@ -155,13 +369,9 @@ async def monitor_websites(bot, send_notification_func):
                 continue
 
             try:
-                # Get initial data
-                new_data, flag_url = await website.check_for_updates()
-                if new_data:
-                    # Save data and send notification for all websites on first run
-                    await website.process_update(new_data, flag_url)
-                    # Send notification for all websites
-                    await send_notification_func(website.get_notification_data())
+                # Get initial data; only websites that have no saved state or whose number changed
+                # are notified, so a restart does not re-send a notification for every website
+                await site_poller.poll(website, scheduled=True)
             except Exception as e:
                 print(f"Error initializing {site_id}: {e}")
 
@@ -171,15 +381,10 @@ async def monitor_websites(bot, send_notification_func):
             if website.enabled and website.url:
                 # print(f"[DEBUG] monitor_websites - checking {site_id} ({website.url}) type={website.type}")
                 try:
-                    new_data, flag_url = await website.check_for_updates()
-                    # print(f"[DEBUG] monitor_websites - parsed new_data for {site_id}: {new_data}, flag_url: {flag_url}")
+                    # Joins the fetch an Update button tap may already have started for this site
+                    await site_poller.poll(website, scheduled=True)
                     consecutive_failures[site_id] = 0
 
-                    # Process the update and send notification if needed
-                    should_notify = await website.process_update(new_data, flag_url)
-                    if should_notify:
-                        await send_notification_func(website.get_notification_data())
-
                 except Exception as e:
                     print(f"Error monitoring {site_id}: {e}")
                     consecutive_failures[site_id] += 1
@@ -0,0 +1,127 @@
+from collections import OrderedDict
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from bot.config import MONITORING_PAGE_SIZE
+from bot.storage import storage
+from bot.sites import site_registry
+from bot.callbacks import pack_callback
+from bot.state_actor import state_actor, SITE_TOGGLED
+
+# Prefix buttons shown per row, and at most two rows of them
+PREFIX_BUTTONS_PER_ROW = 8
+MAX_PREFIX_BUTTONS = 2 * PREFIX_BUTTONS_PER_ROW
+
+
+def next_prefixes(entries, prefix):
+    """Distinct one-character extensions of prefix among the entries' names, in order"""
+    prefixes = []
+    for entry in entries:
+        name = entry.name.lower()
+        if len(name) > len(prefix) and name[len(prefix)].isalnum():
+            extended = name[:len(prefix) + 1]
+            if not prefixes or prefixes[-1] != extended:
+                prefixes.append(extended)
+    return prefixes
+
+
+class MonitoringMenu:
+    """
+    Paginated list of the configured websites with their monitoring status.
+
+    Without a prefix the sites are listed in configuration order; a prefix narrows the list to the
+    sites whose name starts with it, and when the list is longer than a page, buttons for the next
+    letter let the user drill down. Rendered pages are cached until a site is toggled or the site
+    configuration changes.
+    """
+
+    def __init__(self, page_size=MONITORING_PAGE_SIZE, max_entries=256):
+        self.page_size = max(1, page_size)
+        self.max_entries = max_entries
+        self._pages = OrderedDict()  # (origin, prefix, page) -> InlineKeyboardMarkup
+        self._registry_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        self._pages.clear()
+
+    def on_state_change(self, event):
+        if event.get("type") == SITE_TOGGLED:
+            self.invalidate()
+
+    def render(self, origin, page=0, prefix=""):
+        """Keyboard of one page; origin is the site whose settings the back button returns to"""
+        if len(site_registry) != len(storage["websites"]):
+            site_registry.rebuild()
+        if self._registry_version != site_registry.version:
+            self._registry_version = site_registry.version
+            self.invalidate()
+
+        key = (origin, prefix, page)
+        keyboard = self._pages.get(key)
+        if keyboard is not None:
+            self.hits += 1
+            self._pages.move_to_end(key)
+            return keyboard
+
+        self.misses += 1
+        keyboard = self._build(origin, page, prefix)
+        self._pages[key] = keyboard
+        if len(self._pages) > self.max_entries:
+            self._pages.popitem(last=False)
+        return keyboard
+
+    def _build(self, origin, page, prefix):
+        entries = site_registry.search(prefix) if prefix else site_registry.entries()
+        pages = max(1, -(-len(entries) // self.page_size))
+        page = min(max(page, 0), pages - 1)
+        buttons = []
+        current_row = []
+
+        for entry in entries[page * self.page_size:(page + 1) * self.page_size]:
+            website = storage["websites"][entry.site_id]
+            # Show "Disabled" text for disabled sites
+            display_name = entry.name if website.enabled else f"{entry.name} : Disabled"
+            current_row.append(
+                InlineKeyboardButton(
+                    text=display_name,
+                    callback_data=pack_callback("toggle_site", entry.site_id, page, prefix, origin)))
+
+            # When we have 2 buttons in the row, add it to buttons and start a new row
+            if len(current_row) == 2:
+                buttons.append(current_row)
+                current_row = []
+
+        # Add any remaining buttons if we have an odd number
+        if current_row:
+            buttons.append(current_row)
+
+        if pages > 1:
+            # Narrow a long list down by the next letter of the name
+            prefixes = next_prefixes(site_registry.search(prefix), prefix)[:MAX_PREFIX_BUTTONS]
+            for i in range(0, len(prefixes), PREFIX_BUTTONS_PER_ROW):
+                buttons.append([
+                    InlineKeyboardButton(text=extended.upper(), callback_data=pack_callback("monitoring", origin, 0, extended))
+                    for extended in prefixes[i:i + PREFIX_BUTTONS_PER_ROW]
+                ])
+
+            navigation = []
+            if page > 0:
+                navigation.append(InlineKeyboardButton(text="« Prev", callback_data=pack_callback("monitoring", origin, page - 1, prefix)))
+            navigation.append(InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data="none"))
+            if page < pages - 1:
+                navigation.append(InlineKeyboardButton(text="Next »", callback_data=pack_callback("monitoring", origin, page + 1, prefix)))
+            buttons.append(navigation)
+
+        if prefix:
+            buttons.append([InlineKeyboardButton(text="✖ All sites", callback_data=pack_callback("monitoring", origin))])
+
+        # Add back button
+        buttons.append([
+            InlineKeyboardButton(text="« Back to Settings",
+                                 callback_data=pack_callback("settings", origin))
+        ])
+        return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+monitoring_menu = MonitoringMenu()
+state_actor.add_listener(monitoring_menu.on_state_change)
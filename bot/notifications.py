@@ -1,8 +1,53 @@
-import os, asyncio
+import time, asyncio
+from collections import OrderedDict
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from bot.storage import storage
-from bot.config import CHAT_ID, ENABLE_REPEAT_NOTIFICATION
-from bot.utils import get_base_url, format_phone_number
+from bot.storage import storage, runtime_state, RUNTIME_SECTION
+from bot.config import CHAT_ID, NOTIFICATION_COALESCE_WINDOW, FANOUT_CONCURRENCY
+from bot.utils import format_phone_number, format_time
+from bot.sites import site_registry
+from bot.countdown import countdown_ticker
+from bot.outbound import send_outbound, render_cache, PRIORITY_ALERT
+from bot.flags import send_flag_photo, flag_file_ids, local_flag_for_number, flag_emoji
+from bot.outbox import outbox
+from bot.subscriptions import subscriptions
+from bot.repeat import repeat_scheduler
+from bot.state_actor import state_actor, save_runtime_state
+from bot.callbacks import pack_callback
+
+class KeyboardCache:
+    """
+    LRU cache of rendered keyboards, keyed by everything that shows on them.
+
+    Countdown ticks and button taps re-render the same keyboard over and over; with the cache they
+    get the already built InlineKeyboardMarkup back. Entries of a site are dropped when the state
+    actor reports a change to it.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, build):
+        keyboard = self._entries.get(key)
+        if keyboard is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return keyboard
+        self.misses += 1
+        keyboard = self._entries[key] = build()
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return keyboard
+
+    def invalidate(self, site_id):
+        for key in [key for key in self._entries if key[0] == site_id]:
+            del self._entries[key]
+
+
+keyboard_cache = KeyboardCache()
+state_actor.add_listener(lambda event: keyboard_cache.invalidate(event["site_id"]))
 
 def create_unified_keyboard(data, website=None):
     """
@@ -55,7 +100,7 @@ def create_unified_keyboard(data, website=None):
     
     # Ensure we have a valid URL
     if not url:
-        url = get_base_url() or ""
+        url = site_registry.url(site_id) or ""
     
     # Create buttons based on website type
     if website_type == "single":
@@ -63,95 +108,102 @@ def create_unified_keyboard(data, website=None):
         if not number and website and hasattr(website, "last_number"):
             number = website.last_number
         
-        # Format the number with proper country code spacing
-        formatted_number = format_phone_number(number)
-        
-        # Update button text based on state
-        update_text = "✅ Updated Number" if updated else "🔄 Update Number"
-        # print(f"[DEBUG] create_unified_keyboard - single type update_text: {update_text}")
-        
-        # Create the keyboard for single type
+        key = (site_id, "single", str(number), updated, False, url)
+        return keyboard_cache.get_or_build(key, lambda: build_single_keyboard(site_id, number, updated, url))
+    else:  # Multiple type
+        numbers = data.get("numbers", [])
+        if not numbers and website:
+            if hasattr(website, "latest_numbers") and website.latest_numbers:
+                numbers = website.latest_numbers
+            elif hasattr(website, "last_number") and website.last_number:
+                numbers = [website.last_number]
+
+        key = (site_id, "multiple", tuple(str(number) for number in numbers), updated, bool(is_initial_run), url)
+        return keyboard_cache.get_or_build(key, lambda: build_multiple_keyboard(site_id, list(numbers), updated, is_initial_run, url))
+
+def build_single_keyboard(site_id, number, updated, url):
+    """Build the keyboard of a single type site"""
+    # Update button text based on state
+    update_text = "✅ Updated Number" if updated else "🔄 Update Number"
+    # print(f"[DEBUG] create_unified_keyboard - single type update_text: {update_text}")
+
+    # Create the keyboard for single type
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text="📋 Copy Number", callback_data=pack_callback("copy", number, site_id)),
+                InlineKeyboardButton(text=update_text, callback_data=pack_callback("update", number, site_id))
+            ],
+            [
+                InlineKeyboardButton(text="🔪 Split", callback_data=pack_callback("split", number, site_id)),
+                InlineKeyboardButton(text="⚙️ Settings", callback_data=pack_callback("settings", site_id))
+            ],
+            [
+                InlineKeyboardButton(text="🌐 Visit Webpage", url=f"{url}/number/{number}" if number else url)
+            ]
+        ]
+    )
+
+def build_multiple_keyboard(site_id, numbers, updated, is_initial_run, url):
+    """Build the keyboard of a multiple type site"""
+    # Update button text based on state
+    update_text = "✅ Updated Numbers" if updated else "🔄 Update Numbers"
+    # print(f"[DEBUG] create_unified_keyboard - multiple type update_text: {update_text}")
+
+    # For initial run with a single number, create a consistent layout
+    if is_initial_run and (not numbers or len(numbers) <= 1):
+        # Get the number to display and format it
+        raw_number = numbers[0] if numbers else ""
+        display_number = format_phone_number(raw_number)
+
+        # Create a layout with the number in the first row
         return InlineKeyboardMarkup(
             inline_keyboard=[
                 [
-                    InlineKeyboardButton(text="📋 Copy Number", callback_data="copy_number"),
-                    InlineKeyboardButton(text=update_text, callback_data=f"update_{number}_{site_id}")
+                    InlineKeyboardButton(text=display_number, callback_data=pack_callback("split", raw_number, site_id))
                 ],
                 [
-                    InlineKeyboardButton(text="🔪 Split", callback_data=f"split_{number}"),
-                    InlineKeyboardButton(text="⚙️ Settings", callback_data=f"settings_{site_id}")
+                    InlineKeyboardButton(text=update_text, callback_data=pack_callback("update_multi", site_id)),
+                    InlineKeyboardButton(text="⚙️ Settings", callback_data=pack_callback("settings", site_id))
                 ],
                 [
-                    InlineKeyboardButton(text="🌐 Visit Webpage", url=f"{url}/number/{number}" if number else url)
+                    InlineKeyboardButton(text="🌐 Visit Webpage", url=url)
                 ]
             ]
         )
-    else:  # Multiple type
-        numbers = data.get("numbers", [])
-        if not numbers and website:
-            if hasattr(website, "latest_numbers") and website.latest_numbers:
-                numbers = website.latest_numbers
-            elif hasattr(website, "last_number") and website.last_number:
-                numbers = [website.last_number]
-        
-        # Update button text based on state
-        update_text = "✅ Updated Numbers" if updated else "🔄 Update Numbers"
-        # print(f"[DEBUG] create_unified_keyboard - multiple type update_text: {update_text}")
-        
-        # For initial run with a single number, create a consistent layout
-        if is_initial_run and (not numbers or len(numbers) <= 1):
-            # Get the number to display and format it
-            raw_number = numbers[0] if numbers else ""
-            display_number = format_phone_number(raw_number)
-            
-            # Create a layout with the number in the first row
-            return InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [
-                        InlineKeyboardButton(text=display_number, callback_data=f"number_{raw_number}_{site_id}")
-                    ],
-                    [
-                        InlineKeyboardButton(text=update_text, callback_data=f"update_multi_{site_id}"),
-                        InlineKeyboardButton(text="⚙️ Settings", callback_data=f"settings_{site_id}")
-                    ],
-                    [
-                        InlineKeyboardButton(text="🌐 Visit Webpage", url=url)
-                    ]
-                ]
-            )
-        # For non-initial run or multiple numbers, create the standard layout
-        else:
-            # Create buttons for each number with maximum 2 buttons per row
-            buttons = []
+
+    # For non-initial run or multiple numbers, create the standard layout
+    # Create buttons for each number with maximum 2 buttons per row
+    buttons = []
+    current_row = []
+
+    for raw_number in numbers:
+        # Format the number with proper country code spacing
+        formatted_number = format_phone_number(raw_number)
+
+        # Add button to current row
+        current_row.append(InlineKeyboardButton(text=formatted_number, callback_data=pack_callback("split", raw_number, site_id)))
+
+        # If we have 2 buttons in the current row, add it to buttons and start a new row
+        if len(current_row) == 2:
+            buttons.append(current_row)
             current_row = []
-            
-            for i, raw_number in enumerate(numbers):
-                # Format the number with proper country code spacing
-                formatted_number = format_phone_number(raw_number)
-                
-                # Add button to current row
-                current_row.append(InlineKeyboardButton(text=formatted_number, callback_data=f"number_{raw_number}_{site_id}"))
-                
-                # If we have 2 buttons in the current row, add it to buttons and start a new row
-                if len(current_row) == 2:
-                    buttons.append(current_row)
-                    current_row = []
-            
-            # Add any remaining buttons in the last row if it's not empty
-            if current_row:
-                buttons.append(current_row)
-            
-            # Add control buttons
-            buttons.append([
-                InlineKeyboardButton(text=update_text, callback_data=f"update_multi_{site_id}"),
-                InlineKeyboardButton(text="⚙️ Settings", callback_data=f"settings_{site_id}")
-            ])
-            
-            # Add the Visit Webpage button as a new row at the end
-            buttons.append([InlineKeyboardButton(text="🌐 Visit Webpage", url=url)])
-            
-            # Create the keyboard with the buttons
-            return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+    # Add any remaining buttons in the last row if it's not empty
+    if current_row:
+        buttons.append(current_row)
+
+    # Add control buttons
+    buttons.append([
+        InlineKeyboardButton(text=update_text, callback_data=pack_callback("update_multi", site_id)),
+        InlineKeyboardButton(text="⚙️ Settings", callback_data=pack_callback("settings", site_id))
+    ])
+
+    # Add the Visit Webpage button as a new row at the end
+    buttons.append([InlineKeyboardButton(text="🌐 Visit Webpage", url=url)])
+
+    # Create the keyboard with the buttons
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 def get_buttons(number, updated=False, site_id=None):
     """Legacy function for backward compatibility"""
@@ -164,7 +216,7 @@ def get_buttons(number, updated=False, site_id=None):
         "number": number,
         "site_id": site_id,
         "updated": updated,
-        "url": getattr(website, 'url', get_base_url() or "")
+        "url": site_registry.url(site_id)
     }
 
     return create_unified_keyboard(data, website)
@@ -180,7 +232,7 @@ def get_multiple_buttons(numbers, site_id=None):
         "numbers": numbers,
         "site_id": site_id,
         "updated": False,  # Default to not updated
-        "url": getattr(website, 'url', get_base_url() or ""),
+        "url": site_registry.url(site_id),
         "is_initial_run": getattr(website, 'first_run', False)
     }
 
@@ -194,14 +246,20 @@ def get_multiple_buttons(numbers, site_id=None):
     return create_unified_keyboard(data, website)
 
 async def send_notification(bot, data):
-    try:
-        chat_id = os.getenv("CHAT_ID")
-        # print(f"[DEBUG] send_notification - chat_id: {chat_id}")
-        # print(f"[DEBUG] send_notification - data: {data}")
-        
-        if not chat_id:
-            return
+    """
+    Send the notification of one site to all of its subscribers.
 
+    Returns True once sent, False if the send failed for some chat and should be retried, and None if
+    there is nothing that could be sent (no subscribers, unknown site or incomplete data).
+    """
+    failed = await deliver_notifications(bot, [data])
+    if failed:
+        return False
+    return True if data.get("delivered_chats") else None
+
+async def send_site_notification(bot, chat_id, data):
+    """Send the notification of one site to one chat; returns like send_notification"""
+    try:
         site_id = data.get("site_id")
         website = storage["websites"].get(site_id)
 
@@ -217,25 +275,38 @@ async def send_notification(bot, data):
             # Single number notification
             number = data.get("number")
 
-            if not number or not flag_url:
-                # print(f"[ERROR] send_notification - missing number or flag_url for site_id: {site_id}")
+            if not number:
+                # print(f"[ERROR] send_notification - missing number for site_id: {site_id}")
                 return
 
             message = f"🎁 *New Number Added* 🎁\n\n`{number}` check it out! 💖"
             keyboard = get_buttons(number, site_id=site_id)
 
             try:
-                sent_message = await bot.send_photo(
-                    chat_id,
-                    photo=flag_url,
-                    caption=message,
-                    parse_mode="Markdown",
-                    reply_markup=keyboard
-                )
+                if flag_url:
+                    sent_message = await send_flag_photo(
+                        bot, chat_id, flag_url, PRIORITY_ALERT,
+                        caption=message,
+                        parse_mode="Markdown",
+                        reply_markup=keyboard
+                    )
+                else:
+                    # No flag image known for the country: the alert still goes out, with an emoji flag
+                    text = f"{flag_emoji(number)} {message}".lstrip()
+                    sent_message = await send_outbound(PRIORITY_ALERT, chat_id, lambda: bot.send_message(
+                        chat_id,
+                        text=text,
+                        parse_mode="Markdown",
+                        reply_markup=keyboard
+                    ))
                 # print(f"[DEBUG] send_notification - sent message to {chat_id}")
             except Exception as e:
-                # print(f"[ERROR] send_notification - failed to send message to {chat_id}: {e}")
-                return
+                print(f"Error sending notification for {site_id}: {e}")
+                return False
+
+            render_cache.remember(chat_id, sent_message.message_id, caption=message, reply_markup=keyboard)
+            if not is_primary_chat(chat_id):
+                return True
 
             # Store notification data
             storage["latest_notification"] = {
@@ -246,10 +317,12 @@ async def send_notification(bot, data):
                 "multiple": False,
                 "is_first_run": False
             }
+            save_runtime_state()
 
             # Handle repeat notification if enabled
-            if ENABLE_REPEAT_NOTIFICATION and storage["repeat_interval"] is not None:
+            if storage["repeat_enabled"] and storage["repeat_interval"] is not None:
                 await add_countdown_to_latest_notification(bot, storage["repeat_interval"], site_id)
+            return True
 
         else:
             # Multiple numbers notification
@@ -296,24 +369,27 @@ async def send_notification(bot, data):
 
             try:
                 if flag_url:
-                    sent_message = await bot.send_photo(
-                        chat_id,
-                        photo=flag_url,
+                    sent_message = await send_flag_photo(
+                        bot, chat_id, flag_url, PRIORITY_ALERT,
                         caption=notification_message,
                         parse_mode="Markdown",
                         reply_markup=keyboard
                     )
                 else:
-                    sent_message = await bot.send_message(
+                    sent_message = await send_outbound(PRIORITY_ALERT, chat_id, lambda: bot.send_message(
                         chat_id,
                         text=notification_message,
                         parse_mode="Markdown",
                         reply_markup=keyboard
-                    )
+                    ))
                 # print(f"[DEBUG] send_notification - sent message to {chat_id}")
             except Exception as e:
-                # print(f"[ERROR] send_notification - failed to send message to {chat_id}: {e}")
-                return
+                print(f"Error sending notification for {site_id}: {e}")
+                return False
+
+            render_cache.remember(chat_id, sent_message.message_id, caption=notification_message, reply_markup=keyboard)
+            if not is_primary_chat(chat_id):
+                return True
 
             # Store notification data
             storage["latest_notification"] = {
@@ -324,19 +400,251 @@ async def send_notification(bot, data):
                 "multiple": True,
                 "is_first_run": is_first_run
             }
+            save_runtime_state()
 
             # Handle repeat notification if enabled
-            if ENABLE_REPEAT_NOTIFICATION and storage["repeat_interval"] is not None:
+            if storage["repeat_enabled"] and storage["repeat_interval"] is not None:
                 await add_countdown_to_latest_notification(bot, storage["repeat_interval"], site_id)
+            return True
     except Exception as e:
-        # print(f"[ERROR] send_notification - unexpected error: {e}")
-        pass
+        print(f"Error sending notification to {chat_id}: {e}")
+        return False
+
+def is_primary_chat(chat_id):
+    """The CHAT_ID chat keeps the latest notification and its repeat countdown"""
+    return CHAT_ID is not None and str(chat_id) == str(CHAT_ID)
+
+# Telegram rejects inline keyboards with more than 100 buttons
+MAX_KEYBOARD_BUTTONS = 100
 
-async def update_message_with_countdown(bot, message_id, number_or_numbers, flag_url, site_id):
+# Delivers the outbox; started by queue_notification or resume_outbox
+outbox_task = None
+outbox_wakeup = None
+
+async def queue_notification(bot, data):
     """
-    Update the notification message with a countdown for the given site_id (works for both single and multiple numbers)
+    Queue a notification for delivery instead of sending it right away.
+
+    The notification is stored in the durable outbox (commit_update already did so before saving the
+    site) and delivered by the outbox worker. Changes queued within NOTIFICATION_COALESCE_WINDOW seconds
+    of each other are sent together: a lone change goes out through send_notification, several become
+    one digest message.
     """
-    interval = storage["repeat_interval"]
+    await outbox.add(data)
+    start_outbox_worker(bot)
+
+def start_outbox_worker(bot):
+    """Start the outbox worker if needed and wake it up"""
+    global outbox_task, outbox_wakeup
+    if outbox_task is None or outbox_task.done():
+        outbox_wakeup = asyncio.Event()
+        outbox_task = asyncio.create_task(deliver_outbox(bot))
+    outbox_wakeup.set()
+
+async def resume_outbox(bot):
+    """Deliver notifications left in the outbox by the previous run; call after load_website_data"""
+    outbox.restore()
+    if len(outbox):
+        print(f"Resuming delivery of {len(outbox)} queued notifications")
+        start_outbox_worker(bot)
+
+async def deliver_outbox(bot):
+    """Worker delivering due outbox entries, retrying failed ones with exponential backoff"""
+    while len(outbox):
+        now = time.time()
+        due = outbox.due(now)
+        if not due:
+            wait = outbox.next_attempt() - now
+        else:
+            # Give other sites changing in the same cycle a chance to join a fresh notification
+            fresh = [entry["queued_at"] for entry in due if entry["attempts"] == 0]
+            wait = min(fresh) + NOTIFICATION_COALESCE_WINDOW - now if fresh else 0
+
+        if wait > 0:
+            outbox_wakeup.clear()
+            try:
+                await asyncio.wait_for(outbox_wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            failed = await deliver_notifications(bot, [entry["data"] for entry in due])
+        except Exception as e:
+            print(f"Error delivering notifications: {e}")
+            failed = [entry["data"] for entry in due]
+        failed_ids = {id(data) for data in failed}
+        await outbox.finish([entry for entry in due if id(entry["data"]) not in failed_ids],
+                            [entry for entry in due if id(entry["data"]) in failed_ids])
+
+async def deliver_notifications(bot, batch):
+    """
+    Fan a batch of notifications out to their subscribers; returns the ones that failed for some chat.
+
+    Each chat gets the sites it is subscribed to, alone or as one digest. Chats are served concurrently,
+    at most FANOUT_CONCURRENCY at a time, and the outbound queue keeps the sends within Telegram's rate
+    limits. Chats already served by an earlier attempt (data["delivered_chats"]) are skipped, so a retry
+    only goes to the chats that failed.
+    """
+    per_chat = {}
+    for data in batch:
+        delivered = set(data.get("delivered_chats", []))
+        for chat_id in subscriptions.subscribers(data.get("site_id")):
+            if chat_id not in delivered:
+                per_chat.setdefault(chat_id, []).append(data)
+    if not per_chat:
+        return []
+
+    semaphore = asyncio.Semaphore(FANOUT_CONCURRENCY)
+    failed = {}
+
+    async def deliver_to_chat(chat_id, items):
+        async with semaphore:
+            if len(items) == 1:
+                chat_failed = items if await send_site_notification(bot, chat_id, items[0]) is False else []
+            else:
+                chat_failed = await send_digest_notification(bot, chat_id, items)
+        failed_ids = {id(data) for data in chat_failed}
+        now = time.time()
+        for data in items:
+            if id(data) in failed_ids:
+                failed[id(data)] = data
+            else:
+                data.setdefault("delivered_chats", []).append(chat_id)
+                subscriptions.record_latency(chat_id, now - data.get("detected_at", now))
+                if storage["repeat_enabled"] and storage["repeat_interval"]:
+                    await repeat_scheduler.schedule(data.get("site_id"), chat_id, storage["repeat_interval"])
+
+    chats = list(per_chat)
+    # A flag Telegram has not seen yet is uploaded for the first chat; the others then reuse its file_id
+    if len(chats) > 1 and any(data.get("flag_url") and data["flag_url"] not in flag_file_ids for data in batch):
+        await deliver_to_chat(chats[0], per_chat[chats[0]])
+        chats = chats[1:]
+    await asyncio.gather(*(deliver_to_chat(chat_id, per_chat[chat_id]) for chat_id in chats))
+    return list(failed.values())
+
+def render_digest_line(website, data):
+    """One caption line of a digest"""
+    name = site_registry.name(website.site_id)
+    if website.type == "multiple":
+        numbers = data.get("numbers", [])
+        if len(numbers) == 1:
+            return f"• *{name}*: `{numbers[0]}`"
+        return f"• *{name}*: `{len(numbers)}` numbers"
+    number = data.get("number")
+    number = number if str(number).startswith("+") else f"+{number}"
+    return f"• *{name}*: `{number}`"
+
+def build_site_keyboard(website, data):
+    """Keyboard of a single site, as send_notification would attach it"""
+    if website.type == "multiple":
+        return create_unified_keyboard({
+            "type": "multiple",
+            "numbers": data.get("numbers", []),
+            "site_id": website.site_id,
+            "updated": False,
+            "url": website.url,
+            "is_initial_run": len(data.get("numbers", [])) <= 1
+        }, website)
+    return get_buttons(data.get("number"), site_id=website.site_id)
+
+async def send_digest_notification(bot, chat_id, batch):
+    """
+    Send the changes of several sites to a chat as one message, with each site's keyboard stacked under the
+    previous one. Sites are split over several messages only if the keyboard would get too large.
+    Returns the notifications that could not be sent.
+    """
+    failed = []
+    try:
+        # Group the sites into messages that fit Telegram's keyboard limit
+        messages = [[]]
+        buttons_in_message = 0
+        for data in batch:
+            website = storage["websites"].get(data.get("site_id"))
+            if not website:
+                continue
+            keyboard = build_site_keyboard(website, data)
+            rows = keyboard.inline_keyboard if keyboard else []
+            buttons = sum(len(row) for row in rows)
+            if messages[-1] and buttons_in_message + buttons > MAX_KEYBOARD_BUTTONS:
+                messages.append([])
+                buttons_in_message = 0
+            messages[-1].append((website, data, rows))
+            buttons_in_message += buttons
+
+        for sites in messages:
+            if not sites:
+                continue
+            if len(sites) == 1:
+                if await send_site_notification(bot, chat_id, sites[0][1]) is False:
+                    failed.append(sites[0][1])
+                continue
+
+            lines = [render_digest_line(website, data) for website, data, rows in sites]
+            caption = "🎁 *New Numbers Added* 🎁\n\n" + "\n".join(lines) + "\n\nCheck them out! 💖"
+            keyboard = InlineKeyboardMarkup(inline_keyboard=[row for website, data, rows in sites for row in rows])
+            flag_url = next((data.get("flag_url") for website, data, rows in sites if data.get("flag_url")), None)
+
+            try:
+                if flag_url:
+                    sent_message = await send_flag_photo(
+                        bot, chat_id, flag_url, PRIORITY_ALERT,
+                        caption=caption,
+                        parse_mode="Markdown",
+                        reply_markup=keyboard
+                    )
+                else:
+                    sent_message = await send_outbound(PRIORITY_ALERT, chat_id, lambda: bot.send_message(
+                        chat_id,
+                        text=caption,
+                        parse_mode="Markdown",
+                        reply_markup=keyboard
+                    ))
+            except Exception as e:
+                print(f"Error sending digest notification to {chat_id}: {e}")
+                failed.extend(data for website, data, rows in sites)
+                continue
+
+            render_cache.remember(chat_id, sent_message.message_id, caption=caption, reply_markup=keyboard)
+            if not is_primary_chat(chat_id):
+                continue
+
+            # A digest has no countdown; the per-site caption would overwrite the other sites
+            storage["latest_notification"] = {
+                "message_id": sent_message.message_id,
+                "number": None,
+                "flag_url": flag_url,
+                "site_id": None,
+                "site_ids": [website.site_id for website, data, rows in sites],
+                "multiple": True,
+                "is_first_run": False,
+                "digest": True
+            }
+            save_runtime_state()
+    except Exception as e:
+        print(f"Error sending digest notification: {e}")
+        return batch
+    return failed
+
+def render_countdown_caption(website, number_or_numbers, time_left):
+    """Render the notification caption with the time left until the next notification"""
+    formatted_time = format_time(time_left)
+    if website.type == "multiple":
+        # Multiple numbers message
+        numbers = number_or_numbers if isinstance(number_or_numbers, list) else website.latest_numbers
+        return f"🎁 *New Numbers Added* 🎁\n\nFound `{len(numbers)}` numbers, check them out! 💖\n\n⏱ Next notification in: *{formatted_time}*"
+    # Single number message
+    number = number_or_numbers if isinstance(number_or_numbers, str) else website.last_number
+    return f"🎁 *New Number Added* 🎁\n\n`{number}` check it out! 💖\n\n⏱ Next notification in: *{formatted_time}*"
+
+async def update_message_with_countdown(bot, message_id, number_or_numbers, flag_url, site_id, started_at=None, interval=None, chat_id=None):
+    """
+    Show a countdown on the notification message for the given site_id (works for both single and multiple numbers)
+
+    The countdown is driven by the shared countdown ticker, so this returns immediately. started_at is the
+    timestamp the countdown began at; pass the persisted value to resume a countdown after a restart.
+    """
+    interval = interval if interval is not None else storage["repeat_interval"]
     if interval is None:
         return
 
@@ -344,46 +652,26 @@ async def update_message_with_countdown(bot, message_id, number_or_numbers, flag
     if not website:
         return
 
-    # Determine if this is a multiple or single type site
-    is_multiple = website.type == "multiple"
-    last_update_time = time.time()
-    current_message = None
-    countdown_active = True
+    def build_keyboard():
+        if website.type == "multiple":
+            numbers = number_or_numbers if isinstance(number_or_numbers, list) else website.latest_numbers
+            return get_multiple_buttons(numbers, site_id=site_id)
+        number = number_or_numbers if isinstance(number_or_numbers, str) else website.last_number
+        return get_buttons(number, site_id=site_id)
 
-    while countdown_active:
-        try:
-            current_time = time.time()
-            time_left = int(interval - (current_time - last_update_time))
-            if time_left < 0:
-                time_left = 0
-            formatted_time = format_time(time_left)
-
-            if is_multiple:
-                # Multiple numbers message
-                numbers = number_or_numbers if isinstance(number_or_numbers, list) else website.latest_numbers
-                notification_message = f"🎁 *New Numbers Added* 🎁\n\nFound `{len(numbers)}` numbers, check them out! 💖\n\n⏱ Next notification in: *{formatted_time}*"
-                keyboard = get_multiple_buttons(numbers, site_id=site_id)
-            else:
-                # Single number message
-                number = number_or_numbers if isinstance(number_or_numbers, str) else website.last_number
-                notification_message = f"🎁 *New Number Added* 🎁\n\n`{number}` check it out! 💖\n\n⏱ Next notification in: *{formatted_time}*"
-                keyboard = get_buttons(number, site_id=site_id)
-
-            await bot.edit_message_caption(
-                chat_id=CHAT_ID,
-                message_id=message_id,
-                caption=notification_message,
-                parse_mode="Markdown",
-                reply_markup=keyboard
-            )
+    chat_id = chat_id or CHAT_ID
 
-            await asyncio.sleep(1)
-            # Check if repeat_interval changed or task cancelled
-            if storage["repeat_interval"] != interval or not storage["active_countdown_tasks"].get(site_id):
-                countdown_active = False
-        except Exception as e:
-            # print(f"[ERROR] update_message_with_countdown - error: {e}")
-            countdown_active = False
+    async def on_finish():
+        # Nothing left to resume once the countdown reached zero
+        state_actor.submit(forget_countdown, site_id, chat_id, message_id)
+
+    countdown_ticker.add(
+        bot, site_id, chat_id, message_id,
+        started_at if started_at is not None else time.time(), interval,
+        lambda time_left: render_countdown_caption(website, number_or_numbers, time_left),
+        build_keyboard,
+        on_finish
+    )
 
 async def add_countdown_to_latest_notification(bot, interval_seconds, site_id):
     try:
@@ -395,31 +683,132 @@ async def add_countdown_to_latest_notification(bot, interval_seconds, site_id):
                 number_or_numbers = latest.get("numbers")
             else:
                 number_or_numbers = latest.get("number")
-            # Cancel any previous countdown for this site
-            if site_id in storage["active_countdown_tasks"]:
-                storage["active_countdown_tasks"][site_id].cancel()
-            countdown_task = asyncio.create_task(
-                update_message_with_countdown(bot, message_id, number_or_numbers, flag_url, site_id)
-            )
-            storage["active_countdown_tasks"][site_id] = countdown_task
+            # Replaces any previous countdown for this site
+            started_at = time.time()
+            await update_message_with_countdown(bot, message_id, number_or_numbers, flag_url, site_id, started_at, interval_seconds)
+
+            # Remember the countdown so it can be resumed after a restart
+            state_actor.submit(remember_countdown, site_id, CHAT_ID, {
+                "message_id": message_id,
+                "chat_id": CHAT_ID,
+                "started_at": started_at,
+                "interval": interval_seconds
+            })
 
     except Exception as e:
         # print(f"[ERROR] add_countdown_to_latest_notification - error: {e}")
         pass
 
-async def repeat_notification(bot):
-    """Send a repeat notification if enabled"""
+def saved_countdowns():
+    """(site_id, chat_id, countdown) of every countdown remembered for a restart"""
+    return [(site_id, chat_id, countdown)
+            for site_id, chats in storage["countdowns"].items()
+            for chat_id, countdown in chats.items()]
+
+# Countdown bookkeeping runs on the state actor (state_actor.submit), which saves the runtime section
+
+def remember_countdown(site_id, chat_id, countdown):
+    """Remember a running countdown so it can be resumed after a restart"""
+    storage["countdowns"].setdefault(site_id, {})[str(chat_id)] = countdown
+    state_actor.mark_section_dirty(RUNTIME_SECTION, runtime_state)
+
+def forget_countdown(site_id, chat_id=None, message_id=None):
+    """
+    Drop a remembered countdown of a site in a chat, or in every chat; with message_id only if it is
+    still the one on that message. Returns True if one was dropped.
+    """
+    chats = storage["countdowns"].get(site_id)
+    if not chats:
+        return False
+    if chat_id is None:
+        del storage["countdowns"][site_id]
+    else:
+        countdown = chats.get(str(chat_id))
+        if countdown is None or (message_id is not None and countdown.get("message_id") != message_id):
+            return False
+        del chats[str(chat_id)]
+        if not chats:
+            del storage["countdowns"][site_id]
+    state_actor.mark_section_dirty(RUNTIME_SECTION, runtime_state)
+    return True
+
+def restart_countdown(site_id, chat_id, started_at, interval):
+    """Restart a remembered countdown from started_at with a new interval"""
+    countdown = storage["countdowns"].get(site_id, {}).get(str(chat_id))
+    if countdown is not None:
+        countdown.update(started_at=started_at, interval=interval)
+        state_actor.mark_section_dirty(RUNTIME_SECTION, runtime_state)
+
+async def cancel_countdown(site_id, chat_id=None):
+    """Stop a site's countdown in a chat, or in every chat, and forget it so it is not resumed after a restart"""
+    countdown_ticker.cancel(site_id, chat_id)
+    state_actor.submit(forget_countdown, site_id, chat_id)
+
+async def restart_countdowns(bot, interval):
+    """Restart every running countdown from now with a new interval"""
+    now = time.time()
+    latest = storage["latest_notification"]
+    for site_id, chat_id, countdown in saved_countdowns():
+        if not countdown_ticker.is_active(site_id, chat_id):
+            continue
+        state_actor.submit(restart_countdown, site_id, chat_id, now, interval)
+        number_or_numbers = None
+        if latest.get("site_id") == site_id and latest.get("message_id") == countdown["message_id"]:
+            number_or_numbers = latest.get("numbers") if latest.get("multiple") else latest.get("number")
+        await update_message_with_countdown(bot, countdown["message_id"], number_or_numbers, latest.get("flag_url"),
+                                            site_id, now, interval, chat_id)
+
+async def send_repeat_notification(bot, site_id, chat_id):
+    """
+    Re-send a site's current notification to a chat when its repeat reminder fires.
+
+    Returns False when repeating should stop (repeat disabled, site gone or disabled, chat unsubscribed).
+    """
+    website = storage["websites"].get(site_id)
+    interval = storage["repeat_interval"]
+    if not storage["repeat_enabled"] or not interval or not website or not website.enabled:
+        return False
+    if chat_id not in subscriptions.subscribers(site_id):
+        return False
+
+    data = website.get_notification_data()
+    if not data["flag_url"]:
+        # Not known yet after a restart with an older state file; the flag follows from the number
+        data["flag_url"] = local_flag_for_number(data.get("number") or next(iter(data.get("numbers") or []), None))
+    # The scheduler repeats the reminder after the interval, also when this send failed
+    await send_site_notification(bot, chat_id, data)
+    return True
+
+async def resume_repeat_notifications(bot):
+    """Start the repeat engine with the reminders of the previous run; call after load_website_data"""
+    repeat_scheduler.restore()
+    repeat_scheduler.start(lambda site_id, chat_id: send_repeat_notification(bot, site_id, chat_id))
+
+
+async def resume_countdowns(bot):
+    """
+    Restart the countdowns that were running before a restart, keeping their original start time so
+    the remaining time is correct. Only existing messages are edited; nothing new is sent.
+    """
     try:
-        # Check if we have an active notification
-        if "latest_notification" in storage and storage["latest_notification"]:
-            # Get the notification details
-            message_id = storage["latest_notification"].get("message_id")
-            site_id = storage["latest_notification"].get("site_id", "site_1")
-            multiple = storage["latest_notification"].get("multiple", False)
-
-            # Update the message with the new countdown
-            await add_countdown_to_latest_notification(bot, storage["repeat_interval"], site_id)
-    
+        if not storage["repeat_enabled"] or storage["repeat_interval"] is None:
+            return
+
+        latest = storage["latest_notification"]
+        for site_id, chat_id, countdown in saved_countdowns():
+            if countdown_ticker.is_active(site_id, chat_id) or site_id not in storage["websites"]:
+                continue
+
+            # A countdown started with a different interval would show the wrong remaining time
+            if countdown.get("interval") != storage["repeat_interval"]:
+                state_actor.submit(forget_countdown, site_id, chat_id)
+                continue
+
+            number_or_numbers = None
+            if latest.get("site_id") == site_id and latest.get("message_id") == countdown["message_id"]:
+                number_or_numbers = latest.get("numbers") if latest.get("multiple") else latest.get("number")
+
+            await update_message_with_countdown(bot, countdown["message_id"], number_or_numbers, latest.get("flag_url"),
+                                                site_id, countdown["started_at"], countdown["interval"], chat_id)
     except Exception as e:
-        # print(f"[ERROR] repeat_notification - error: {e}")
-        pass
+        print(f"Error resuming countdowns: {e}")
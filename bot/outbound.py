@@ -0,0 +1,341 @@
+import time
+import asyncio
+import contextvars
+from collections import OrderedDict, deque
+from aiogram.exceptions import TelegramRetryAfter
+from bot.config import (OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST, OUTBOUND_PRIVATE_CHAT_RATE,
+                        OUTBOUND_PRIVATE_CHAT_BURST, OUTBOUND_MAX_IN_FLIGHT, OUTBOUND_MAX_RETRIES)
+
+# Priorities, most urgent first
+PRIORITY_ALERT = 0  # New-number notifications
+PRIORITY_INTERACTIVE = 1  # Replies to button taps and commands
+PRIORITY_COSMETIC = 2  # Countdown ticks, button animations, cleanup
+PRIORITY_NAMES = ["alert", "interactive", "cosmetic"]
+
+
+class TokenBucket:
+    """Token bucket refilled at rate tokens per second, holding at most capacity tokens"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until a token is available (0 if one is available now)"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def is_idle(self, now):
+        """True once the bucket is full again, i.e. no different from a new one"""
+        self._refill(now)
+        return now >= self.blocked_until and self.tokens >= self.capacity
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, seconds):
+        """Hold the bucket empty, e.g. for a RetryAfter from Telegram"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class OutboundQueue:
+    """
+    Central queue for Bot API calls.
+
+    Calls wait for a token from the global bucket and from their chat's bucket (private chats, with a
+    positive chat ID, get Telegram's higher private rate), and the most urgent
+    priority with a ready chat goes first, so cosmetic edits can never delay a new-number alert.
+    Chats at the same priority are served round-robin. A RetryAfter blocks the chat for the time
+    Telegram asked for and the call is retried.
+    """
+
+    def __init__(self, global_rate=OUTBOUND_GLOBAL_RATE, chat_rate=OUTBOUND_CHAT_RATE, chat_burst=OUTBOUND_CHAT_BURST,
+                 private_chat_rate=OUTBOUND_PRIVATE_CHAT_RATE, private_chat_burst=OUTBOUND_PRIVATE_CHAT_BURST,
+                 max_in_flight=OUTBOUND_MAX_IN_FLIGHT, max_retries=OUTBOUND_MAX_RETRIES):
+        self._pending = [OrderedDict() for _ in PRIORITY_NAMES]  # per priority: chat_id -> deque of requests
+        self._global = TokenBucket(global_rate, max(1, global_rate))
+        self._chat_rate = chat_rate / 60
+        self._chat_burst = chat_burst
+        self._private_chat_rate = private_chat_rate / 60
+        self._private_chat_burst = private_chat_burst
+        self._chats = {}
+        self._sweep_at = 64  # Number of chat buckets at which idle ones are evicted
+        self._max_in_flight = max_in_flight
+        self._max_retries = max_retries
+        self._in_flight = 0
+        self._task = None
+        self._wakeup = None
+        self._waits = [{"count": 0, "total": 0.0, "max": 0.0} for _ in PRIORITY_NAMES]
+        self._retry_after_count = 0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self._sweep_at:
+                self._evict_idle_buckets()
+            if chat_id.startswith("-"):
+                bucket = TokenBucket(self._chat_rate, self._chat_burst)
+            else:
+                bucket = TokenBucket(self._private_chat_rate, self._private_chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _evict_idle_buckets(self):
+        """Forget full buckets of chats with nothing queued; they are recreated full when needed"""
+        now = time.monotonic()
+        queued = set().union(*(pending.keys() for pending in self._pending))
+        for chat_id, bucket in list(self._chats.items()):
+            if chat_id not in queued and bucket.is_idle(now):
+                del self._chats[chat_id]
+        # Sweep again once the number of buckets doubled, so eviction stays amortized O(1)
+        self._sweep_at = max(64, 2 * len(self._chats))
+
+    async def submit(self, priority, chat_id, call):
+        """Queue call() (a function returning the API coroutine) and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        request = {
+            "call": call,
+            "chat_id": str(chat_id),  # Handlers pass ints, the configured CHAT_ID is a string
+            "priority": priority,
+            "future": future,
+            "enqueued_at": time.monotonic(),
+            "attempts": 0,
+            # The call runs in the submitter's context, so per-handler instrumentation still applies
+            "context": contextvars.copy_context()
+        }
+        self._enqueue(request)
+        return await future
+
+    def _enqueue(self, request, front=False):
+        pending = self._pending[request["priority"]]
+        requests = pending.get(request["chat_id"])
+        if requests is None:
+            requests = pending[request["chat_id"]] = deque()
+        if front:
+            requests.appendleft(request)
+        else:
+            requests.append(request)
+
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    def _next_request(self, now):
+        """Pop the most urgent request whose chat has a token; otherwise return how long to wait"""
+        global_wait = self._global.wait_time(now)
+        if global_wait > 0:
+            return None, global_wait
+
+        min_wait = None
+        for pending in self._pending:
+            for chat_id, requests in list(pending.items()):
+                # Requests whose submitter was cancelled, e.g. frames of a stopped animation, are dropped
+                while requests and requests[0]["future"].done():
+                    requests.popleft()
+                if not requests:
+                    del pending[chat_id]
+                    continue
+                wait = self._chat_bucket(chat_id).wait_time(now)
+                if wait <= 0:
+                    request = requests.popleft()
+                    if requests:
+                        pending.move_to_end(chat_id)
+                    else:
+                        del pending[chat_id]
+                    return request, 0
+                min_wait = wait if min_wait is None else min(min_wait, wait)
+        return None, min_wait
+
+    async def _run(self):
+        while True:
+            request, wait = None, None
+            if self._in_flight < self._max_in_flight:
+                request, wait = self._next_request(time.monotonic())
+
+            if request is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = time.monotonic()
+            self._global.consume(now)
+            self._chat_bucket(request["chat_id"]).consume(now)
+            self._record_wait(request, now)
+            self._in_flight += 1
+            request["context"].run(asyncio.create_task, self._execute(request))
+
+    def _record_wait(self, request, now):
+        waited = now - request["enqueued_at"]
+        stats = self._waits[request["priority"]]
+        stats["count"] += 1
+        stats["total"] += waited
+        stats["max"] = max(stats["max"], waited)
+
+    async def _execute(self, request):
+        future = request["future"]
+        if future.done():
+            # Cancelled while waiting for its tokens
+            self._in_flight -= 1
+            self._wakeup.set()
+            return
+        try:
+            result = await request["call"]()
+        except TelegramRetryAfter as e:
+            self._retry_after_count += 1
+            self._chat_bucket(request["chat_id"]).block(e.retry_after)
+            request["attempts"] += 1
+            if request["attempts"] <= self._max_retries and not future.done():
+                self._enqueue(request, front=True)
+            elif not future.done():
+                future.set_exception(e)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+        finally:
+            self._in_flight -= 1
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    def metrics(self):
+        """Queue depth per priority, dispatch wait times and RetryAfter count"""
+        return {
+            "depth": {
+                name: sum(len(requests) for requests in pending.values())
+                for name, pending in zip(PRIORITY_NAMES, self._pending)
+            },
+            "in_flight": self._in_flight,
+            "wait": {
+                name: {
+                    "count": stats["count"],
+                    "avg_ms": stats["total"] / stats["count"] * 1000 if stats["count"] else 0.0,
+                    "max_ms": stats["max"] * 1000
+                }
+                for name, stats in zip(PRIORITY_NAMES, self._waits)
+            },
+            "retry_after": self._retry_after_count
+        }
+
+
+class RenderCache:
+    """
+    Last caption and keyboard sent for each message, keyed by (chat_id, message_id).
+
+    Lets edits that would not change anything be dropped before they reach the network. Entries are
+    evicted least recently used first once max_entries is exceeded.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.skipped = 0
+
+    def _key(self, chat_id, message_id):
+        return str(chat_id), message_id
+
+    def get(self, chat_id, message_id):
+        entry = self._entries.get(self._key(chat_id, message_id))
+        if entry is not None:
+            self._entries.move_to_end(self._key(chat_id, message_id))
+        return entry
+
+    def remember(self, chat_id, message_id, **fields):
+        """Record what a message now shows (caption and/or reply_markup)"""
+        if message_id is None:
+            return
+        key = self._key(chat_id, message_id)
+        entry = self._entries.get(key, {})
+        entry.update(fields)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def forget(self, chat_id, message_id):
+        self._entries.pop(self._key(chat_id, message_id), None)
+
+    def is_unchanged(self, chat_id, message_id, **fields):
+        """Check if a message already shows all the given fields"""
+        entry = self.get(chat_id, message_id)
+        if entry is None:
+            return False
+        for name, value in fields.items():
+            if name not in entry:
+                return False
+            shown = entry[name]
+            if shown is not value and shown != value:
+                return False
+        self.skipped += 1
+        return True
+
+
+outbound_queue = OutboundQueue()
+render_cache = RenderCache()
+
+
+async def send_outbound(priority, chat_id, call):
+    """Run a Bot API call through the shared outbound queue, e.g. send_outbound(PRIORITY_ALERT, chat_id, lambda: bot.send_message(chat_id, text))"""
+    return await outbound_queue.submit(priority, chat_id, call)
+
+
+def is_not_modified(error):
+    return "message is not modified" in str(error)
+
+
+async def edit_reply_markup(message, reply_markup, priority=PRIORITY_INTERACTIVE):
+    """Edit the keyboard of a message through the outbound queue, unless it already shows that keyboard"""
+    chat_id, message_id = message.chat.id, message.message_id
+    if render_cache.get(chat_id, message_id) is None and getattr(message, "reply_markup", None) is not None:
+        # Not sent through the cache yet: the message itself tells what it shows
+        render_cache.remember(chat_id, message_id, reply_markup=message.reply_markup)
+    if render_cache.is_unchanged(chat_id, message_id, reply_markup=reply_markup):
+        return None
+    try:
+        result = await send_outbound(priority, chat_id, lambda: message.edit_reply_markup(reply_markup=reply_markup))
+    except Exception as e:
+        if not is_not_modified(e):
+            render_cache.forget(chat_id, message_id)
+            raise
+        result = None
+    render_cache.remember(chat_id, message_id, reply_markup=reply_markup)
+    return result
+
+
+async def edit_message_caption(bot, chat_id, message_id, caption, reply_markup=None, priority=PRIORITY_INTERACTIVE, **kwargs):
+    """
+    Edit the caption (and keyboard) of a message through the outbound queue, unless it already shows
+    both. Like the Bot API call, a caption edit without reply_markup removes the keyboard.
+    """
+    if render_cache.is_unchanged(chat_id, message_id, caption=caption, reply_markup=reply_markup):
+        return None
+    try:
+        result = await send_outbound(priority, chat_id, lambda: bot.edit_message_caption(
+            chat_id=chat_id,
+            message_id=message_id,
+            caption=caption,
+            reply_markup=reply_markup,
+            **kwargs
+        ))
+    except Exception as e:
+        if not is_not_modified(e):
+            render_cache.forget(chat_id, message_id)
+            raise
+        result = None
+    render_cache.remember(chat_id, message_id, caption=caption, reply_markup=reply_markup)
+    return result
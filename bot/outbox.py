@@ -0,0 +1,132 @@
+import time
+from collections import OrderedDict
+from bot.storage import get_state_section
+from bot.state_actor import save_state_section
+from bot.config import OUTBOX_BASE_BACKOFF, OUTBOX_MAX_BACKOFF, OUTBOX_MAX_ATTEMPTS
+
+OUTBOX_SECTION = "outbox"
+
+# Delivered notifications remembered so the same announcement queued again is not sent twice
+DELIVERED_KEYS_KEPT = 200
+# Notifications given up on, kept for inspection
+DEAD_LETTERS_KEPT = 50
+
+
+def notification_key(data):
+    """Idempotency key of a notification: the site plus the number(s) it announces"""
+    if data.get("numbers") is not None:
+        announced = ",".join(str(number) for number in data["numbers"])
+    else:
+        announced = str(data.get("number"))
+    return f"{data.get('site_id')}:{announced}"
+
+
+class Outbox:
+    """
+    Persistent queue of notifications that have not been delivered yet.
+
+    Entries are written to the state file before the site state that triggered them, so an alert
+    survives a failed send or a restart. A failed entry is retried with exponential backoff, and
+    parked as a dead letter after OUTBOX_MAX_ATTEMPTS failures.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()  # key -> {"data", "attempts", "queued_at", "next_attempt"}
+        self.delivered = OrderedDict()  # key -> detected_at of the delivered announcement, oldest first
+        self.dead_letters = []  # Entries given up on, oldest first
+
+    def __len__(self):
+        return len(self.entries)
+
+    def restore(self):
+        """Load the persisted outbox; call after load_website_data"""
+        section = get_state_section(OUTBOX_SECTION, {}) or {}
+        self.entries = OrderedDict((entry["key"], entry) for entry in section.get("entries", []))
+        # Older state files kept bare keys; those can not match an announcement any more
+        self.delivered = OrderedDict(item for item in section.get("delivered", []) if isinstance(item, list))
+        self.dead_letters = section.get("dead_letters", [])
+
+    def to_section(self):
+        return {
+            "entries": list(self.entries.values()),
+            "delivered": [[key, detected_at] for key, detected_at in self.delivered.items()],
+            "dead_letters": self.dead_letters
+        }
+
+    def save(self):
+        """Persist the outbox with the state actor's next batch; await the result to wait for the write"""
+        return save_state_section(OUTBOX_SECTION, self.to_section)
+
+    async def add(self, data):
+        """Queue a notification (see queue) and persist it; returns False if it was not queued"""
+        if not self.queue(data):
+            return False
+        await self.save()
+        return True
+
+    def queue(self, data):
+        """
+        Queue a notification without saving the outbox. Returns False if it is already queued, or is
+        an announcement that was already delivered (the same data queued again).
+
+        The same numbers detected again later are a new announcement and are queued. A newer
+        notification of a site replaces its undelivered one, as it carries the site's current numbers.
+        """
+        key = notification_key(data)
+        if key in self.entries:
+            return False
+        if key in self.delivered and self.delivered[key] == data.get("detected_at"):
+            return False
+        for queued_key, entry in list(self.entries.items()):
+            if entry["data"].get("site_id") == data.get("site_id"):
+                del self.entries[queued_key]
+
+        now = time.time()
+        data.setdefault("detected_at", now)
+        self.entries[key] = {
+            "key": key,
+            "data": data,
+            "attempts": 0,
+            "queued_at": now,
+            "next_attempt": now
+        }
+        return True
+
+    def due(self, now=None):
+        """Entries whose next attempt is due, oldest first"""
+        now = time.time() if now is None else now
+        return [entry for entry in self.entries.values() if entry["next_attempt"] <= now]
+
+    def next_attempt(self):
+        """Time of the earliest pending attempt, or None if the outbox is empty"""
+        return min((entry["next_attempt"] for entry in self.entries.values()), default=None)
+
+    async def finish(self, delivered, failed):
+        """Record the outcome of a delivery round: remove delivered entries, back off failed ones"""
+        now = time.time()
+        for entry in delivered:
+            self.entries.pop(entry["key"], None)
+            self.delivered.pop(entry["key"], None)
+            self.delivered[entry["key"]] = entry["data"].get("detected_at")
+        while len(self.delivered) > DELIVERED_KEYS_KEPT:
+            self.delivered.popitem(last=False)
+
+        for entry in failed:
+            entry["attempts"] += 1
+            if entry["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+                # E.g. a chat that blocked the bot: stop retrying so the worker can go idle
+                self.entries.pop(entry["key"], None)
+                entry["failed_at"] = now
+                self.dead_letters.append(entry)
+                del self.dead_letters[:-DEAD_LETTERS_KEPT]
+                print(f"Notification {entry['key']} failed {entry['attempts']} times, giving up")
+                continue
+            backoff = min(OUTBOX_MAX_BACKOFF, OUTBOX_BASE_BACKOFF * 2 ** (entry["attempts"] - 1))
+            entry["next_attempt"] = now + backoff
+            print(f"Notification {entry['key']} failed (attempt {entry['attempts']}), retrying in {backoff:g}s")
+
+        if delivered or failed:
+            self.save()
+
+
+outbox = Outbox()
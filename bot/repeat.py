@@ -0,0 +1,113 @@
+import time
+from bot.storage import get_state_section
+from bot.state_actor import save_state_section
+from bot.timers import TimerHeap
+
+REPEAT_SECTION = "repeat_reminders"
+
+
+class RepeatScheduler:
+    """
+    Repeat-notification reminders, one per (site_id, chat_id), on a timer heap.
+
+    A single task sleeps until the earliest reminder and hands it to the fire callback; cancelling
+    a reminder is O(1).
+    """
+
+    def __init__(self):
+        self._reminders = {}  # (site_id, chat_id) -> {"due", "interval"}
+        self._timers = TimerHeap("repeat", None)
+        self._fire = None
+
+    def __len__(self):
+        return len(self._reminders)
+
+    def start(self, fire):
+        """
+        Start firing reminders: fire(site_id, chat_id) is awaited when one is due and returns False to
+        stop repeating; otherwise the reminder repeats after its interval. A reminder cancelled while
+        fire is running stays cancelled.
+        """
+        self._fire = fire
+        self._timers.start(self._fire_reminder)
+
+    def is_scheduled(self, site_id, chat_id):
+        return (site_id, str(chat_id)) in self._reminders
+
+    def due_time(self, site_id, chat_id):
+        reminder = self._reminders.get((site_id, str(chat_id)))
+        return reminder["due"] if reminder else None
+
+    def reminders(self):
+        """(site_id, chat_id, due, interval) of every reminder"""
+        return [(site_id, chat_id, reminder["due"], reminder["interval"])
+                for (site_id, chat_id), reminder in self._reminders.items()]
+
+    def _push(self, key, due, interval):
+        self._reminders[key] = {"due": due, "interval": interval}
+        self._timers.schedule(key, due)
+
+    async def schedule(self, site_id, chat_id, interval, due=None):
+        """Schedule (or reschedule) a site's reminder in a chat, by default interval seconds from now"""
+        self._push((site_id, str(chat_id)), due if due is not None else time.time() + interval, interval)
+        self.save()
+
+    async def cancel(self, site_id, chat_id):
+        key = (site_id, str(chat_id))
+        self._timers.cancel(key)
+        if self._reminders.pop(key, None) is not None:
+            self.save()
+
+    async def cancel_site(self, site_id):
+        """Cancel the reminders of a site in every chat"""
+        keys = [key for key in self._reminders if key[0] == site_id]
+        for key in keys:
+            del self._reminders[key]
+            self._timers.cancel(key)
+        if keys:
+            self.save()
+
+    async def cancel_all(self):
+        self._reminders.clear()
+        self._timers.clear()
+        self.save()
+
+    async def reschedule_all(self, interval):
+        """Restart every reminder from now with a new interval"""
+        now = time.time()
+        for key in list(self._reminders):
+            self._push(key, now + interval, interval)
+        self.save()
+
+    def save(self):
+        """Persist the reminders with the state actor's next batch"""
+        return save_state_section(REPEAT_SECTION, lambda: [list(reminder) for reminder in self.reminders()])
+
+    def restore(self):
+        """Load the persisted reminders; call after load_website_data"""
+        self._reminders.clear()
+        self._timers.clear()
+        for site_id, chat_id, due, interval in get_state_section(REPEAT_SECTION, []) or []:
+            self._push((site_id, str(chat_id)), due, interval)
+
+    async def _fire_reminder(self, key):
+        reminder = self._reminders.get(key)
+        if reminder is None:
+            return
+        site_id, chat_id = key
+        try:
+            keep = await self._fire(site_id, chat_id)
+        except Exception as e:
+            print(f"Error sending repeat notification for {site_id} to {chat_id}: {e}")
+            keep = True
+        if self._reminders.get(key) is not reminder:
+            # Cancelled or rescheduled while the notification was being sent
+            return
+        if keep is False:
+            del self._reminders[key]
+        else:
+            self._push(key, time.time() + reminder["interval"], reminder["interval"])
+        self.save()
+
+
+repeat_scheduler = RepeatScheduler()
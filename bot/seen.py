@@ -0,0 +1,149 @@
+import time
+from collections import OrderedDict
+from bot.storage import get_state_section
+from bot.state_actor import state_actor
+from bot.config import SEEN_NUMBERS_RETENTION, SEEN_NUMBERS_BUCKET, SEEN_NUMBERS_MAX, SEEN_NUMBERS_GLOBAL
+
+SEEN_SECTION = "seen_numbers"
+
+
+def normalize_number(number):
+    """Normalize a number so '+4912345', '4912345' and 4912345 are the same entry"""
+    return str(number).strip().lstrip('+')
+
+
+class SeenNumberIndex:
+    """
+    Time-bucketed set of recently seen numbers.
+
+    Numbers are grouped into buckets of bucket_seconds. Buckets older than the retention window are
+    dropped as a whole, and once max_entries is exceeded the oldest numbers are evicted first, so
+    memory stays bounded no matter how many numbers an origin cycles through.
+    """
+
+    def __init__(self, retention=SEEN_NUMBERS_RETENTION, bucket_seconds=SEEN_NUMBERS_BUCKET, max_entries=SEEN_NUMBERS_MAX):
+        self.retention = retention
+        self.bucket_seconds = max(1, bucket_seconds)
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()  # bucket_id -> set of numbers, oldest first
+        self._last_seen = {}  # number -> bucket_id it currently lives in
+
+    def __len__(self):
+        return len(self._last_seen)
+
+    def _bucket_id(self, now):
+        return int(now // self.bucket_seconds)
+
+    def _expire(self, now):
+        """Drop buckets that fell out of the retention window"""
+        oldest_allowed = self._bucket_id(now - self.retention)
+        while self._buckets:
+            bucket_id = next(iter(self._buckets))
+            if bucket_id >= oldest_allowed:
+                break
+            for number in self._buckets.pop(bucket_id):
+                self._last_seen.pop(number, None)
+
+    def _evict_overflow(self):
+        """Evict the oldest numbers until the index is back under max_entries"""
+        while len(self._last_seen) > self.max_entries and self._buckets:
+            bucket_id = next(iter(self._buckets))
+            bucket = self._buckets[bucket_id]
+            if bucket:
+                self._last_seen.pop(bucket.pop(), None)
+            if not bucket:
+                del self._buckets[bucket_id]
+
+    def contains(self, number, now=None):
+        """Check if a number was seen within the retention window"""
+        now = time.time() if now is None else now
+        self._expire(now)
+        return normalize_number(number) in self._last_seen
+
+    def add(self, number, now=None):
+        """Record a number as seen now, refreshing its position if it was already known"""
+        now = time.time() if now is None else now
+        self._expire(now)
+        number = normalize_number(number)
+        bucket_id = self._bucket_id(now)
+
+        previous = self._last_seen.get(number)
+        if previous == bucket_id:
+            return
+        if previous is not None:
+            self._buckets[previous].discard(number)
+            if not self._buckets[previous]:
+                del self._buckets[previous]
+
+        if bucket_id not in self._buckets:
+            self._buckets[bucket_id] = set()
+        self._buckets[bucket_id].add(number)
+        self._last_seen[number] = bucket_id
+        self._evict_overflow()
+
+    def to_dict(self):
+        """Serialize the index for persistence"""
+        return {str(bucket_id): sorted(bucket) for bucket_id, bucket in self._buckets.items()}
+
+    @classmethod
+    def from_dict(cls, data, **kwargs):
+        """Rebuild an index saved with to_dict"""
+        index = cls(**kwargs)
+        if isinstance(data, dict):
+            for bucket_id in sorted(data, key=int):
+                bucket = set(data[bucket_id])
+                index._buckets[int(bucket_id)] = bucket
+                for number in bucket:
+                    index._last_seen[number] = int(bucket_id)
+        index._evict_overflow()
+        return index
+
+
+# Indexes per site_id, plus an optional global one shared by all sites
+seen_indexes = {}
+global_index = None
+
+
+def restore_seen_numbers():
+    """Load the persisted indexes; call after load_website_data"""
+    global global_index
+    section = get_state_section(SEEN_SECTION, {}) or {}
+    seen_indexes.clear()
+    for site_id, data in section.get("sites", {}).items():
+        seen_indexes[site_id] = SeenNumberIndex.from_dict(data)
+    global_index = SeenNumberIndex.from_dict(section.get("global")) if SEEN_NUMBERS_GLOBAL else None
+
+
+def seen_section():
+    return {
+        "sites": {site_id: index.to_dict() for site_id, index in seen_indexes.items()},
+        "global": global_index.to_dict() if global_index is not None else None
+    }
+
+
+async def record_seen_numbers(site_id, numbers):
+    """
+    Record numbers about to be announced for a site.
+
+    Returns True if at least one of them has not been seen within the retention window (per site, and
+    across all sites when SEEN_NUMBERS_GLOBAL is enabled), i.e. when a notification should be sent.
+    Runs on the state actor, which saves the indexes with the rest of the batch.
+    """
+    global global_index
+    if SEEN_NUMBERS_GLOBAL and global_index is None:
+        global_index = SeenNumberIndex()
+    index = seen_indexes.setdefault(site_id, SeenNumberIndex())
+
+    now = time.time()
+    numbers = [number for number in numbers if number not in (None, "")]
+    has_unseen = False
+    for number in numbers:
+        if not index.contains(number, now) and (global_index is None or not global_index.contains(number, now)):
+            has_unseen = True
+        index.add(number, now)
+        if global_index is not None:
+            global_index.add(number, now)
+
+    if numbers:
+        state_actor.mark_section_dirty(SEEN_SECTION, seen_section)
+    return has_unseen or not numbers
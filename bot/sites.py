@@ -0,0 +1,120 @@
+from bisect import bisect_left
+from bot.storage import storage
+from bot.utils import extract_website_name, get_base_url
+from bot.state_actor import state_actor
+
+
+class SiteEntry:
+    """Display metadata of a configured website, computed once when the registry is built"""
+
+    __slots__ = ("site_id", "short_id", "name", "url", "type")
+
+    def __init__(self, site_id, short_id, url, website_type):
+        self.site_id = site_id
+        self.short_id = short_id
+        self.url = url or ""
+        self.type = website_type
+        self.name = extract_website_name(url, website_type)
+
+
+class SiteRegistry:
+    """
+    Index of the configured websites by site_id, numeric short ID and display name.
+
+    Built from storage["websites"] at startup and rebuilt when a lookup misses because the
+    configuration changed, or when a poll detects a site's type, which its display name depends on.
+    Menus and callbacks never re-parse URLs or probe site_id strings.
+    """
+
+    def __init__(self):
+        self.by_site_id = {}
+        self.by_short_id = {}
+        self.by_name = {}
+        self.sorted_names = []  # (lowercase display name, site_id), for prefix search
+        self.version = 0  # Bumped on every rebuild, so caches of rendered site lists can tell they are stale
+
+    def __len__(self):
+        return len(self.by_site_id)
+
+    def rebuild(self, websites=None):
+        websites = storage["websites"] if websites is None else websites
+        self.by_site_id.clear()
+        self.by_short_id.clear()
+        self.by_name.clear()
+        for site_id, website in websites.items():
+            # Prefer the configured position so short IDs match URL_<n>; fall back to the next free number
+            short_id = getattr(website, "position", None)
+            if not isinstance(short_id, int) or short_id in self.by_short_id:
+                short_id = max(self.by_short_id, default=0) + 1
+            entry = SiteEntry(site_id, short_id, getattr(website, "url", ""), getattr(website, "type", None))
+            self.by_site_id[site_id] = entry
+            self.by_short_id[short_id] = entry
+            self.by_name.setdefault(entry.name.lower(), entry)
+        self.sorted_names = sorted((entry.name.lower(), entry.site_id) for entry in self.by_site_id.values())
+        self.version += 1
+
+    def on_state_change(self, event):
+        """Rebuild when a committed change gave a site another type than its entry was named for"""
+        entry = self.by_site_id.get(event.get("site_id"))
+        website = storage["websites"].get(event.get("site_id"))
+        if entry is not None and website is not None and entry.type != getattr(website, "type", None):
+            self.rebuild()
+
+    def _lookup(self, key):
+        key = str(key).strip()
+        entry = self.by_site_id.get(key)
+        if entry is None and key.isdigit():
+            entry = self.by_short_id.get(int(key))
+        if entry is None:
+            entry = self.by_name.get(key.lower())
+        return entry
+
+    def get(self, key):
+        """Entry of a site by site_id, short ID or display name (case-insensitive), or None"""
+        if key is None:
+            return None
+        entry = self._lookup(key)
+        if entry is None and self.by_site_id.keys() != storage["websites"].keys():
+            self.rebuild()
+            entry = self._lookup(key)
+        return entry
+
+    def resolve(self, key):
+        """site_id of a site given any of its keys, or None"""
+        entry = self.get(key)
+        return entry.site_id if entry else None
+
+    def short_id(self, site_id):
+        entry = self.get(site_id)
+        return entry.short_id if entry else None
+
+    def name(self, site_id):
+        entry = self.get(site_id)
+        return entry.name if entry else "Unknown"
+
+    def url(self, site_id):
+        """Base URL of a site's pages, or the first configured URL if the site is unknown"""
+        entry = self.get(site_id)
+        return entry.url if entry else get_base_url()
+
+    def search(self, prefix):
+        """Entries whose display name starts with prefix (case-insensitive), by name; O(log n + matches)"""
+        self.entries()
+        prefix = prefix.lower()
+        start = bisect_left(self.sorted_names, (prefix,))
+        matches = []
+        for name, site_id in self.sorted_names[start:]:
+            if not name.startswith(prefix):
+                break
+            matches.append(self.by_site_id[site_id])
+        return matches
+
+    def entries(self):
+        """Entries in configuration order"""
+        if self.by_site_id.keys() != storage["websites"].keys():
+            self.rebuild()
+        return list(self.by_site_id.values())
+
+
+site_registry = SiteRegistry()
+state_actor.add_listener(site_registry.on_state_change)
@@ -0,0 +1,171 @@
+import asyncio
+import inspect
+from bot.storage import storage, save_websites_data, runtime_state, RUNTIME_SECTION
+
+# Kinds of change event, given with apply(); listeners dispatch on these rather than on command names
+STATE_CHANGED = "state_changed"  # A handler changed a site's state
+SITE_POLLED = "site_polled"  # A poll applied new data from the origin
+SITE_TOGGLED = "site_toggled"  # Monitoring of a site was switched on or off
+
+
+class StateActor:
+    """
+    Single owner of website state.
+
+    Handlers and the monitor loop never mutate WebsiteMonitor objects directly; they queue a command
+    with apply(). Commands run one at a time in submission order, so read-modify-write sequences such
+    as updating last_number cannot interleave. All commands queued during a burst are applied
+    together, then every site and state section they touched is persisted with one write and a
+    change event is published for each command.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._task = None
+        self._subscribers = []
+        self._listeners = []
+        self._touched_sites = set()
+        self._dirty_sections = {}
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    def _put(self, mutation, args, site_id, event):
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((mutation, args, site_id, event, future))
+        return future
+
+    async def apply(self, mutation, *args, site_id=None, event=STATE_CHANGED):
+        """
+        Run mutation(*args) on the state owner task and return its result once the change is
+        persisted. mutation may be a plain function or a coroutine function; site_id names the
+        website to persist afterwards, and event the type of the change events published for it.
+        """
+        return await self._put(mutation, args, site_id, event)
+
+    def submit(self, mutation, *args, site_id=None, event=STATE_CHANGED):
+        """
+        Queue a command like apply() without waiting for it, e.g. for bookkeeping whose result the
+        caller does not need. Commands submitted before the actor runs its next batch share one write.
+        Returns a future resolved once the change is persisted; errors are logged.
+        """
+        future = self._put(mutation, args, site_id, event)
+        future.add_done_callback(_log_command_error)
+        return future
+
+    def mark_dirty(self, site_id):
+        """Mark a website for saving at the end of the current batch; only call from inside a command"""
+        self._touched_sites.add(site_id)
+
+    def mark_section_dirty(self, name, build):
+        """
+        Save the state section name at the end of the current batch, as returned by build() then;
+        only call from inside a command. Marking a section again in the same batch writes it once.
+        """
+        self._dirty_sections[name] = build
+
+    def subscribe(self, maxsize=100):
+        """Get a queue that receives a {"site_id", "type", "command"} event for each website a committed command changed"""
+        events = asyncio.Queue(maxsize=maxsize)
+        self._subscribers.append(events)
+        return events
+
+    def unsubscribe(self, events):
+        if events in self._subscribers:
+            self._subscribers.remove(events)
+
+    def add_listener(self, callback):
+        """Call callback(event) synchronously for each change event, e.g. to invalidate a cache"""
+        self._listeners.append(callback)
+
+    def _publish(self, event):
+        for callback in self._listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Error in state listener: {e}")
+        for events in self._subscribers:
+            try:
+                events.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow subscriber; it will catch up from the state itself
+                pass
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            # Let handlers that are ready to run queue their commands so a burst is committed together
+            await asyncio.sleep(0)
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            results = []
+            self._dirty_sections = {}
+            for mutation, args, site_id, event, future in batch:
+                self._touched_sites = {site_id} if site_id else set()
+                try:
+                    result = mutation(*args)
+                    if inspect.isawaitable(result):
+                        result = await result
+                    results.append((result, None, self._touched_sites))
+                except Exception as e:
+                    results.append((None, e, set()))
+
+            dirty_sites = set().union(*(touched for _, _, touched in results))
+            try:
+                sections = {name: build() for name, build in self._dirty_sections.items()}
+                await save_websites_data(dirty_sites, sections)
+            except Exception as e:
+                print(f"Error saving website data: {e}")
+
+            for (mutation, _, _, event, future), (result, error, touched) in zip(batch, results):
+                if error is not None:
+                    if not future.cancelled():
+                        future.set_exception(error)
+                    continue
+                if not future.cancelled():
+                    future.set_result(result)
+                command = getattr(mutation, "__name__", repr(mutation))
+                for site_id in touched:
+                    self._publish({"site_id": site_id, "type": event, "command": command})
+
+
+def _log_command_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Error applying state command: {future.exception()}")
+
+
+state_actor = StateActor()
+
+
+async def apply_state(mutation, *args, site_id=None, event=STATE_CHANGED):
+    """Queue a state mutation on the shared state actor and wait until it is applied and saved"""
+    return await state_actor.apply(mutation, *args, site_id=site_id, event=event)
+
+
+def save_state_section(name, build):
+    """
+    Persist the named state section, as returned by build() at write time, with the state actor's
+    next batch. Returns a future to await when the caller must know it is on disk.
+    """
+    return state_actor.submit(state_actor.mark_section_dirty, name, build)
+
+
+def save_runtime_state():
+    """Persist the latest notification, active countdowns and repeat settings"""
+    return save_state_section(RUNTIME_SECTION, runtime_state)
+
+
+async def save_website_data(site_id=None):
+    """Persist one website, or all of them"""
+    site_ids = [site_id] if site_id else list(storage["websites"])
+    await state_actor.apply(lambda: [state_actor.mark_dirty(site_id) for site_id in site_ids])
+
+
+async def save_last_number(number, site_id):
+    """Save last number for a specific website"""
+    if site_id in storage["websites"]:
+        await apply_state(setattr, storage["websites"][site_id], "last_number", number, site_id=site_id)
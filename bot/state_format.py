@@ -0,0 +1,185 @@
+"""
+Versioned binary state file format.
+
+Layout (all integers little-endian):
+
+    header   MAGIC (4 bytes) | version (u16) | record count (u32) | index offset (u64)
+    records  encoded values, one after another
+    index    keys length (u32) | keys (utf-8, newline separated) | per record: offset (u64), length (u32)
+
+Only the header and the index are parsed when a file is opened; records are decoded on demand
+from a memory map, so reading one site does not require decoding the whole file, and rewriting
+a file can copy unchanged records byte for byte.
+
+Records are compact UTF-8 JSON, which keeps the format readable by any tool and lets decoding
+run in the C JSON parser; the version field allows changing the record encoding later.
+"""
+import os
+import json
+import mmap
+import struct
+
+MAGIC = b"TBST"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHIQ")
+_INDEX_ENTRY = struct.Struct("<QI")
+_KEYS_LENGTH = struct.Struct("<I")
+
+_encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+_decoder = json.JSONDecoder()
+
+
+class StateFormatError(ValueError):
+    """Raised when a state file is not in a format this version can read"""
+
+
+def encode_value(value):
+    """Encode a value to bytes"""
+    return _encoder.encode(value).encode("utf-8")
+
+
+def decode_value(data):
+    """Decode bytes produced by encode_value"""
+    return _decoder.decode(bytes(data).decode("utf-8"))
+
+
+# --- Files ---
+
+class StateFile:
+    """
+    Read-only view of a binary state file.
+
+    Opening parses just the header and index; get() decodes a single record from the memory map.
+    Use as a context manager, or call close(), before the file is replaced.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < _HEADER.size:
+                raise StateFormatError(f"{path} is too short to be a state file")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, count, index_offset = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise StateFormatError(f"{path} is not a state file")
+            if version > VERSION:
+                raise StateFormatError(f"{path} uses state format version {version}, newer than {VERSION}")
+            self.version = version
+            self._index = self._read_index(count, index_offset)
+        except struct.error as e:
+            self.close()
+            raise StateFormatError(f"{path} is truncated: {e}")
+        except Exception:
+            self.close()
+            raise
+
+    def _read_index(self, count, pos):
+        buf = self._map
+        (keys_length,) = _KEYS_LENGTH.unpack_from(buf, pos)
+        pos += _KEYS_LENGTH.size
+        keys = buf[pos:pos + keys_length].decode("utf-8").split("\n") if count else []
+        pos += keys_length
+        entries = struct.iter_unpack(_INDEX_ENTRY.format, buf[pos:pos + count * _INDEX_ENTRY.size])
+        return dict(zip(keys, entries))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def keys(self):
+        return self._index.keys()
+
+    def raw(self, key):
+        """Get the encoded bytes of a record"""
+        offset, length = self._index[key]
+        return self._map[offset:offset + length]
+
+    def get(self, key, default=None):
+        """Decode a single record"""
+        if key not in self._index:
+            return default
+        return decode_value(self.raw(key))
+
+    def to_dict(self):
+        """Decode every record"""
+        return {key: self.get(key) for key in self._index}
+
+    def close(self):
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def write_state_file(path, records, raw_records=None):
+    """
+    Atomically write a state file.
+
+    records maps keys to values to encode; raw_records maps keys to already-encoded bytes (e.g. from
+    StateFile.raw) and is used for keys not present in records.
+    """
+    entries = {}
+    if raw_records:
+        entries.update(raw_records)
+    for key, value in records.items():
+        entries[key] = encode_value(value)
+
+    keys = []
+    offsets = bytearray()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"\0" * _HEADER.size)
+        offset = _HEADER.size
+        for key, data in entries.items():
+            if "\n" in key:
+                raise ValueError(f"State file keys cannot contain newlines: {key!r}")
+            f.write(data)
+            keys.append(key)
+            offsets += _INDEX_ENTRY.pack(offset, len(data))
+            offset += len(data)
+        key_bytes = "\n".join(keys).encode("utf-8")
+        f.write(_KEYS_LENGTH.pack(len(key_bytes)) + key_bytes + offsets)
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, len(entries), offset))
+    os.replace(tmp_path, path)
+
+
+def update_state_file(path, records, encoded=False):
+    """
+    Rewrite a state file with some records replaced (a value of None for a key removes it).
+    Unchanged records are copied without being decoded. With encoded=True the values are bytes
+    from encode_value, so the caller can encode them before handing the write to another thread.
+    """
+    raw_records = {}
+    if os.path.exists(path):
+        with StateFile(path) as state:
+            for key in state.keys():
+                if key not in records:
+                    raw_records[key] = state.raw(key)
+    replaced = {key: value for key, value in records.items() if value is not None}
+    if encoded:
+        raw_records.update(replaced)
+        replaced = {}
+    write_state_file(path, replaced, raw_records)
+
+
+def migrate_json_state(json_path, path):
+    """One-shot migration of a legacy JSON state file; the JSON file is kept as a .bak copy"""
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    write_state_file(path, data)
+    os.replace(json_path, f"{json_path}.bak")
+    return data
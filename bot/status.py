@@ -0,0 +1,217 @@
+import time
+import asyncio
+from html import escape
+from bot.config import CHECK_INTERVAL, STATUS_DASHBOARD_INTERVAL
+from bot.storage import storage, get_state_section
+from bot.sites import site_registry
+from bot.state_actor import state_actor, save_state_section, SITE_POLLED, SITE_TOGGLED
+from bot.outbound import send_outbound, is_not_modified, PRIORITY_INTERACTIVE, PRIORITY_COSMETIC
+
+DASHBOARDS_SECTION = "status_dashboards"
+
+
+def format_clock(timestamp):
+    return time.strftime("%d %b %H:%M:%S", time.localtime(timestamp))
+
+
+class SiteStatus:
+    """Health of one website, updated as its polls finish"""
+
+    __slots__ = ("last_poll", "interval", "latency", "failures", "last_error", "last_change")
+
+    def __init__(self):
+        self.last_poll = None
+        self.interval = None  # Seconds between the last two polls
+        self.latency = None  # Seconds the last fetch and parse took
+        self.failures = 0  # Consecutive polls that raised or found no data
+        self.last_error = None
+        self.last_change = None
+
+
+class StatusBoard:
+    """
+    Per-site status shown by /status and kept up to date in pinned dashboard messages.
+
+    Polls and state changes update their site's record and re-render only that site's line; the
+    report joins the cached lines, so answering /status does not format every website again.
+    Dashboards are edited at most every STATUS_DASHBOARD_INTERVAL seconds, and only when the report
+    changed since they were last edited.
+    """
+
+    def __init__(self, interval=STATUS_DASHBOARD_INTERVAL):
+        self.interval = interval
+        self._sites = {}  # site_id -> SiteStatus
+        self._lines = {}  # site_id -> rendered line
+        self._body = None  # Lines joined in registry order, None once a line changed
+        self._registry_version = None
+        self._failing = set()
+        self._last_poll = None
+        self._dashboards = {}  # chat_id -> {"message_id", "text" last shown}
+        self._bot = None
+        self._task = None
+
+    def status(self, site_id):
+        site = self._sites.get(site_id)
+        if site is None:
+            site = self._sites[site_id] = SiteStatus()
+        return site
+
+    def _changed(self, site_id):
+        self._lines.pop(site_id, None)
+        self._body = None
+
+    def record_poll(self, site_id, started, latency, error=None):
+        """Record a finished poll; error is the exception raised or a reason such as "no data", None on success"""
+        site = self.status(site_id)
+        if site.last_poll is not None:
+            site.interval = started - site.last_poll
+        site.last_poll = started
+        site.latency = latency
+        if error is None:
+            site.failures = 0
+            site.last_error = None
+            self._failing.discard(site_id)
+        else:
+            site.failures += 1
+            site.last_error = str(error) or type(error).__name__
+            self._failing.add(site_id)
+        self._last_poll = started
+        self._changed(site_id)
+
+    def on_state_change(self, event):
+        site_id = event.get("site_id")
+        if event.get("type") == SITE_POLLED:
+            # A poll committed new numbers
+            self.status(site_id).last_change = time.time()
+            self._changed(site_id)
+        elif event.get("type") == SITE_TOGGLED:
+            # Disabled sites are not polled, so they do not count as failing
+            website = storage["websites"].get(site_id)
+            if website is not None and website.enabled and self.status(site_id).failures:
+                self._failing.add(site_id)
+            else:
+                self._failing.discard(site_id)
+            self._changed(site_id)
+
+    def _render_line(self, site_id):
+        website = storage["websites"].get(site_id)
+        name = escape(site_registry.name(site_id) or site_id)
+        site = self._sites.get(site_id)
+        if website is not None and not website.enabled:
+            return f"⏸ <b>{name}</b>: disabled"
+        if site is None or site.last_poll is None:
+            return f"⏳ <b>{name}</b>: not polled yet"
+
+        parts = []
+        if site.failures:
+            parts.append(f"{site.failures} failed poll{'s' if site.failures > 1 else ''} ({escape(site.last_error)})")
+        parts.append(f"changed {format_clock(site.last_change)}" if site.last_change else "no change seen")
+        parts.append(f"every {site.interval:.0f}s" if site.interval is not None else f"every {CHECK_INTERVAL}s")
+        parts.append(f"fetch {site.latency * 1000:.0f}ms")
+        icon = "❌" if site.failures else "✅"
+        return f"{icon} <b>{name}</b>: {', '.join(parts)}"
+
+    def render(self):
+        """The status report, as HTML"""
+        if self._registry_version != site_registry.version:
+            self._registry_version = site_registry.version
+            self._lines.clear()
+            self._body = None
+
+        if self._body is None:
+            lines = []
+            for entry in site_registry.entries():
+                line = self._lines.get(entry.site_id)
+                if line is None:
+                    line = self._lines[entry.site_id] = self._render_line(entry.site_id)
+                lines.append(line)
+            self._body = "\n".join(lines)
+
+        header = f"📡 <b>Status</b>: {len(storage['websites'])} sites, {len(self._failing)} failing"
+        if self._last_poll is not None:
+            header += f"\nLast poll {format_clock(self._last_poll)}"
+        return f"{header}\n\n{self._body}"
+
+    def start(self, bot):
+        """Keep the restored dashboards up to date"""
+        self._bot = bot
+        saved = get_state_section(DASHBOARDS_SECTION)
+        if isinstance(saved, dict):
+            self._dashboards = {
+                chat_id: {"message_id": message_id, "text": None}
+                for chat_id, message_id in saved.items() if message_id
+            }
+        self._ensure_running()
+
+    def is_pinned(self, chat_id):
+        return str(chat_id) in self._dashboards
+
+    async def pin(self, bot, chat_id):
+        """Send the report to a chat and pin it there as a dashboard, replacing the chat's previous one"""
+        self._bot = bot
+        text = self.render()
+        message = await send_outbound(PRIORITY_INTERACTIVE, chat_id,
+                                      lambda: bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML"))
+        await self.unpin(chat_id)
+        self._dashboards[str(chat_id)] = {"message_id": message.message_id, "text": text}
+        self.save()
+        try:
+            await send_outbound(PRIORITY_INTERACTIVE, chat_id, lambda: bot.pin_chat_message(
+                chat_id=chat_id, message_id=message.message_id, disable_notification=True))
+        except Exception as e:
+            # Without the right to pin, the message is still kept up to date
+            print(f"Error pinning status dashboard in {chat_id}: {e}")
+        self._ensure_running()
+
+    async def unpin(self, chat_id):
+        """Stop updating a chat's dashboard and unpin it; returns False if the chat had none"""
+        dashboard = self._dashboards.pop(str(chat_id), None)
+        if dashboard is None:
+            return False
+        self.save()
+        try:
+            await send_outbound(PRIORITY_COSMETIC, chat_id, lambda: self._bot.unpin_chat_message(
+                chat_id=chat_id, message_id=dashboard["message_id"]))
+        except Exception as e:
+            print(f"Error unpinning status dashboard in {chat_id}: {e}")
+        return True
+
+    def save(self):
+        return save_state_section(DASHBOARDS_SECTION, lambda: {
+            chat_id: dashboard["message_id"] for chat_id, dashboard in self._dashboards.items()
+        })
+
+    def _ensure_running(self):
+        if self._bot is None or not self._dashboards:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self._dashboards:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self):
+        """Edit the dashboards whose report changed since they were last edited"""
+        text = self.render()
+        for chat_id, dashboard in list(self._dashboards.items()):
+            if dashboard["text"] == text:
+                continue
+            try:
+                await send_outbound(PRIORITY_COSMETIC, chat_id, lambda: self._bot.edit_message_text(
+                    chat_id=chat_id, message_id=dashboard["message_id"], text=text, parse_mode="HTML"))
+                dashboard["text"] = text
+            except Exception as e:
+                if is_not_modified(e):
+                    dashboard["text"] = text
+                elif "message to edit not found" in str(e):
+                    # Deleted by a user: stop updating it
+                    self._dashboards.pop(chat_id, None)
+                    self.save()
+                else:
+                    print(f"Error updating status dashboard in {chat_id}: {e}")
+
+
+status_board = StatusBoard()
+state_actor.add_listener(status_board.on_state_change)
@@ -1,127 +1,192 @@
 import os
 import json
+import asyncio
+from bot.config import ENABLE_REPEAT_NOTIFICATION
+from bot.state_format import StateFile, StateFormatError, encode_value, update_state_file, write_state_file, migrate_json_state
 
 # Storage
 storage = {
-    "file": "website_data.json",
+    "file": "website_data.bin",
+    "legacy_file": "website_data.json",  # Migrated to the binary format on first load
     "websites": {},  # Will store WebsiteMonitor instances
     "repeat_interval": None,
+    "repeat_enabled": ENABLE_REPEAT_NOTIFICATION,  # Toggled by /set_repeat, /stop_repeat and the settings menu
     "latest_notification": {"message_id": None, "number": None, "flag_url": None, "site_id": None, "multiple": False, "is_first_run": False},
-    "active_countdown_tasks": {}
+    "countdowns": {},  # site_id -> chat_id -> {"message_id", "chat_id", "started_at", "interval"}, persisted so countdowns survive restarts
+    "sections": {}  # Extra named state stored in the data file (keys prefixed with "_"), filled by load_website_data
 }
 
-async def load_website_data():
-    """Load website data from file"""
-    data = {}
-    if os.path.exists(storage["file"]):
+# Section under which notification/countdown state is stored next to the per-site data
+RUNTIME_SECTION = "runtime"
+
+def _open_state_file():
+    """Open the state file for lazy reads, migrating the legacy JSON file on first use"""
+    if not os.path.exists(storage["file"]) and os.path.exists(storage["legacy_file"]):
         try:
-            with open(storage["file"], "r") as f:
-                data = json.load(f)
-                # print(f"[DEBUG] load_website_data - loaded data from file: {data}")
-
-                # Load data for each website
-                for site_id, website in storage["websites"].items():
-                    if site_id in data:
-                        # print(f"[DEBUG] load_website_data - loading data for {site_id}")
-                        # Load last_number from the file for all website types
-                        website.last_number = data[site_id].get("last_number")
-
-                        # For multiple numbers website, also load latest_numbers
-                        if website.type == "multiple":
-                            latest_numbers = data[site_id].get("latest_numbers", [])
-                            if latest_numbers:
-                                website.latest_numbers = latest_numbers
-
-                                # If last_number is not set, extract it from first element
-                                if website.last_number is None and latest_numbers:
-                                    first_num = latest_numbers[0]
-                                    if isinstance(first_num, str) and first_num.startswith("+"):
-                                        first_num = first_num[1:]
-                                    try:
-                                        website.last_number = int(first_num)
-                                    except (ValueError, TypeError):
-                                        website.last_number = None
-
-                        # Load button_updated state if it exists
-                        if "button_updated" in data[site_id]:
-                            website.button_updated = data[site_id]["button_updated"]
-                            # print(f"[DEBUG] load_website_data - loaded button_updated={website.button_updated} for {site_id}")
-        except (json.JSONDecodeError, IOError) as e:
-            # print(f"Error loading website data: {e}")
-            pass
-    return data
+            migrate_json_state(storage["legacy_file"], storage["file"])
+            print(f"Migrated {storage['legacy_file']} to {storage['file']}")
+        except (json.JSONDecodeError, IOError, TypeError) as e:
+            print(f"Error migrating website data: {e}")
 
-async def save_website_data(site_id=None):
-    # Load existing data
-    data = {}
     if os.path.exists(storage["file"]):
         try:
-            with open(storage["file"], "r") as f:
-                data = json.load(f)
-                # print(f"[DEBUG] save_website_data - loaded existing data: {data}")
-        except (json.JSONDecodeError, IOError) as e:
-            # print(f"[DEBUG] save_website_data - error loading existing data: {e}")
-            pass
-
-    # Update data
-    if site_id:
-        # Update just one website
-        if site_id in storage["websites"]:
-            website = storage["websites"][site_id]
-            # print(f"[DEBUG] website object for {site_id}: {website}")
-            # print(f"[DEBUG] button_updated state: {getattr(website, 'button_updated', False)}")
-            # if hasattr(website, 'latest_numbers'):
-                # print(f"[DEBUG] latest_numbers for {site_id}: {website.latest_numbers}")
-            # else:
-                # print(f"[DEBUG] latest_numbers for {site_id}: None (attribute missing)")
-            
-            # For multiple numbers websites, save last_number and always include latest_numbers (empty if not set)
-            if website.type == "multiple":
-                data[site_id] = {
-                    "last_number": website.last_number,
-                    "latest_numbers": website.latest_numbers
-                }
-                # Ensure latest_numbers is always an array
-                if data[site_id]["latest_numbers"] is None:
-                    data[site_id]["latest_numbers"] = []
-            else:
-                # For all other websites, just save the last_number
-                data[site_id] = {
-                    "last_number": website.last_number
-                }
+            return StateFile(storage["file"])
+        except (StateFormatError, IOError, ValueError) as e:
+            print(f"Error loading website data: {e}")
+    return None
 
-    else:
-        # Update all websites
-        for site_id, website in storage["websites"].items():
-            # print(f"[DEBUG] save_website_data - processing {site_id}")
-            # if hasattr(website, 'latest_numbers'):
-            #     print(f"[DEBUG] save_website_data - latest_numbers for {site_id}: {website.latest_numbers}")
-            # else:
-            #     print(f"[DEBUG] save_website_data - latest_numbers for {site_id}: None (attribute missing)")
-            if website.type == "multiple":
-                data[site_id] = {
-                    "last_number": website.last_number,
-                    "latest_numbers": website.latest_numbers
-                }
-                if data[site_id]["latest_numbers"] is None:
-                    data[site_id]["latest_numbers"] = []
-            else:
-                data[site_id] = {
-                    "last_number": website.last_number
-                }
-
-    # Save to file
+def _update_state_file(path, records):
+    """Replace some records (encoded with encode_value) in the state file, copying the others unchanged"""
     try:
-        with open(storage["file"], "w") as f:
-            json.dump(data, f)
-            # print(f"[DEBUG] save_website_data - saved data to file: {data}")
+        update_state_file(path, records, encoded=True)
+    except (StateFormatError, ValueError) as e:
+        # Unreadable file: start a fresh one rather than failing every save
+        print(f"Error reading website data, rewriting it: {e}")
+        try:
+            write_state_file(path, {}, {key: value for key, value in records.items() if value is not None})
+        except IOError:
+            pass
     except IOError as e:
         # print(f"Error saving website data: {e}")
         pass
 
-async def save_last_number(number, site_id):
-    """Save last number for a specific website"""
-    if site_id in storage["websites"]:
-        website = storage["websites"][site_id]
-        website.last_number = number
-        await save_website_data(site_id)
+def _restore_runtime_state(runtime):
+    """Restore notification and countdown state saved by save_runtime_state"""
+    if not isinstance(runtime, dict):
+        return
+
+    latest = runtime.get("latest_notification")
+    if isinstance(latest, dict):
+        storage["latest_notification"].update(latest)
+
+    countdowns = runtime.get("countdowns")
+    if isinstance(countdowns, dict):
+        # Only keep countdowns for websites that are still configured
+        storage["countdowns"] = {}
+        for site_id, chats in countdowns.items():
+            if site_id not in storage["websites"] or not isinstance(chats, dict):
+                continue
+            if "message_id" in chats:
+                # Saved before countdowns were kept per chat: one countdown, in its chat_id
+                chats = {str(chats.get("chat_id")): chats}
+            chats = {chat_id: countdown for chat_id, countdown in chats.items() if countdown.get("message_id")}
+            if chats:
+                storage["countdowns"][site_id] = chats
+
+    if runtime.get("repeat_interval") is not None:
+        storage["repeat_interval"] = runtime["repeat_interval"]
+
+    if runtime.get("repeat_enabled") is not None:
+        storage["repeat_enabled"] = runtime["repeat_enabled"]
+
+def _load_website_record(website, record):
+    """Apply a persisted record to a website"""
+    # Load last_number from the file for all website types
+    website.last_number = record.get("last_number")
+
+    # For multiple numbers website, also load latest_numbers
+    if website.type == "multiple":
+        latest_numbers = record.get("latest_numbers", [])
+        if latest_numbers:
+            website.latest_numbers = latest_numbers
+
+            # If last_number is not set, extract it from first element
+            if website.last_number is None and latest_numbers:
+                first_num = latest_numbers[0]
+                if isinstance(first_num, str) and first_num.startswith("+"):
+                    first_num = first_num[1:]
+                try:
+                    website.last_number = int(first_num)
+                except (ValueError, TypeError):
+                    website.last_number = None
+
+    # The flag is needed to re-send the notification, e.g. by a repeat reminder after a restart
+    if record.get("flag_url"):
+        website.flag_url = record["flag_url"]
+
+    # Load button_updated state if it exists
+    if "button_updated" in record:
+        website.button_updated = record["button_updated"]
+
+async def load_website_data():
+    """Load website data from file"""
+    data = {}
+    state = _open_state_file()
+    if state is None:
+        return data
+
+    try:
+        with state:
+            # Only decode the records of configured websites
+            for site_id, website in storage["websites"].items():
+                record = state.get(site_id)
+                if isinstance(record, dict):
+                    _load_website_record(website, record)
+                    data[site_id] = record
+
+            # Keep the named sections around for the modules that own them
+            storage["sections"] = {
+                key[1:]: state.get(key) for key in state.keys() if key.startswith("_")
+            }
+            data.update({f"_{name}": value for name, value in storage["sections"].items()})
+
+        # Reattach to the notification message and countdowns from the previous run
+        _restore_runtime_state(storage["sections"].get(RUNTIME_SECTION))
+    except ValueError as e:
+        print(f"Error loading website data: {e}")
+    return data
+
+def _serialize_website(website):
+    """Build the persisted record for a website"""
+    # For multiple numbers websites, save last_number and always include latest_numbers (empty if not set)
+    if website.type == "multiple":
+        record = {
+            "last_number": website.last_number,
+            "latest_numbers": list(website.latest_numbers or [])
+        }
+    else:
+        # For all other websites, just save the last_number
+        record = {
+            "last_number": website.last_number
+        }
+    if getattr(website, "flag_url", None):
+        record["flag_url"] = website.flag_url
+    # Keep the button state so reattached messages render the same keyboard after a restart
+    if getattr(website, "button_updated", False):
+        record["button_updated"] = True
+    return record
+
+async def save_websites_data(site_ids, sections=None):
+    """
+    Save several websites, and optionally named state sections, with a single write.
+
+    Only the state actor calls this; everything else saves through bot.state_actor.
+    """
+    # Collect the records that changed
+    data = {
+        site_id: _serialize_website(storage["websites"][site_id])
+        for site_id in site_ids if site_id in storage["websites"]
+    }
+    for name, value in (sections or {}).items():
+        storage["sections"][name] = value
+        data[f"_{name}"] = value
+
+    # Save to file; records of other websites are copied without decoding them. The records are
+    # encoded here, where nothing changes them meanwhile; copying and writing the file runs in a
+    # thread so large state files don't block the event loop
+    if data:
+        encoded = {key: encode_value(value) for key, value in data.items()}
+        await asyncio.to_thread(_update_state_file, storage["file"], encoded)
+
+def runtime_state():
+    """The runtime section: latest notification, active countdowns and repeat settings"""
+    return {
+        "latest_notification": storage["latest_notification"],
+        "countdowns": storage["countdowns"],
+        "repeat_interval": storage["repeat_interval"],
+        "repeat_enabled": storage["repeat_enabled"]
+    }
+
+def get_state_section(name, default=None):
+    """Get a named state section loaded from the data file"""
+    return storage["sections"].get(name, default)
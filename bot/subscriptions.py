@@ -0,0 +1,136 @@
+from bot.storage import storage, get_state_section
+from bot.state_actor import save_state_section
+from bot.config import CHAT_ID
+
+SUBSCRIPTIONS_SECTION = "subscriptions"
+ALL_SITES = "*"
+
+
+class SubscriptionRegistry:
+    """
+    Which chats receive the notifications of which sites.
+
+    A chat subscribes either to all sites or to a set of site_ids. Subscribers are indexed per site,
+    so finding the recipients of a notification does not scan every chat.
+    """
+
+    def __init__(self):
+        self._chats = {}  # chat_id -> set of site_ids, or None for all sites
+        self._by_site = {}  # site_id -> set of chat_ids subscribed to it explicitly
+        self._all_sites = set()  # chat_ids subscribed to every site
+        self._latency = {}  # chat_id -> delivery latency stats
+
+    def __len__(self):
+        return len(self._chats)
+
+    def __contains__(self, chat_id):
+        return str(chat_id) in self._chats
+
+    def chats(self):
+        return list(self._chats)
+
+    def sites_of(self, chat_id):
+        """Site_ids a chat is subscribed to, or None if it gets every site"""
+        sites = self._chats.get(str(chat_id))
+        return set(sites) if sites is not None else None
+
+    def subscribers(self, site_id):
+        """Chats that should receive a site's notifications"""
+        return sorted(self._all_sites | self._by_site.get(site_id, set()))
+
+    def _index(self, chat_id, sites):
+        if sites is None:
+            self._all_sites.add(chat_id)
+            return
+        for site_id in sites:
+            self._by_site.setdefault(site_id, set()).add(chat_id)
+
+    def _unindex(self, chat_id):
+        sites = self._chats.get(chat_id)
+        if sites is None:
+            self._all_sites.discard(chat_id)
+            return
+        for site_id in sites:
+            chats = self._by_site.get(site_id)
+            if chats:
+                chats.discard(chat_id)
+                if not chats:
+                    del self._by_site[site_id]
+
+    def subscribe(self, chat_id, site_ids=None):
+        """Subscribe a chat to some sites, or to all sites when site_ids is empty"""
+        chat_id = str(chat_id)
+        if chat_id in self._chats:
+            current = self._chats[chat_id]
+            if current is None:
+                return
+            self._unindex(chat_id)
+            sites = None if not site_ids else current | set(site_ids)
+        else:
+            sites = set(site_ids) if site_ids else None
+        self._chats[chat_id] = sites
+        self._index(chat_id, sites)
+
+    def unsubscribe(self, chat_id, site_ids=None):
+        """Unsubscribe a chat from some sites, or from everything when site_ids is empty"""
+        chat_id = str(chat_id)
+        if chat_id not in self._chats:
+            return
+        current = self._chats[chat_id]
+        self._unindex(chat_id)
+        if not site_ids:
+            del self._chats[chat_id]
+            return
+        if current is None:
+            current = set(storage["websites"])
+        sites = current - set(site_ids)
+        if sites:
+            self._chats[chat_id] = sites
+            self._index(chat_id, sites)
+        else:
+            del self._chats[chat_id]
+
+    def record_latency(self, chat_id, seconds):
+        """Record how long a notification took from detection to delivery in a chat"""
+        stats = self._latency.setdefault(str(chat_id), {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0})
+        stats["count"] += 1
+        stats["total"] += seconds
+        stats["max"] = max(stats["max"], seconds)
+        stats["last"] = seconds
+
+    def latency_metrics(self):
+        """Delivery latency per chat in milliseconds"""
+        return {
+            chat_id: {
+                "count": stats["count"],
+                "avg_ms": stats["total"] / stats["count"] * 1000,
+                "max_ms": stats["max"] * 1000,
+                "last_ms": stats["last"] * 1000
+            }
+            for chat_id, stats in self._latency.items()
+        }
+
+    def to_dict(self):
+        return {chat_id: ALL_SITES if sites is None else sorted(sites) for chat_id, sites in self._chats.items()}
+
+    def load(self, data):
+        self._chats.clear()
+        self._by_site.clear()
+        self._all_sites.clear()
+        for chat_id, sites in (data or {}).items():
+            self.subscribe(chat_id, None if sites == ALL_SITES else sites)
+
+
+subscriptions = SubscriptionRegistry()
+
+
+def restore_subscriptions():
+    """Load the persisted subscriptions; before any were saved, CHAT_ID gets every site"""
+    saved = get_state_section(SUBSCRIPTIONS_SECTION)
+    subscriptions.load(saved)
+    if saved is None and CHAT_ID:
+        subscriptions.subscribe(CHAT_ID)
+
+
+def save_subscriptions():
+    return save_state_section(SUBSCRIPTIONS_SECTION, subscriptions.to_dict)
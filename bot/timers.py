@@ -0,0 +1,90 @@
+import time
+import heapq
+import asyncio
+
+
+class TimerHeap:
+    """
+    Timers keyed by any hashable key, all run by a single task.
+
+    Scheduling or rescheduling a timer pushes a new heap entry (O(log n)); the entry it replaces is
+    skipped when it reaches the top because its version no longer matches, so cancel is O(1). The
+    task sleeps until the earliest timer, forgets it and awaits fire(key); fire schedules the key
+    again if it should repeat.
+    """
+
+    def __init__(self, name, fire=None):
+        self.name = name
+        self._fire = fire
+        self._timers = {}  # key -> (due, version)
+        self._heap = []  # (due, version, key); stale versions are skipped
+        self._version = 0
+        self._task = None
+        self._wakeup = None
+
+    def __len__(self):
+        return len(self._timers)
+
+    def __contains__(self, key):
+        return key in self._timers
+
+    def due(self, key):
+        timer = self._timers.get(key)
+        return timer[0] if timer else None
+
+    def start(self, fire):
+        """Start firing timers: fire(key) is awaited when one is due"""
+        self._fire = fire
+        self._ensure_running()
+
+    def schedule(self, key, due):
+        """Fire key at the timestamp due, replacing its current timer"""
+        self._version += 1
+        self._timers[key] = (due, self._version)
+        heapq.heappush(self._heap, (due, self._version, key))
+        # Rebuild once stale entries dominate, so the heap stays O(live timers)
+        if len(self._heap) > 2 * len(self._timers) + 64:
+            self._heap = [(due, version, key) for key, (due, version) in self._timers.items()]
+            heapq.heapify(self._heap)
+        self._ensure_running()
+
+    def cancel(self, key):
+        return self._timers.pop(key, None) is not None
+
+    def clear(self):
+        self._timers.clear()
+        self._heap.clear()
+
+    def _ensure_running(self):
+        if self._fire is None:
+            return
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        else:
+            self._wakeup.set()
+
+    async def _run(self):
+        while self._heap:
+            due, version, key = self._heap[0]
+            timer = self._timers.get(key)
+            if timer is None or timer[1] != version:
+                # Cancelled or rescheduled since this entry was pushed
+                heapq.heappop(self._heap)
+                continue
+
+            delay = due - time.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            del self._timers[key]
+            try:
+                await self._fire(key)
+            except Exception as e:
+                print(f"Error in {self.name} timer for {key}: {e}")
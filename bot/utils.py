@@ -1,10 +1,15 @@
 from typing import Tuple, Optional, List, Union
 import os
 import asyncio
+from functools import lru_cache
 import aiohttp
 from bs4 import BeautifulSoup, SoupStrainer
+from bot.outbound import send_outbound, PRIORITY_COSMETIC
+from bot.flags import local_flag_for_number, learn_flag
+from bot.dial_codes import match_dial_code
 
 # Helper function to get base URL from environment variable
+@lru_cache(maxsize=1)
 def get_base_url():
     """Get the base URL from environment variable without hardcoding any URL"""
     url = os.getenv('URL', '')
@@ -93,6 +98,69 @@ async def fetch_url_content(url):
                 print("Max retries reached. Giving up.")
                 return None
 
+def scrape_single_flag(soup):
+    """
+    Find the flag image on a single number page (fallback when no bundled flag matches).
+    Returns (flag_url, labelled), labelled being False when the image was picked by position or extension.
+    """
+    flag_url = None
+    # First, try to find a .png flag with alt containing 'country flag'
+    images = soup.find_all("img")
+    for img in images:
+        alt = img.get("alt", "")
+        src = img.get("data-lazy-src") or img.get("src") or ""
+        if "country flag" in alt.lower() and src.endswith(".png"):
+            return src, True
+    # If not found, fallback to the 18th <img> with .png extension
+    if not flag_url and len(images) > 18:
+        img = images[18]
+        src = img.get("data-lazy-src") or img.get("src") or ""
+        if src.endswith(".png"):
+            flag_url = src
+    # If still not found, fallback to any .png image
+    if not flag_url:
+        for img in images:
+            src = img.get("data-lazy-src") or img.get("src") or ""
+            if src.endswith(".png"):
+                flag_url = src
+                break
+    return flag_url, False
+
+def scrape_multiple_flag(soup, url):
+    """Find the flag image on a multiple numbers page (fallback when no bundled flag matches)"""
+    images = soup.select('img')
+    flag_url = None
+    if len(images) > 1:
+        flag_img = images[1]
+        flag_url = flag_img.get('data-lazy-src') or flag_img.get('src')
+        if flag_url and not flag_url.startswith(('http://', 'https://')):
+            base_url = url.rsplit('/', 2)[0]
+            flag_url = f"{base_url}{flag_url}"
+    return flag_url
+
+def parse_single_number(page_content):
+    soup = BeautifulSoup(page_content, "lxml")
+    latest_title_a = soup.select_one(".latest-added__title a")
+    if not latest_title_a:
+        return None, None
+    number = latest_title_a.get_text(strip=True)
+    # The flag comes from the number's dial code; the page is only scanned the first time a country is seen
+    flag_url = local_flag_for_number(number)
+    if not flag_url:
+        flag_url, labelled = scrape_single_flag(soup)
+        if labelled:
+            learn_flag(number, flag_url)
+    return number, flag_url
+
+def parse_multiple_numbers(page_content, url):
+    soup = BeautifulSoup(page_content, 'html.parser')
+    all_numbers = [button.text.strip() for button in soup.select('.numbutton')]
+    if not all_numbers:
+        return None, None
+    # The page's flag is picked by position, so it is used for this page only and never learned
+    flag_url = local_flag_for_number(all_numbers[0]) or scrape_multiple_flag(soup, url)
+    return all_numbers, flag_url
+
 async def parse_website_content(url, website_type):
     """Unified function to parse website content based on type"""
     page_content = await fetch_url_content(url)
@@ -103,56 +171,14 @@ async def parse_website_content(url, website_type):
     if website_type is None:
         # Try single
         try:
-            soup = BeautifulSoup(page_content, "lxml")
-            latest_title_a = soup.select_one(".latest-added__title a")
-            flag_url = None
-            # First, try to find a .png flag with alt containing 'country flag'
-            images = soup.find_all("img")
-            for img in images:
-                alt = img.get("alt", "")
-                src = img.get("data-lazy-src") or img.get("src") or ""
-                if "country flag" in alt.lower() and src.endswith(".png"):
-                    flag_url = src
-                    break
-            # If not found, fallback to the 18th <img> with .png extension
-            if not flag_url and len(images) > 18:
-                img = images[18]
-                src = img.get("data-lazy-src") or img.get("src") or ""
-                if src.endswith(".png"):
-                    flag_url = src
-            # If still not found, fallback to any .png image
-            if not flag_url:
-                for img in images:
-                    src = img.get("data-lazy-src") or img.get("src") or ""
-                    if src.endswith(".png"):
-                        flag_url = src
-                        break
-            if latest_title_a:
-                number = latest_title_a.get_text(strip=True)
-                # print(f"[DEBUG] parse_website_content - extracted number for single: {number}")
-                # print(f"[DEBUG] parse_website_content - extracted flag_url for single: {flag_url}")
+            number, flag_url = parse_single_number(page_content)
+            if number:
                 return number, flag_url
-            else:
-                # print(f"[DEBUG] parse_website_content - no .latest-added__title a found for single")
-                pass
         except Exception as e:
             print(f"Error parsing single number website: {e}")
         # Try multiple
         try:
-            soup = BeautifulSoup(page_content, 'html.parser')
-            all_numbers = [button.text.strip() for button in soup.select('.numbutton')]
-            images = soup.select('img')
-            flag_url = None
-            if len(images) > 1:
-                flag_img = images[1]
-                flag_url = flag_img.get('data-lazy-src') or flag_img.get('src')
-                if flag_url and not flag_url.startswith(('http://', 'https://')):
-                    base_url = url.rsplit('/', 2)[0]
-                    flag_url = f"{base_url}{flag_url}"
-            if all_numbers:
-                # print(f"[DEBUG] parse_website_content - extracted numbers for multiple: {all_numbers}")
-                # print(f"[DEBUG] parse_website_content - extracted flag_url for multiple: {flag_url}")
-                return all_numbers, flag_url
+            return parse_multiple_numbers(page_content, url)
         except Exception as e:
             print(f"Error parsing multiple numbers website: {e}")
         return None, None
@@ -160,59 +186,14 @@ async def parse_website_content(url, website_type):
     if website_type == "single":
         # Parse for single number website
         try:
-            soup = BeautifulSoup(page_content, "lxml")
-            latest_title_a = soup.select_one(".latest-added__title a")
-            flag_url = None
-            # First, try to find a .png flag with alt containing 'country flag'
-            images = soup.find_all("img")
-            for img in images:
-                alt = img.get("alt", "")
-                src = img.get("data-lazy-src") or img.get("src") or ""
-                if "country flag" in alt.lower() and src.endswith(".png"):
-                    flag_url = src
-                    break
-            # If not found, fallback to the 18th <img> with .png extension
-            if not flag_url and len(images) > 18:
-                img = images[18]
-                src = img.get("data-lazy-src") or img.get("src") or ""
-                if src.endswith(".png"):
-                    flag_url = src
-            # If still not found, fallback to any .png image
-            if not flag_url:
-                for img in images:
-                    src = img.get("data-lazy-src") or img.get("src") or ""
-                    if src.endswith(".png"):
-                        flag_url = src
-                        break
-            if latest_title_a:
-                number = latest_title_a.get_text(strip=True)
-                # print(f"[DEBUG] parse_website_content - extracted number for single: {number}")
-                # print(f"[DEBUG] parse_website_content - extracted flag_url for single: {flag_url}")
-                return number, flag_url
-            else:
-                # print(f"[DEBUG] parse_website_content - no .latest-added__title a found for single")
-                pass
-                return None, None
+            return parse_single_number(page_content)
         except Exception as e:
             print(f"Error parsing single number website: {e}")
             return None, None
     else:
         # Parse for multiple numbers website
         try:
-            soup = BeautifulSoup(page_content, 'html.parser')
-            all_numbers = [button.text.strip() for button in soup.select('.numbutton')]
-            images = soup.select('img')
-            flag_url = None
-            if len(images) > 1:
-                flag_img = images[1]
-                flag_url = flag_img.get('data-lazy-src') or flag_img.get('src')
-                if flag_url and not flag_url.startswith(('http://', 'https://')):
-                    base_url = url.rsplit('/', 2)[0]
-                    flag_url = f"{base_url}{flag_url}"
-            if all_numbers:
-                # print(f"[DEBUG] parse_website_content - extracted numbers for multiple: {all_numbers}")
-                # print(f"[DEBUG] parse_website_content - extracted flag_url for multiple: {flag_url}")
-                return all_numbers, flag_url
+            return parse_multiple_numbers(page_content, url)
         except Exception as e:
             print(f"Error parsing multiple numbers website: {e}")
             return None, None
@@ -233,46 +214,33 @@ async def delete_message_after_delay(bot, message, delay_seconds):
     """Delete a message after a specified delay"""
     try:
         await asyncio.sleep(delay_seconds)
-        await bot.delete_message(chat_id=message.chat.id, message_id=message.message_id)
+        await send_outbound(PRIORITY_COSMETIC, message.chat.id,
+                            lambda: bot.delete_message(chat_id=message.chat.id, message_id=message.message_id))
     except Exception as e:
         print(f"Error deleting message: {e}")
 
+@lru_cache(maxsize=4096)
 def format_phone_number(number, remove_code=False):
+    """
+    Split the country calling code off a number: '+49 15112345678', or just the national part with
+    remove_code. The code is the longest match in the E.164 dial code trie; results are memoized.
+    """
     # Convert to string if it's an integer
     if isinstance(number, int):
         number_str = str(number)
     else:
         # Remove + if present
         number_str = number.lstrip('+')
-    
-    # Common country code lengths
-    country_codes = {
-        '1': 1,    # USA, Canada
-        '44': 2,   # UK
-        '46': 2,   # Sweden
-        '43': 2,   # Austria
-        '358': 3,  # Finland
-        '386': 3,  # Slovenia
-        # Add more as needed
-    }
-    
-    # Try to determine the country code
-    country_code_length = None
-    
-    # Check if the number starts with any known country code
-    for code, length in country_codes.items():
-        if number_str.startswith(code):
-            country_code_length = length
-            break
-    
+
+    country_code, _ = match_dial_code(number_str)
+
     # If we couldn't determine the country code
-    if country_code_length is None:
+    if country_code is None:
         return number_str if remove_code else f"+{number_str}"
-    
+
     # Split the number
-    country_code = number_str[:country_code_length]
-    rest_of_number = number_str[country_code_length:]
-    
+    rest_of_number = number_str[len(country_code):]
+
     # Return based on the remove_code flag
     if remove_code:
         return rest_of_number
@@ -0,0 +1,89 @@
+import asyncio
+import secrets
+from aiohttp import web
+from aiogram.types import Update
+from bot.config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_MAX_CONCURRENCY
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+
+class WebhookHandler:
+    """
+    Receives updates posted by Telegram and feeds them to the dispatcher in the background.
+
+    The request is answered as soon as the update is accepted, so Telegram does not hold the next one
+    back while a handler runs. At most max_concurrency updates are processed at once; past that the
+    request waits for a free slot, which makes Telegram slow down instead of the bot queueing without bound.
+    """
+
+    def __init__(self, bot, dp, secret, max_concurrency=WEBHOOK_MAX_CONCURRENCY):
+        self.bot = bot
+        self.dp = dp
+        self.secret = secret
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tasks = set()
+
+    async def handle(self, request):
+        if not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            print(f"Rejected malformed webhook update: {e}")
+            return web.Response(status=400)
+
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            print(f"Error processing update {update.update_id}: {e}")
+        finally:
+            self._slots.release()
+
+    async def drain(self):
+        """Wait for the updates still being processed"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+# Key of the app's WebhookHandler, for modules that serve other routes from the same app
+WEBHOOK_HANDLER = web.AppKey("webhook_handler", WebhookHandler)
+
+
+async def health(request):
+    return web.Response(text="ok")
+
+
+def create_webhook_app(bot, dp, secret=None):
+    """Web app serving the webhook at WEBHOOK_PATH; other modules may add admin routes to it"""
+    app = web.Application()
+    handler = WebhookHandler(bot, dp, secret or WEBHOOK_SECRET or secrets.token_urlsafe(32))
+    app[WEBHOOK_HANDLER] = handler
+    app.router.add_post(WEBHOOK_PATH, handler.handle)
+    app.router.add_get("/healthz", health)
+    app.on_shutdown.append(lambda app: handler.drain())
+    return app
+
+
+async def start_webhook(bot, dp, app=None, host=WEBHOOK_HOST, port=WEBHOOK_PORT, url=WEBHOOK_URL):
+    """
+    Serve the web app and point Telegram at it. Returns the runner; call runner.cleanup() to stop.
+    """
+    app = app or create_webhook_app(bot, dp)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    await bot.set_webhook(
+        url=f"{url.rstrip('/')}{WEBHOOK_PATH}",
+        secret_token=app[WEBHOOK_HANDLER].secret,
+        allowed_updates=ALLOWED_UPDATES)
+    print(f"Receiving updates by webhook on {host}:{port}{WEBHOOK_PATH}")
+    return runner
@@ -1,9 +1,13 @@
 import asyncio
-from bot.imports import Bot, Dispatcher, TELEGRAM_BOT_TOKEN, DefaultBotProperties, WebsiteMonitor, storage, load_website_configs, ENABLE_REPEAT_NOTIFICATION, DEFAULT_REPEAT_INTERVAL, register_handlers, send_startup_message, monitor_websites, send_notification
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from bot.imports import Bot, Dispatcher, TELEGRAM_BOT_TOKEN, DefaultBotProperties, WebsiteMonitor, storage, load_website_configs, register_handlers, send_startup_message, monitor_websites, queue_notification, site_registry, WEBHOOK_URL, TELEGRAM_API_URL, start_webhook, ALLOWED_UPDATES, METRICS_HOST, METRICS_PORT, count_api_calls, start_metrics_server
 
 async def main():
-    # Initialize bot with minimal memory footprint
-    bot = Bot(token=TELEGRAM_BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+    # Initialize bot with minimal memory footprint, talking to a custom Bot API server if configured
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+    bot = Bot(token=TELEGRAM_BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode="HTML"))
+    bot.session.middleware(count_api_calls)
     dp = Dispatcher()
 
     # Register handlers
@@ -14,32 +18,48 @@ async def main():
     for site_id, config in website_configs.items():
         if config["enabled"] and config["url"]:
             storage["websites"][site_id] = WebsiteMonitor(site_id, config)
-
-    # Initialize repeat interval if enabled
-    if ENABLE_REPEAT_NOTIFICATION and storage["repeat_interval"] is None:
-        storage["repeat_interval"] = DEFAULT_REPEAT_INTERVAL
+    site_registry.rebuild()
 
     print("✅ Bot is live in optimized mode! I am now online 🌐")
 
-    # Start the bot
-    dp_task = asyncio.create_task(dp.start_polling(bot, allowed_updates=["message", "callback_query"]))
+    webhook_runner = metrics_runner = None
+    try:
+        # Start the bot: by webhook if a public URL is configured, otherwise by long polling
+        if WEBHOOK_URL:
+            webhook_runner = await start_webhook(bot, dp)
+            dp_task = asyncio.create_task(asyncio.Event().wait())  # The web app serves updates until shutdown
+        else:
+            try:
+                # A webhook left over from an earlier run would make getUpdates fail
+                await bot.delete_webhook()
+            except Exception as e:
+                print(f"⚠️ Failed to delete webhook: {e}")
+            dp_task = asyncio.create_task(dp.start_polling(bot, allowed_updates=ALLOWED_UPDATES))
+
+        if METRICS_PORT:
+            metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
 
-    # Send startup message
-    await send_startup_message(bot)
+        # Send startup message
+        await send_startup_message(bot)
 
-    # Start monitoring for new numbers across all websites
-    # The monitor_websites function will handle first run detection and initialization
-    monitor_task = asyncio.create_task(monitor_websites(bot, lambda data: send_notification(bot, data)))
+        # Start monitoring for new numbers across all websites
+        # The monitor_websites function will handle first run detection and initialization
+        monitor_task = asyncio.create_task(monitor_websites(bot, lambda data: queue_notification(bot, data)))
 
-    # Log status
-    enabled_sites = [f"{site_id} ({website.url})" for site_id, website in storage["websites"].items() if website.enabled]
-    print(f"Monitoring {len(enabled_sites)} websites:")
-    for site in enabled_sites:
-        print(f"  - {site}")
-    print(f"Repeat notification status: {'Enabled' if ENABLE_REPEAT_NOTIFICATION else 'Disabled'}")
+        # Log status
+        enabled_sites = [f"{site_id} ({website.url})" for site_id, website in storage["websites"].items() if website.enabled]
+        print(f"Monitoring {len(enabled_sites)} websites:")
+        for site in enabled_sites:
+            print(f"  - {site}")
 
-    # Wait for both tasks to complete (they should run indefinitely)
-    await asyncio.gather(dp_task, monitor_task)
+        # Wait for both tasks to complete (they should run indefinitely)
+        await asyncio.gather(dp_task, monitor_task)
+    finally:
+        # Stop listening and release the port, also when the bot is cancelled or crashes
+        if webhook_runner:
+            await webhook_runner.cleanup()
+        if metrics_runner:
+            await metrics_runner.cleanup()
 
 if __name__ == "__main__":
     asyncio.run(main())
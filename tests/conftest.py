@@ -0,0 +1,15 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path, monkeypatch):
+    """Run every test in its own directory, so the state file the bot writes starts out empty"""
+    from bot.storage import storage
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(storage, "websites", {})
+    monkeypatch.setitem(storage, "sections", {})
+    return tmp_path
@@ -0,0 +1,63 @@
+import itertools
+import socket
+from aiohttp import web
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeBotAPI:
+    """
+    Local stand-in for the Telegram Bot API server, for end-to-end tests.
+
+    Point a bot at it with AiohttpSession(api=TelegramAPIServer.from_base(fake.url)). Every request
+    is recorded in calls as (method, params); sendMessage and sendPhoto answer with a message, other
+    methods with True.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._message_ids = itertools.count(1)
+        self._runner = None
+
+    def methods(self):
+        return [method for method, params in self.calls]
+
+    def _message(self, params, **fields):
+        chat_id = int(params.get("chat_id", 0))
+        return {"message_id": next(self._message_ids), "date": 0, "chat": {"id": chat_id, "type": "private"}, **fields}
+
+    async def _handle(self, request):
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        self.calls.append((method, params))
+
+        if method == "getMe":
+            result = {"id": 123, "is_bot": True, "first_name": "Fake"}
+        elif method == "sendMessage":
+            result = self._message(params, text=params.get("text"))
+        elif method == "sendPhoto":
+            result = self._message(params, photo=[{"file_id": "FILE", "file_unique_id": "F", "width": 1, "height": 1}])
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
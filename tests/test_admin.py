@@ -0,0 +1,24 @@
+import types
+import pytest
+import bot.handlers as handlers
+
+
+def message(chat_id, user_id):
+    return types.SimpleNamespace(chat=types.SimpleNamespace(id=chat_id), from_user=types.SimpleNamespace(id=user_id))
+
+
+@pytest.fixture(autouse=True)
+def admins(monkeypatch):
+    monkeypatch.setattr(handlers, "CHAT_ID", "-100500")
+    monkeypatch.setattr(handlers, "ADMIN_IDS", {"42"})
+
+
+def test_configured_chat_and_admins_are_allowed():
+    assert handlers.is_admin(message(-100500, 7))
+    assert handlers.is_admin(message(42, 42))
+    assert handlers.is_admin(message(-100777, 42))
+
+
+def test_strangers_are_refused():
+    assert not handlers.is_admin(message(7, 7))
+    assert not handlers.is_admin(message(-100777, 7))
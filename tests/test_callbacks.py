@@ -0,0 +1,96 @@
+import asyncio
+import types
+import pytest
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from bot.storage import storage
+from bot.monitoring import WebsiteMonitor
+from bot.callbacks import ACTIONS, CallbackRouter, pack_callback, parse_callback
+
+
+@pytest.fixture
+def sites(monkeypatch):
+    def configure(count):
+        monkeypatch.setitem(storage, "websites", {
+            f"site_{n}": WebsiteMonitor(f"site_{n}", {"url": f"https://example{n}.com/x", "enabled": True, "position": n})
+            for n in range(1, count + 1)
+        })
+    return configure
+
+
+def test_pack_uses_short_site_ids_and_drops_empty_trailing_fields(sites):
+    sites(3)
+    assert pack_callback("update", "4915123", "site_2") == "v1:up:4915123:2"
+    assert pack_callback("monitoring", "site_3", 0, None) == "v1:mo:3:0"
+    with pytest.raises(ValueError):
+        pack_callback("back", "site_1", "extra")
+
+
+@pytest.mark.parametrize("action", list(ACTIONS))
+def test_every_action_round_trips(sites, action):
+    sites(3)
+    values = {"number": "4915123", "site_id": "site_2", "origin": "site_3", "page": "1", "prefix": "ab"}
+    fields = {name: values[name] for name in ACTIONS[action][1]}
+    data = pack_callback(action, *fields.values())
+    assert len(data.encode()) <= 64
+    assert parse_callback(data) == (action, fields)
+
+
+def test_parse_fills_missing_trailing_fields_and_rejects_unknown_payloads(sites):
+    sites(1)
+    assert parse_callback("v1:ts:1") == ("toggle_site", {"site_id": "site_1", "page": None, "prefix": None, "origin": None})
+    assert parse_callback("v1:zz:1") is None
+    assert parse_callback("v1:bk:1:2") is None
+    assert parse_callback("none") is None
+    assert parse_callback("") is None
+
+
+@pytest.mark.parametrize("data, expected", [
+    ("update_4915123_site_2", ("update", {"number": "4915123", "site_id": "site_2"})),
+    ("update_multi_site_2", ("update_multi", {"site_id": "site_2"})),
+    ("settings_site_2", ("settings", {"site_id": "site_2"})),
+    ("settings_monitoring_site_2", ("monitoring", {"site_id": "site_2", "page": None, "prefix": None})),
+    ("back_to_main_site_2", ("back", {"site_id": "site_2"})),
+    ("toggle_repeat_site_2", ("toggle_repeat", {"site_id": "site_2"})),
+    ("number_+4915123_site_2", ("split", {"number": "+4915123", "site_id": "site_2"})),
+])
+def test_parses_legacy_payloads(sites, data, expected):
+    sites(2)
+    assert parse_callback(data) == expected
+
+
+def test_legacy_payloads_without_a_site_assume_one_only_when_there_is_one(sites):
+    sites(2)
+    assert parse_callback("copy_number") == ("copy", {"number": None, "site_id": None})
+    assert parse_callback("split_4915123") == ("split", {"number": "4915123", "site_id": None})
+    sites(1)
+    assert parse_callback("copy_number") == ("copy", {"number": None, "site_id": "site_1"})
+
+
+def dispatch(router, data, keyboard=None):
+    answers = []
+
+    async def answer(text=None):
+        answers.append(text)
+
+    markup = InlineKeyboardMarkup(inline_keyboard=keyboard) if keyboard else None
+    callback_query = types.SimpleNamespace(data=data, message=types.SimpleNamespace(reply_markup=markup), answer=answer)
+    asyncio.run(router.dispatch(callback_query))
+    return answers
+
+
+def test_dispatch_takes_a_legacy_copy_buttons_site_from_the_update_button(sites):
+    sites(2)
+    calls = []
+
+    async def copy(callback_query, number, site_id):
+        calls.append((number, site_id))
+
+    router = CallbackRouter()
+    router.register("copy", copy)
+    keyboard = [[InlineKeyboardButton(text="Copy", callback_data="copy_number"),
+                 InlineKeyboardButton(text="Update", callback_data="update_4915123_site_2")]]
+    assert dispatch(router, "copy_number", keyboard) == []
+    assert calls == [(None, "site_2")]
+
+    assert dispatch(router, "copy_number") == ["Site ID missing or invalid. Please try again."]
+    assert calls == [(None, "site_2")]
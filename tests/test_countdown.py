@@ -0,0 +1,42 @@
+import asyncio
+import time
+from bot.countdown import CountdownTicker
+from bot.outbound import render_cache
+
+
+class FakeBot:
+    def __init__(self):
+        self.captions = []
+
+    async def edit_message_caption(self, chat_id, message_id, caption, reply_markup=None, **kwargs):
+        self.captions.append(caption)
+
+
+def test_redraw_shows_the_countdown_again_after_another_edit():
+    async def run():
+        bot = FakeBot()
+        ticker = CountdownTicker(edits_per_minute=600)
+        ticker.add(bot, "site_1", 42, 7, time.time(), 900, lambda left: f"next in {left}", lambda: None)
+        await asyncio.sleep(0.1)
+        assert bot.captions == ["next in 900"]
+
+        # An animation frame replaced the keyboard; without a redraw the countdown would only come
+        # back when its displayed value next changes
+        render_cache.remember(42, 7, reply_markup="frame")
+        assert ticker.redraw("site_1", 42)
+        await asyncio.sleep(0.1)
+        assert not ticker.redraw("site_1", 77)
+        ticker.cancel_all()
+        return bot.captions
+
+    assert asyncio.run(run()) == ["next in 900"] * 2
+
+
+def test_switching_repeat_off_forgets_the_countdowns(monkeypatch):
+    from bot.storage import storage
+    from bot.state_actor import apply_state
+    from bot.handlers import _toggle_repeat
+    monkeypatch.setitem(storage, "repeat_enabled", True)
+    monkeypatch.setitem(storage, "countdowns", {"site_1": {"42": {"message_id": 7}}})
+    assert asyncio.run(apply_state(_toggle_repeat)) is False
+    assert storage["countdowns"] == {}
@@ -0,0 +1,29 @@
+import pytest
+from bot.dial_codes import DIAL_CODES, match_dial_code, country_for_number
+
+
+@pytest.mark.parametrize("number, expected", [
+    ("+4915123456789", ("49", "de")),
+    ("4915123456789", ("49", "de")),
+    (" +447700900123 ", ("44", "gb")),
+    (380501234567, ("380", "ua")),
+    ("+35312345678", ("353", "ie")),
+    ("+12125550123", ("1", "us")),
+    ("+14165550123", ("1", "ca")),
+    ("+18765550123", ("1", "jm")),
+    ("+74951234567", ("7", "ru")),
+    ("+77011234567", ("7", "kz")),
+])
+def test_longest_prefix_wins(number, expected):
+    assert match_dial_code(number) == expected
+
+
+@pytest.mark.parametrize("number", ["", "+", "0123456", "+999", "abc"])
+def test_unknown_numbers_match_nothing(number):
+    assert match_dial_code(number) == (None, None)
+    assert country_for_number(number) is None
+
+
+def test_every_table_entry_resolves_to_its_country():
+    for prefix, country in DIAL_CODES.items():
+        assert country_for_number(prefix + "0000000") == country, prefix
@@ -0,0 +1,74 @@
+import asyncio
+import pytest
+from aiohttp import web
+import bot.flags as flags
+from bot.utils import parse_single_number, parse_multiple_numbers
+from fake_bot_api import free_port
+
+SINGLE_PAGE = """<div class="latest-added__title"><a>+4915123456789</a></div>
+<img src="https://cdn.example/logo.png"><img alt="Germany country flag" src="https://cdn.example/de.png">"""
+UNLABELLED_PAGE = """<div class="latest-added__title"><a>+4915123456789</a></div><img src="https://cdn.example/banner.png">"""
+MULTIPLE_PAGE = """<img src="/logo.png"><img src="/flag.png"><button class="numbutton">+4915123456789</button>"""
+
+
+@pytest.fixture(autouse=True)
+def flag_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(flags, "FLAG_ASSET_DIR", str(tmp_path / "assets"))
+    monkeypatch.setattr(flags, "FLAG_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(flags, "_flag_assets", None)
+    monkeypatch.setattr(flags, "_learned_flag_urls", {})
+
+
+def test_flag_emoji():
+    assert flags.flag_emoji("+4915123456789") == "🇩🇪"
+    assert flags.flag_emoji("+14165550123") == "🇨🇦"
+    assert flags.flag_emoji("+999") == ""
+
+
+def test_only_labelled_flags_are_learned():
+    assert parse_single_number(UNLABELLED_PAGE) == ("+4915123456789", "https://cdn.example/banner.png")
+    assert flags.local_flag_for_number("+4915000") is None
+    assert parse_multiple_numbers(MULTIPLE_PAGE, "https://numbers.example/list/de") == (["+4915123456789"], "https://numbers.example/flag.png")
+    assert flags.local_flag_for_number("+4915000") is None
+
+    assert parse_single_number(SINGLE_PAGE) == ("+4915123456789", "https://cdn.example/de.png")
+    assert flags.local_flag_for_number("+4915000") == "https://cdn.example/de.png"
+
+
+def test_bundled_flags_win_over_cached_ones(tmp_path):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "cache").mkdir()
+    (tmp_path / "assets" / "de.png").write_bytes(b"bundled")
+    (tmp_path / "cache" / "de.png").write_bytes(b"cached")
+    (tmp_path / "cache" / "fr.png").write_bytes(b"cached")
+    assert flags.local_flag_for_number("+4915000") == str(tmp_path / "assets" / "de.png")
+    assert flags.local_flag_for_number("+3361000") == str(tmp_path / "cache" / "fr.png")
+
+
+def test_downloads_are_cached_outside_the_assets_and_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(flags, "FLAG_MAX_BYTES", 1000)
+
+    def image(size):
+        async def handle(request):
+            return web.Response(body=b"x" * size, content_type="image/png")
+        return handle
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/small.png", image(100))
+        app.router.add_get("/big.png", image(5000))
+        runner = web.AppRunner(app)
+        await runner.setup()
+        port = free_port()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        try:
+            await flags._save_flag_asset("fr", f"http://127.0.0.1:{port}/big.png", ".png")
+            await flags._save_flag_asset("de", f"http://127.0.0.1:{port}/small.png", ".png")
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+    assert not (tmp_path / "cache" / "fr.png").exists()
+    assert (tmp_path / "cache" / "de.png").read_bytes() == b"x" * 100
+    assert not (tmp_path / "assets").exists()
+    assert flags.local_flag_for_number("+4915000") == str(tmp_path / "cache" / "de.png")
@@ -0,0 +1,52 @@
+import asyncio
+from bot.storage import storage
+from bot.monitoring import WebsiteMonitor
+from bot.state_actor import apply_state
+from bot.notifications import KeyboardCache, keyboard_cache, create_unified_keyboard
+
+
+def test_hits_return_the_built_keyboard_without_rebuilding():
+    cache = KeyboardCache()
+    builds = []
+    build = lambda: builds.append(1) or object()
+    keyboard = cache.get_or_build(("site_1", "single"), build)
+    assert cache.get_or_build(("site_1", "single"), build) is keyboard
+    assert len(builds) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = KeyboardCache(max_entries=2)
+    cache.get_or_build(("site_1",), lambda: "a")
+    cache.get_or_build(("site_2",), lambda: "b")
+    cache.get_or_build(("site_1",), lambda: "a2")
+    cache.get_or_build(("site_3",), lambda: "c")
+    assert cache.get_or_build(("site_1",), lambda: "a3") == "a"
+    assert cache.get_or_build(("site_2",), lambda: "b2") == "b2"
+
+
+def test_invalidate_drops_only_the_given_site():
+    cache = KeyboardCache()
+    cache.get_or_build(("site_1", "x"), lambda: "a")
+    cache.get_or_build(("site_1", "y"), lambda: "b")
+    cache.get_or_build(("site_2", "x"), lambda: "c")
+    cache.invalidate("site_1")
+    assert cache.get_or_build(("site_1", "x"), lambda: "a2") == "a2"
+    assert cache.get_or_build(("site_2", "x"), lambda: "c2") == "c"
+
+
+def test_keyboards_differ_by_state_and_are_shared_otherwise():
+    data = {"site_id": "site_1", "type": "single", "number": "4915123", "url": "https://example.com"}
+    keyboard = create_unified_keyboard(data)
+    assert create_unified_keyboard(dict(data)) is keyboard
+    assert create_unified_keyboard(dict(data, updated=True)) is not keyboard
+    assert create_unified_keyboard(dict(data, number="4915124")) is not keyboard
+
+
+def test_state_changes_invalidate_the_site(monkeypatch):
+    monkeypatch.setitem(storage, "websites", {"site_1": WebsiteMonitor("site_1", {"url": "https://example.com", "enabled": True})})
+    data = {"site_id": "site_1", "type": "multiple", "numbers": ["+1", "+2"], "url": "https://example.com"}
+    keyboard = create_unified_keyboard(data)
+    asyncio.run(apply_state(lambda: None, site_id="site_1"))
+    assert create_unified_keyboard(data) is not keyboard
+    keyboard_cache.invalidate("site_1")
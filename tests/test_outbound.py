@@ -0,0 +1,42 @@
+import asyncio
+from bot.outbound import OutboundQueue, PRIORITY_INTERACTIVE, PRIORITY_COSMETIC
+
+
+def test_cancelled_requests_are_not_executed():
+    async def run():
+        queue = OutboundQueue(global_rate=1)
+        executed = []
+
+        def call(name):
+            async def execute():
+                executed.append(name)
+                return name
+            return execute
+
+        first = asyncio.create_task(queue.submit(PRIORITY_INTERACTIVE, 1, call("first")))
+        stale = asyncio.create_task(queue.submit(PRIORITY_COSMETIC, 1, call("stale frame")))
+        assert await first == "first"
+        stale.cancel()
+        # The next global token is a second away; the cancelled frame must not use it
+        await asyncio.sleep(1.2)
+        assert await queue.submit(PRIORITY_COSMETIC, 1, call("menu")) == "menu"
+        assert executed == ["first", "menu"]
+        assert queue.metrics()["depth"] == {"alert": 0, "interactive": 0, "cosmetic": 0}
+
+    asyncio.run(run())
+
+
+def test_private_chats_get_the_private_rate():
+    queue = OutboundQueue(chat_rate=20, chat_burst=5, private_chat_rate=60, private_chat_burst=10)
+    assert (queue._chat_bucket("42").rate, queue._chat_bucket("42").capacity) == (1, 10)
+    assert (queue._chat_bucket("-100123").rate, queue._chat_bucket("-100123").capacity) == (20 / 60, 5)
+
+
+def test_idle_chat_buckets_are_evicted():
+    queue = OutboundQueue()
+    busy = queue._chat_bucket("-1")
+    busy.consume(busy.updated)
+    for chat_id in range(2, 200):
+        queue._chat_bucket(str(chat_id))
+    assert len(queue._chats) < 100
+    assert queue._chats["-1"] is busy
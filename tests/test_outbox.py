@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+import bot.outbox as outbox_module
+from bot.outbox import Outbox, OUTBOX_SECTION, notification_key
+from bot.storage import get_state_section
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(outbox_module.time, "time", lambda: now[0])
+    monkeypatch.setattr(outbox_module, "OUTBOX_BASE_BACKOFF", 5)
+    monkeypatch.setattr(outbox_module, "OUTBOX_MAX_BACKOFF", 30)
+    monkeypatch.setattr(outbox_module, "OUTBOX_MAX_ATTEMPTS", 4)
+    return now
+
+
+def test_notification_key():
+    assert notification_key({"site_id": "site_1", "number": 4915123}) == "site_1:4915123"
+    assert notification_key({"site_id": "site_2", "numbers": ["+1", "+2"]}) == "site_2:+1,+2"
+
+
+def test_failed_entries_back_off_exponentially_up_to_the_cap(clock):
+    box = Outbox()
+    assert box.queue({"site_id": "site_1", "number": 1})
+    entry = box.due()[0]
+    delays = []
+    for _ in range(3):
+        asyncio.run(box.finish([], [entry]))
+        delays.append(entry["next_attempt"] - clock[0])
+        assert box.due() == []
+        clock[0] = entry["next_attempt"]
+        assert box.due() == [entry]
+    assert delays == [5, 10, 20]
+
+    # The fourth failure reaches OUTBOX_MAX_ATTEMPTS: parked instead of retried
+    asyncio.run(box.finish([], [entry]))
+    assert len(box) == 0
+    assert box.next_attempt() is None
+    assert box.dead_letters == [entry]
+
+
+def test_backoff_is_capped(clock, monkeypatch):
+    monkeypatch.setattr(outbox_module, "OUTBOX_MAX_ATTEMPTS", 10)
+    box = Outbox()
+    box.queue({"site_id": "site_1", "number": 1})
+    entry = box.due()[0]
+    for _ in range(6):
+        asyncio.run(box.finish([], [entry]))
+    assert entry["next_attempt"] - clock[0] == 30
+
+
+def test_same_announcement_is_not_queued_twice(clock):
+    box = Outbox()
+    data = {"site_id": "site_1", "number": 1}
+    assert box.queue(data)
+    assert not box.queue(data)
+    asyncio.run(box.finish(box.due(), []))
+    assert len(box) == 0
+    # The delivered announcement queued again, e.g. by a retried handler
+    assert not box.queue(dict(data))
+
+
+def test_same_numbers_detected_again_later_are_a_new_announcement(clock):
+    box = Outbox()
+    box.queue({"site_id": "site_1", "number": 1})
+    asyncio.run(box.finish(box.due(), []))
+    clock[0] += 60
+    assert box.queue({"site_id": "site_1", "number": 1})
+
+
+def test_newer_notification_replaces_a_sites_undelivered_one(clock):
+    box = Outbox()
+    box.queue({"site_id": "site_1", "number": 1})
+    box.queue({"site_id": "site_2", "number": 1})
+    box.queue({"site_id": "site_1", "number": 2})
+    assert list(box.entries) == ["site_2:1", "site_1:2"]
+
+
+def test_add_persists_and_restore_reloads(clock):
+    box = Outbox()
+    assert asyncio.run(box.add({"site_id": "site_1", "number": 1}))
+    assert not asyncio.run(box.add({"site_id": "site_1", "number": 1}))
+    assert [entry["key"] for entry in get_state_section(OUTBOX_SECTION)["entries"]] == ["site_1:1"]
+
+    restored = Outbox()
+    restored.restore()
+    assert list(restored.entries) == ["site_1:1"]
+
+
+def test_unexpected_send_errors_are_retried(monkeypatch):
+    import types
+    import bot.notifications as notifications
+    from bot.storage import storage
+    # A website missing its type makes send_site_notification fail outside its send
+    monkeypatch.setitem(storage, "websites", {"site_1": types.SimpleNamespace(site_id="site_1")})
+    monkeypatch.setattr(notifications.subscriptions, "subscribers", lambda site_id: ["-100500"])
+    data = {"site_id": "site_1", "number": "4915123"}
+    assert asyncio.run(notifications.send_notification(None, data)) is False
+    assert "delivered_chats" not in data
@@ -0,0 +1,46 @@
+from bot.monitoring import RecentNumbers
+
+
+def test_sync_pushes_numbers_added_at_the_top():
+    recent = RecentNumbers(depth=4, numbers=["+3", "+2", "+1"])
+    recent.sync(["+5", "+4", "+3", "+2", "+1"])
+    assert recent.to_list() == ["+5", "+4", "+3", "+2"]
+
+
+def test_sync_without_changes_keeps_the_buffer():
+    recent = RecentNumbers(depth=3, numbers=["+3", "+2", "+1"])
+    recent.sync(["+3", "+2", "+1", "+0"])
+    assert recent.to_list() == ["+3", "+2", "+1"]
+
+
+def test_sync_drops_numbers_the_origin_removed_from_the_bottom():
+    recent = RecentNumbers(depth=4, numbers=["+3", "+2", "+1"])
+    recent.sync(["+4", "+3"])
+    assert recent.to_list() == ["+4", "+3"]
+
+
+def test_sync_replaces_a_reordered_listing():
+    recent = RecentNumbers(depth=4, numbers=["+3", "+2", "+1"])
+    recent.sync(["+2", "+3", "+1"])
+    assert recent.to_list() == ["+2", "+3", "+1"]
+
+
+def test_sync_replaces_a_listing_without_the_newest_number():
+    recent = RecentNumbers(depth=4, numbers=["+3", "+2", "+1"])
+    recent.sync(["+9", "+8"])
+    assert recent.to_list() == ["+9", "+8"]
+
+
+def test_sync_keeps_at_most_depth_numbers():
+    recent = RecentNumbers(depth=2)
+    recent.sync(str(n) for n in range(10))
+    assert recent.to_list() == ["0", "1"]
+    recent.sync([])
+    assert len(recent) == 0
+
+
+def test_compares_equal_to_lists():
+    recent = RecentNumbers(depth=3, numbers=["+2", "+1"])
+    assert recent == ["+2", "+1"]
+    assert recent == RecentNumbers(depth=5, numbers=["+2", "+1"])
+    assert recent != ["+1", "+2"]
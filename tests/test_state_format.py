@@ -0,0 +1,109 @@
+import json
+import struct
+import pytest
+import asyncio
+import bot.storage
+from bot.state_format import (StateFile, StateFormatError, encode_value, write_state_file, update_state_file,
+                              migrate_json_state, MAGIC, VERSION)
+from bot.storage import storage, _open_state_file, get_state_section
+from bot.state_actor import save_state_section
+
+RECORDS = {
+    "site_1": {"url": "https://example.com", "last_number": 4915123, "latest_numbers": ["+1", "+2"]},
+    "site_2": {"url": "https://example.org/ü", "enabled": False},
+    "_runtime": {"repeat_enabled": True, "countdowns": {}}
+}
+
+
+def test_round_trip():
+    write_state_file("state.bin", RECORDS)
+    with StateFile("state.bin") as state:
+        assert state.version == VERSION
+        assert list(state.keys()) == list(RECORDS)
+        assert state.get("site_2") == RECORDS["site_2"]
+        assert state.get("missing", "default") == "default"
+        assert state.to_dict() == RECORDS
+
+
+def test_empty_file_round_trip():
+    write_state_file("state.bin", {})
+    with StateFile("state.bin") as state:
+        assert len(state) == 0
+        assert state.to_dict() == {}
+
+
+def test_update_replaces_and_removes_records_and_copies_the_rest():
+    write_state_file("state.bin", RECORDS)
+    update_state_file("state.bin", {"site_1": {"url": "new"}, "site_2": None, "site_3": [1, 2]})
+    with StateFile("state.bin") as state:
+        assert state.to_dict() == {"_runtime": RECORDS["_runtime"], "site_1": {"url": "new"}, "site_3": [1, 2]}
+
+
+def test_update_with_encoded_records():
+    write_state_file("state.bin", RECORDS)
+    update_state_file("state.bin", {"site_1": encode_value({"url": "new"})}, encoded=True)
+    with StateFile("state.bin") as state:
+        assert state.get("site_1") == {"url": "new"}
+        assert state.get("site_2") == RECORDS["site_2"]
+
+
+def test_sections_saved_together_share_one_write(monkeypatch):
+    writes = []
+    write = bot.storage._update_state_file
+    monkeypatch.setattr(bot.storage, "_update_state_file", lambda path, records: (writes.append(sorted(records)), write(path, records)))
+
+    async def save():
+        save_state_section("a", lambda: 1)
+        save_state_section("b", lambda: {"x": 2})
+        await save_state_section("a", lambda: 3)
+
+    asyncio.run(save())
+    assert writes == [["_a", "_b"]]
+    assert get_state_section("a") == 3
+    with StateFile(storage["file"]) as state:
+        assert state.to_dict() == {"_a": 3, "_b": {"x": 2}}
+
+
+def test_keys_with_newlines_are_rejected():
+    with pytest.raises(ValueError):
+        write_state_file("state.bin", {"bad\nkey": 1})
+
+
+def test_migrates_legacy_json_and_keeps_a_backup(tmp_path):
+    with open("legacy.json", "w") as f:
+        json.dump(RECORDS, f)
+    assert migrate_json_state("legacy.json", "state.bin") == RECORDS
+    assert not (tmp_path / "legacy.json").exists()
+    assert json.loads((tmp_path / "legacy.json.bak").read_text()) == RECORDS
+    with StateFile("state.bin") as state:
+        assert state.to_dict() == RECORDS
+
+
+def test_storage_migrates_the_legacy_file_on_first_open(tmp_path, monkeypatch):
+    monkeypatch.setitem(storage, "file", "website_data.bin")
+    monkeypatch.setitem(storage, "legacy_file", "website_data.json")
+    (tmp_path / "website_data.json").write_text(json.dumps(RECORDS))
+    state = _open_state_file()
+    try:
+        assert state.to_dict() == RECORDS
+    finally:
+        state.close()
+    assert (tmp_path / "website_data.json.bak").exists()
+
+
+@pytest.mark.parametrize("content, message", [
+    (b"TB", "too short"),
+    (b"JSON" + b"\0" * 20, "not a state file"),
+    (struct.pack("<4sHIQ", MAGIC, VERSION + 1, 0, 18), "newer"),
+    (struct.pack("<4sHIQ", MAGIC, VERSION, 1, 1000), "truncated"),
+])
+def test_corrupt_headers_raise_state_format_error(tmp_path, content, message):
+    (tmp_path / "state.bin").write_bytes(content)
+    with pytest.raises(StateFormatError, match=message):
+        StateFile("state.bin")
+
+
+def test_storage_ignores_an_unreadable_state_file(tmp_path, monkeypatch):
+    monkeypatch.setitem(storage, "file", "website_data.bin")
+    (tmp_path / "website_data.bin").write_bytes(b"JSON" + b"\0" * 20)
+    assert _open_state_file() is None
@@ -0,0 +1,103 @@
+import asyncio
+import aiohttp
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from bot.handlers import register_handlers
+from bot.metrics import start_metrics_server
+from bot.webhook import start_webhook, create_webhook_app, SECRET_HEADER, WEBHOOK_PATH
+from fake_bot_api import FakeBotAPI, free_port
+
+SECRET = "test-secret"
+
+
+def ping_update(update_id):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 42, "type": "private"},
+            "from": {"id": 42, "is_bot": False, "first_name": "Tester"},
+            "text": "/ping"
+        }
+    }
+
+
+async def wait_for(condition, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("timed out")
+        await asyncio.sleep(0.02)
+
+
+async def run_webhook(check):
+    """Serve the real handlers by webhook against a fake Bot API and run check(api, session, webhook_url)"""
+    api = await FakeBotAPI().start()
+    bot = Bot("123:ABC", session=AiohttpSession(api=TelegramAPIServer.from_base(api.url)))
+    dp = Dispatcher()
+    register_handlers(dp)
+    port = free_port()
+    runner = await start_webhook(bot, dp, create_webhook_app(bot, dp, SECRET),
+                                 host="127.0.0.1", port=port, url="https://bot.example")
+    try:
+        async with aiohttp.ClientSession() as session:
+            await check(api, session, f"http://127.0.0.1:{port}")
+    finally:
+        await runner.cleanup()
+        await bot.session.close()
+        await api.stop()
+
+
+def test_webhook_registers_and_handles_commands():
+    async def check(api, session, base):
+        params = dict(api.calls[0][1])
+        assert api.calls[0][0] == "setWebhook"
+        assert params["url"] == f"https://bot.example{WEBHOOK_PATH}"
+        assert params["secret_token"] == SECRET
+
+        async with session.post(f"{base}{WEBHOOK_PATH}", json=ping_update(1), headers={SECRET_HEADER: SECRET}) as response:
+            assert response.status == 200
+        await wait_for(lambda: "deleteMessage" in api.methods())
+        replies = [params for method, params in api.calls if method == "sendMessage"]
+        assert replies[0]["text"] == "I am now online 🌐"
+
+    asyncio.run(run_webhook(check))
+
+
+def test_webhook_rejects_bad_secret_and_malformed_updates():
+    async def check(api, session, base):
+        async with session.post(f"{base}{WEBHOOK_PATH}", json=ping_update(1), headers={SECRET_HEADER: "wrong"}) as response:
+            assert response.status == 401
+        async with session.post(f"{base}{WEBHOOK_PATH}", data="not json", headers={SECRET_HEADER: SECRET}) as response:
+            assert response.status == 400
+        await asyncio.sleep(0.1)
+        assert api.methods() == ["setWebhook"]
+
+    asyncio.run(run_webhook(check))
+
+
+def test_metrics_are_not_served_on_the_webhook_listener():
+    async def check(api, session, base):
+        async with session.get(f"{base}/healthz") as response:
+            assert await response.text() == "ok"
+        async with session.get(f"{base}/metrics") as response:
+            assert response.status == 404
+
+    asyncio.run(run_webhook(check))
+
+
+def test_metrics_server_serves_prometheus_text():
+    async def serve():
+        port = free_port()
+        runner = await start_metrics_server("127.0.0.1", port)
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                    assert response.status == 200
+                    assert "bot_outbox_dead_letters" in await response.text()
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(serve())